@@ -1,13 +1,53 @@
 import streamlit as st
+import streamlit.components.v1 as components
 import time
 import datetime
 import pandas as pd
+import numpy as np
 import folium
-from streamlit_folium import folium_static, st_folium
+from branca.element import MacroElement
+from folium.elements import JSCSSMixin
+from jinja2 import Template
+from streamlit_folium import st_folium
 import base64
+import bisect
+import collections
+import concurrent.futures
+import contextlib
+import gzip
+import hashlib
+import heapq
+import hmac
 from PIL import Image
 import io
+import asyncio
 import json
+import math
+import os
+import random
+import re
+import secrets
+import smtplib
+import sqlite3
+import tempfile
+import threading
+import urllib.error
+import urllib.request
+import uuid
+from email.message import EmailMessage
+from email.utils import make_msgid
+try:
+    import pyarrow as pa
+    import pyarrow.csv
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
 try:
     import plotly.express as px
     import plotly.graph_objects as go
@@ -501,439 +541,4423 @@ st.markdown("""
 </script>
 """, unsafe_allow_html=True)
 
-# ---- Session State Initialization (No Demo Data) ----
-if "registered_users" not in st.session_state:
-    # Initialize with only admin user (no demo users)
-    st.session_state.registered_users = {
-        "admin": {
-            "password": "admin123",
-            "name": "System Administrator",
-            "email": "admin@safetap.com",
-            "phone": "+63 900 000 0000",
-            "id": "ADMIN001",
-            "authority": "Administrator",
-            "role": "admin",
-            "created_at": datetime.datetime.now().strftime("%Y-%m-%d"),
-            "profile_pic": None,
-            "status": "active",
-            "last_login": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "current_location": None,
-            "location_history": []
+# ---- Location Track Buffer ----
+# Fixes kept in memory per user; older fixes stay in the location_history table.
+LOCATION_HISTORY_CAPACITY = int(os.environ.get("SAFETAP_LOCATION_HISTORY_CAPACITY", 1000))
+
+# Location sources are stored as small integer codes
+LOCATION_SOURCES = ["unknown", "manual", "manual_entry", "share", "save", "panic_alert", "gps"]
+LOCATION_SOURCE_CODES = {name: code for code, name in enumerate(LOCATION_SOURCES)}
+
+
+def location_source_code(source):
+    """Map a location source name to its uint8 code, registering new names"""
+    code = LOCATION_SOURCE_CODES.get(source)
+    if code is None:
+        if len(LOCATION_SOURCES) > 255:
+            return 0
+        code = len(LOCATION_SOURCES)
+        LOCATION_SOURCES.append(source)
+        LOCATION_SOURCE_CODES[source] = code
+    return code
+
+
+def timestamp_to_epoch(timestamp):
+    """Convert a "%Y-%m-%d %H:%M:%S" timestamp to epoch seconds"""
+    # fromisoformat parses this layout an order of magnitude faster than strptime
+    return int(datetime.datetime.fromisoformat(timestamp).timestamp())
+
+
+def epoch_to_timestamp(epoch):
+    """Convert epoch seconds to a "%Y-%m-%d %H:%M:%S" timestamp"""
+    return datetime.datetime.fromtimestamp(int(epoch)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+class TrackBuffer:
+    """Fixed-capacity ring buffer of location fixes stored as numpy columns.
+
+    Indexing, slicing and iteration are newest first and yield the same
+    ``{"lat", "lng", "timestamp", "source"}`` dicts the UI used before.
+    Storage grows geometrically up to ``capacity`` and then wraps, so append
+    is O(1) and memory per user stays flat.
+    """
+    
+    INITIAL_SIZE = 16
+    
+    def __init__(self, capacity=None):
+        self.capacity = max(1, capacity or LOCATION_HISTORY_CAPACITY)
+        size = min(self.INITIAL_SIZE, self.capacity)
+        self.lat = np.empty(size, dtype=np.float64)
+        self.lng = np.empty(size, dtype=np.float64)
+        self.epoch = np.empty(size, dtype=np.int64)
+        self.source = np.empty(size, dtype=np.uint8)
+        self.head = 0  # slot the next fix is written to
+        self.size = 0
+    
+    @classmethod
+    def from_entries(cls, entries, capacity=None):
+        """Build a buffer from newest-first location dicts"""
+        if isinstance(entries, cls):
+            return entries
+        buffer = cls(capacity)
+        for entry in reversed(list(entries or [])):
+            buffer.append(entry["lat"], entry["lng"], timestamp_to_epoch(entry["timestamp"]),
+                          entry.get("source", "unknown"))
+        return buffer
+    
+    def _grow(self):
+        new_size = min(len(self.lat) * 2, self.capacity)
+        for column in ("lat", "lng", "epoch", "source"):
+            old = getattr(self, column)
+            grown = np.empty(new_size, dtype=old.dtype)
+            grown[:len(old)] = old
+            setattr(self, column, grown)
+        self.head = self.size
+    
+    def append(self, lat, lng, epoch, source="unknown"):
+        """Add the newest fix, overwriting the oldest one once full"""
+        if self.size == len(self.lat) and self.size < self.capacity:
+            self._grow()
+        i = self.head
+        self.lat[i] = lat
+        self.lng[i] = lng
+        self.epoch[i] = epoch
+        self.source[i] = location_source_code(source or "unknown")
+        self.head = (i + 1) % len(self.lat)
+        self.size = min(self.size + 1, self.capacity)
+    
+    def latest_epoch(self):
+        """Epoch of the newest fix (buffer must not be empty)"""
+        return int(self.epoch[self._slot(0)])
+    
+    def _slot(self, i):
+        """Physical slot of the i-th newest fix"""
+        return (self.head - 1 - i) % len(self.lat)
+    
+    def _entry(self, slot):
+        return {
+            "lat": float(self.lat[slot]),
+            "lng": float(self.lng[slot]),
+            "timestamp": epoch_to_timestamp(self.epoch[slot]),
+            "source": LOCATION_SOURCES[self.source[slot]]
         }
-    }
+    
+    def __len__(self):
+        return self.size
+    
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self._entry(self._slot(i)) for i in range(*key.indices(self.size))]
+        if key < 0:
+            key += self.size
+        if not 0 <= key < self.size:
+            raise IndexError("track index out of range")
+        return self._entry(self._slot(key))
+    
+    def __iter__(self):
+        for i in range(self.size):
+            yield self._entry(self._slot(i))
+    
+    def __reversed__(self):
+        for i in range(self.size - 1, -1, -1):
+            yield self._entry(self._slot(i))
+    
+    def columns(self):
+        """Return (lat, lng, epoch, source) arrays, oldest first"""
+        order = (self.head - self.size + np.arange(self.size)) % len(self.lat)
+        return self.lat[order], self.lng[order], self.epoch[order], self.source[order]
+    
+    def drop_before(self, epoch):
+        """Forget the oldest fixes up to the first one at or after ``epoch``; returns how many"""
+        columns = self.columns()
+        newer = np.flatnonzero(columns[2] >= epoch)
+        stale = int(newer[0]) if len(newer) else self.size
+        if stale:
+            # Compact the kept fixes to the front so the buffer is unwrapped again
+            kept = self.size - stale
+            for name, column in zip(("lat", "lng", "epoch", "source"), columns):
+                getattr(self, name)[:kept] = column[stale:]
+            self.head = kept
+            self.size = kept
+            self.levels = None
+        return stale
 
-if "view" not in st.session_state:
-    st.session_state.view = "login"
-if "user" not in st.session_state:
-    st.session_state.user = None
-if "panic_active" not in st.session_state:
-    st.session_state.panic_active = False
-if "panic_timer" not in st.session_state:
-    st.session_state.panic_timer = None
-if "location" not in st.session_state:
-    st.session_state.location = None  # No default location
-if "history" not in st.session_state:
-    st.session_state.history = []
-if "contacts" not in st.session_state:
-    st.session_state.contacts = []  # Empty contacts - user must add
-if "settings" not in st.session_state:
-    st.session_state.settings = {
-        "notifications": True,
-        "location_tracking": True,
-        "high_accuracy": True,
-        "vibration": True,
-        "sound_alerts": True,
-        "voice_recording": True,
-        "auto_send_alerts": True,
-        "panic_duration": 3,
-        "emergency_message": "EMERGENCY! I need immediate assistance. My current location has been shared with this alert."
-    }
-if "sidebar_collapsed" not in st.session_state:
-    st.session_state.sidebar_collapsed = False
-if "map_click_location" not in st.session_state:
-    st.session_state.map_click_location = None
+# ---- Panic Event Time Index ----
+def day_key(ts):
+    """Local calendar day (proleptic ordinal) containing epoch ``ts``"""
+    return datetime.date.fromtimestamp(ts).toordinal()
 
-# ---- Emergency Features ----
-if "emergency_type" not in st.session_state:
-    st.session_state.emergency_type = "general"
-if "safety_timer" not in st.session_state:
-    st.session_state.safety_timer = None
-if "fake_call_time" not in st.session_state:
-    st.session_state.fake_call_time = None
-if "safety_network" not in st.session_state:
-    st.session_state.safety_network = []
-if "evidence_recordings" not in st.session_state:
-    st.session_state.evidence_recordings = []
-if "offline_mode" not in st.session_state:
-    st.session_state.offline_mode = False
 
-# ---- Admin Tracking ----
-if "panic_events" not in st.session_state:
-    st.session_state.panic_events = []
-if "system_logs" not in st.session_state:
-    st.session_state.system_logs = []
-if "admin_settings" not in st.session_state:
-    st.session_state.admin_settings = {
-        "system_name": "SafeTap Emergency System",
-        "emergency_response_time": "5 minutes",
-        "auto_backup": True,
-        "data_retention_days": 90,
-        "max_users": 1000,
-        "alert_cooldown": 300,
-        "system_status": "operational",
-        "location_update_interval": 30
-    }
+def day_bounds(day=None):
+    """Return the [start, end) epoch range of a local calendar day (default today)"""
+    day = day or datetime.date.today()
+    start = datetime.datetime.combine(day, datetime.time.min)
+    return start.timestamp(), (start + datetime.timedelta(days=1)).timestamp()
 
-# ---- Emergency Protocols ----
-EMERGENCY_PROTOCOLS = {
-    "emergency": {
-        "icon": "🚨",
-        "color": "#ff6b6b",
-        "message": "EMERGENCY! I need immediate assistance.",
-        "actions": ["Assess situation", "Call emergency services", "Move to safe location"],
-        "contacts": ["all"],
-        "bg_color": "rgba(255, 107, 107, 0.3)"
-    },
-    "medical": {
-        "icon": "🚑",
-        "color": "#e74c3c",
-        "message": "MEDICAL EMERGENCY! Need immediate medical assistance.",
-        "actions": ["Check responsiveness", "Call emergency services", "Provide first aid if trained"],
-        "contacts": ["emergency", "family"],
-        "bg_color": "rgba(231, 76, 60, 0.3)"
-    },
-    "fire": {
-        "icon": "🔥",
-        "color": "#e67e22",
-        "message": "FIRE EMERGENCY! Need immediate fire department assistance.",
-        "actions": ["Evacuate area", "Call fire department", "Use fire extinguisher if safe"],
-        "contacts": ["emergency", "family"],
-        "bg_color": "rgba(230, 126, 34, 0.3)"
-    },
-    "personal_safety": {
-        "icon": "🛡️",
-        "color": "#9b59b6",
-        "message": "PERSONAL SAFETY ALERT! I feel unsafe and need assistance.",
-        "actions": ["Find safe location", "Contact emergency services", "Stay on phone"],
-        "contacts": ["emergency", "family"],
-        "bg_color": "rgba(155, 89, 182, 0.3)"
-    },
-    "general": {
-        "icon": "⚠️",
-        "color": "#ff6b6b",
-        "message": "GENERAL EMERGENCY! I need immediate assistance.",
-        "actions": ["Assess situation", "Call emergency services", "Move to safe location"],
-        "contacts": ["all"],
-        "bg_color": "rgba(255, 107, 107, 0.3)"
-    }
+
+class PanicEventIndex:
+    """Panic events partitioned by local day, each partition sorted by epoch.
+
+    Range queries only touch the partitions that overlap the window and use
+    bisection inside them, so "today" or "last 5 minutes" cost does not grow
+    with the total number of stored events.
+    """
+    
+    def __init__(self, events=()):
+        self.days = []        # sorted partition keys
+        self.partitions = {}  # day -> ([ts, ...], [event, ...]) sorted by ts
+        self.total = 0
+        for event in events:
+            self.add(event)
+    
+    def __len__(self):
+        return self.total
+    
+    def add(self, event):
+        """Index an event by its ``ts`` epoch"""
+        ts = event["ts"]
+        day = day_key(ts)
+        partition = self.partitions.get(day)
+        if partition is None:
+            partition = self.partitions[day] = ([], [])
+            bisect.insort(self.days, day)
+        stamps, events = partition
+        # Events almost always arrive in order, so this is usually an append
+        i = bisect.bisect_right(stamps, ts)
+        stamps.insert(i, ts)
+        events.insert(i, event)
+        self.total += 1
+    
+    def clear(self):
+        self.days.clear()
+        self.partitions.clear()
+        self.total = 0
+    
+    def drop_before(self, ts):
+        """Drop every day partition before the day containing ``ts`` and return its events"""
+        cut = bisect.bisect_left(self.days, day_key(ts))
+        dropped = []
+        for day in self.days[:cut]:
+            dropped.extend(self.partitions.pop(day)[1])
+        del self.days[:cut]
+        self.total -= len(dropped)
+        return dropped
+    
+    def _slices(self, start, end):
+        """Yield (events, lo, hi) for each partition slice within [start, end)"""
+        first = bisect.bisect_left(self.days, day_key(start))
+        last = bisect.bisect_right(self.days, day_key(end))
+        for day in self.days[first:last]:
+            stamps, events = self.partitions[day]
+            lo = bisect.bisect_left(stamps, start)
+            hi = bisect.bisect_left(stamps, end)
+            if lo < hi:
+                yield events, lo, hi
+    
+    def between(self, start, end, newest_first=True):
+        """Events with start <= ts < end"""
+        result = []
+        for events, lo, hi in self._slices(start, end):
+            result.extend(events[lo:hi])
+        if newest_first:
+            result.reverse()
+        return result
+    
+    def count(self, start, end):
+        """Number of events with start <= ts < end"""
+        return sum(hi - lo for _, lo, hi in self._slices(start, end))
+    
+    def today(self):
+        """Today's events, newest first"""
+        return self.between(*day_bounds())
+    
+    def last_minutes(self, minutes):
+        """Events from the last ``minutes`` minutes, newest first"""
+        now = time.time()
+        return self.between(now - minutes * 60, now + 1)
+
+# ---- Active Incident Table ----
+def incident_expiry(ts):
+    """An open incident ages out at the end of the local day it was raised"""
+    return day_bounds(datetime.date.fromtimestamp(ts))[1]
+
+
+class ActiveIncidentTable:
+    """username -> latest open panic event, with lazy expiry.
+
+    Lookups are O(1); aged-out incidents are dropped when touched or by
+    ``expire()``, which pops a min-heap of expiry times.
+    """
+    
+    def __init__(self):
+        self.open = {}
+        self.expiry_heap = []  # (expires_at, event id, username)
+    
+    def add(self, event):
+        """Open (or replace) the user's incident with ``event``"""
+        if event.get("resolved_at"):
+            return
+        username = event["username"]
+        current = self.open.get(username)
+        if current is not None and current["ts"] > event["ts"]:
+            return
+        expires_at = incident_expiry(event["ts"])
+        if expires_at <= time.time():
+            return
+        self.open[username] = event
+        heapq.heappush(self.expiry_heap, (expires_at, event.get("id") or 0, username))
+    
+    def get(self, username):
+        """Return the user's open incident, or None"""
+        event = self.open.get(username)
+        if event is not None and (event.get("resolved_at") or incident_expiry(event["ts"]) <= time.time()):
+            del self.open[username]
+            return None
+        return event
+    
+    def has_emergency(self, username):
+        return self.get(username) is not None
+    
+    def resolve(self, username):
+        """Close the user's incident and return it"""
+        return self.open.pop(username, None)
+    
+    def expire(self, now=None):
+        """Drop every incident whose expiry has passed"""
+        now = now or time.time()
+        while self.expiry_heap and self.expiry_heap[0][0] <= now:
+            _, event_id, username = heapq.heappop(self.expiry_heap)
+            event = self.open.get(username)
+            if event is not None and (event.get("id") or 0) == event_id:
+                del self.open[username]
+    
+    def clear(self):
+        self.open.clear()
+        self.expiry_heap.clear()
+    
+    def __len__(self):
+        self.expire()
+        return len(self.open)
+
+# ---- System Statistics Aggregator ----
+RECENT_LOCATION_WINDOW = 5 * 60
+RECENT_LOCATION_BUCKET = 10  # seconds per recency bucket
+
+
+class SystemStats:
+    """Admin dashboard counters maintained on the write path.
+
+    ``snapshot()`` is O(1) apart from summing the fixed number of recency
+    buckets. Each non-admin user with a location sits in exactly one
+    RECENT_LOCATION_BUCKET-second bucket (their latest fix), so "located in
+    the last 5 minutes" never needs a sweep over users.
+    """
+    
+    def __init__(self):
+        self.reset()
+    
+    def reset(self):
+        self.total_users = 0
+        self.active_users = 0
+        self.users_by_role = {}
+        self.total_emergencies = 0
+        self.emergency_types = {}
+        self.day = day_key(time.time())
+        self.today_emergencies = 0
+        self.today_users = set()
+        self.location_bucket = {}  # username -> bucket of their latest fix
+        self.bucket_counts = {}    # bucket -> users whose latest fix is in it
+    
+    def rebuild(self, users, events, today_events):
+        """Recompute every counter from scratch (startup and restores)"""
+        self.reset()
+        for username, user in users.items():
+            self.add_user(username, user)
+            location = user.get("current_location")
+            if location and location.get("timestamp"):
+                self.location_fix(username, user, timestamp_to_epoch(location["timestamp"]))
+        for event in events:
+            self.total_emergencies += 1
+            self.emergency_types[event["emergency_type"]] = self.emergency_types.get(event["emergency_type"], 0) + 1
+        self.today_emergencies = len(today_events)
+        self.today_users = {event["username"] for event in today_events}
+    
+    def _roll_day(self):
+        today = day_key(time.time())
+        if today != self.day:
+            self.day = today
+            self.today_emergencies = 0
+            self.today_users = set()
+    
+    def add_user(self, username, user):
+        role = user.get("role", "user")
+        if role == "admin":
+            return
+        self.total_users += 1
+        self.users_by_role[role] = self.users_by_role.get(role, 0) + 1
+        if user.get("status", "active") == "active":
+            self.active_users += 1
+    
+    def remove_user(self, username, user):
+        role = user.get("role", "user")
+        if role == "admin":
+            return
+        self.total_users -= 1
+        self.users_by_role[role] -= 1
+        if not self.users_by_role[role]:
+            del self.users_by_role[role]
+        if user.get("status", "active") == "active":
+            self.active_users -= 1
+        self._drop_location(username)
+    
+    def status_changed(self, user, old_status, new_status):
+        if user.get("role") == "admin" or old_status == new_status:
+            return
+        if old_status == "active":
+            self.active_users -= 1
+        elif new_status == "active":
+            self.active_users += 1
+    
+    def _drop_location(self, username):
+        bucket = self.location_bucket.pop(username, None)
+        if bucket is not None:
+            self.bucket_counts[bucket] -= 1
+            if not self.bucket_counts[bucket]:
+                del self.bucket_counts[bucket]
+    
+    def location_fix(self, username, user, epoch):
+        if user.get("role") == "admin":
+            return
+        self._drop_location(username)
+        bucket = int(epoch) // RECENT_LOCATION_BUCKET
+        self.location_bucket[username] = bucket
+        self.bucket_counts[bucket] = self.bucket_counts.get(bucket, 0) + 1
+    
+    def panic_event(self, event):
+        self._roll_day()
+        self.total_emergencies += 1
+        e_type = event["emergency_type"]
+        self.emergency_types[e_type] = self.emergency_types.get(e_type, 0) + 1
+        if day_key(event["ts"]) == self.day:
+            self.today_emergencies += 1
+            self.today_users.add(event["username"])
+    
+    def remove_events(self, events):
+        """Forget events dropped by retention (never today's)"""
+        for event in events:
+            self.total_emergencies -= 1
+            e_type = event["emergency_type"]
+            self.emergency_types[e_type] -= 1
+            if not self.emergency_types[e_type]:
+                del self.emergency_types[e_type]
+    
+    def recent_location_users(self, now=None):
+        """Users whose latest fix falls in the last RECENT_LOCATION_WINDOW seconds"""
+        now = now or time.time()
+        current = int(now) // RECENT_LOCATION_BUCKET
+        oldest = int(now - RECENT_LOCATION_WINDOW) // RECENT_LOCATION_BUCKET
+        return sum(self.bucket_counts.get(bucket, 0) for bucket in range(oldest, current + 1))
+    
+    def snapshot(self):
+        """Current statistics in the shape get_system_stats returns"""
+        self._roll_day()
+        return {
+            "total_users": self.total_users,
+            "active_users": self.active_users,
+            "total_emergencies": self.total_emergencies,
+            "today_emergencies": self.today_emergencies,
+            "emergency_types": dict(self.emergency_types),
+            "users_in_emergency": len(self.today_users),
+            "recent_location_users": self.recent_location_users(),
+            "users_by_role": dict(self.users_by_role)
+        }
+
+# ---- Spatial Index ----
+SPATIAL_CELL_DEGREES = 0.01  # ~1.1 km grid cells
+NEARBY_USERS_RADIUS_M = 500
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE = 111320.0
+
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    """Great-circle distance in meters"""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lng2 - lng1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+class SpatialGrid:
+    """Uniform lat/lng grid over each user's current location.
+
+    Radius and bounding-box queries only visit the cells overlapping the
+    query area; k-nearest expands ring by ring around the query cell. Any
+    query that would visit more cells than there are points falls back to a
+    plain scan, so sparse or very wide queries stay cheap too.
+    """
+    
+    def __init__(self, cell_degrees=SPATIAL_CELL_DEGREES):
+        self.cell_degrees = cell_degrees
+        self.points = {}  # username -> (lat, lng, cell)
+        self.cells = {}   # cell -> set of usernames
+    
+    def __len__(self):
+        return len(self.points)
+    
+    def _cell(self, lat, lng):
+        return (math.floor(lat / self.cell_degrees), math.floor(lng / self.cell_degrees))
+    
+    def update(self, username, lat, lng):
+        """Insert or move a user"""
+        cell = self._cell(lat, lng)
+        previous = self.points.get(username)
+        if previous is not None and previous[2] != cell:
+            self._unlink(username, previous[2])
+        self.points[username] = (lat, lng, cell)
+        self.cells.setdefault(cell, set()).add(username)
+    
+    def remove(self, username):
+        previous = self.points.pop(username, None)
+        if previous is not None:
+            self._unlink(username, previous[2])
+    
+    def _unlink(self, username, cell):
+        members = self.cells.get(cell)
+        if members is not None:
+            members.discard(username)
+            if not members:
+                del self.cells[cell]
+    
+    def clear(self):
+        self.points.clear()
+        self.cells.clear()
+    
+    def _cells_in(self, south, west, north, east):
+        """Usernames in cells overlapping the box, or None if a scan is cheaper"""
+        (row0, col0), (row1, col1) = self._cell(south, west), self._cell(north, east)
+        if (row1 - row0 + 1) * (col1 - col0 + 1) > len(self.points):
+            return None
+        found = []
+        for row in range(row0, row1 + 1):
+            for col in range(col0, col1 + 1):
+                members = self.cells.get((row, col))
+                if members:
+                    found.extend(members)
+        return found
+    
+    def within_bounds(self, south, west, north, east):
+        """Usernames located inside the bounding box"""
+        candidates = self._cells_in(south, west, north, east)
+        if candidates is None:
+            candidates = self.points
+        result = []
+        for username in candidates:
+            lat, lng, _ = self.points[username]
+            if south <= lat <= north and west <= lng <= east:
+                result.append(username)
+        return result
+    
+    def within_radius(self, lat, lng, radius_m):
+        """(distance_m, username) pairs within ``radius_m``, nearest first"""
+        dlat = radius_m / METERS_PER_DEGREE
+        dlng = radius_m / (METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6))
+        candidates = self._cells_in(lat - dlat, lng - dlng, lat + dlat, lng + dlng)
+        if candidates is None:
+            candidates = self.points
+        result = []
+        for username in candidates:
+            p_lat, p_lng, _ = self.points[username]
+            distance = haversine_m(lat, lng, p_lat, p_lng)
+            if distance <= radius_m:
+                result.append((distance, username))
+        result.sort()
+        return result
+    
+    def nearest(self, lat, lng, k=5):
+        """The ``k`` users nearest to a point as (distance_m, username), nearest first"""
+        if k <= 0 or not self.points:
+            return []
+        row, col = self._cell(lat, lng)
+        # Rank candidates by equirectangular distance (cheap and accurate at
+        # city scale), then report great-circle distances for the winners
+        cos_lat = math.cos(math.radians(lat))
+        points = self.points
+        best = []  # max-heap of (-squared degree distance, username)
+        ring = 0
+        while True:
+            if (2 * ring + 1) ** 2 > len(points):
+                scored = ((haversine_m(lat, lng, p[0], p[1]), u) for u, p in points.items())
+                return heapq.nsmallest(k, scored)
+            for r in range(row - ring, row + ring + 1):
+                edge_row = r == row - ring or r == row + ring
+                for c in range(col - ring, col + ring + 1):
+                    if not edge_row and c != col - ring and c != col + ring:
+                        continue
+                    for username in self.cells.get((r, c), ()):
+                        p_lat, p_lng, _ = points[username]
+                        d_lng = (p_lng - lng) * cos_lat
+                        item = (-((p_lat - lat) ** 2 + d_lng * d_lng), username)
+                        if len(best) < k:
+                            heapq.heappush(best, item)
+                        elif item > best[0]:
+                            heapq.heapreplace(best, item)
+            if len(best) == k and math.sqrt(-best[0][0]) * METERS_PER_DEGREE <= \
+                    self._ring_clearance(lat, lng, row, col, ring):
+                return sorted((haversine_m(lat, lng, points[u][0], points[u][1]), u) for _, u in best)
+            ring += 1
+    
+    def _ring_clearance(self, lat, lng, row, col, ring):
+        """Lower bound (meters) on the distance from a point to anything outside ring ``ring``"""
+        c = self.cell_degrees
+        lat_gap = min(lat - (row - ring) * c, (row + ring + 1) * c - lat)
+        lng_gap = min(lng - (col - ring) * c, (col + ring + 1) * c - lng)
+        # Use the narrowest longitude spacing inside the searched box
+        widest_lat = min(90.0, abs(lat) + (ring + 1) * c)
+        return min(lat_gap * METERS_PER_DEGREE,
+                   lng_gap * METERS_PER_DEGREE * max(math.cos(math.radians(widest_lat)), 0.0))
+
+# ---- Trajectory Simplification ----
+TRACK_MAX_ZOOM = 18
+TRACK_TOLERANCE_PX = 1.0  # allowed deviation from the raw track, in screen pixels
+TRACK_MAX_VERTICES = 5000  # finer levels fall back to a coarser one above this
+TRACK_LEVELS_CACHE_SIZE = 16
+WEB_MERCATOR_M_PER_PX = 156543.03392  # metres per pixel at zoom 0 on the equator
+
+
+def meters_per_pixel(lat, zoom):
+    """Ground resolution of a web map tile pixel at ``lat`` and ``zoom``"""
+    return WEB_MERCATOR_M_PER_PX * math.cos(math.radians(lat)) / 2 ** zoom
+
+
+def douglas_peucker(x, y, tolerance):
+    """Indices of the vertices Douglas-Peucker keeps at ``tolerance``.
+
+    Every open segment is split in the same numpy pass, so the number of
+    passes follows the recursion depth rather than the number of vertices.
+    """
+    n = len(x)
+    if n < 3:
+        return np.arange(n)
+    keep = np.zeros(n, dtype=bool)
+    keep[[0, -1]] = True
+    open_idx = np.arange(1, n - 1)
+    tol2 = tolerance * tolerance
+    while len(open_idx):
+        kept = np.flatnonzero(keep)
+        seg = np.searchsorted(kept, open_idx) - 1
+        first, last = kept[seg], kept[seg + 1]
+        x0, y0 = x[first], y[first]
+        dx, dy = x[last] - x0, y[last] - y0
+        px, py = x[open_idx] - x0, y[open_idx] - y0
+        seg2 = dx * dx + dy * dy
+        # Distance to the chord segment, not the infinite line, so tracks that double back keep their turns
+        t = np.divide(px * dx + py * dy, seg2, out=np.zeros_like(px), where=seg2 > 0)
+        np.clip(t, 0.0, 1.0, out=t)
+        px -= t * dx
+        py -= t * dy
+        d2 = px * px + py * py
+        starts = np.flatnonzero(np.r_[True, seg[1:] != seg[:-1]])
+        seg_max = np.repeat(np.maximum.reduceat(d2, starts), np.diff(np.r_[starts, len(seg)]))
+        split = np.flatnonzero((d2 == seg_max) & (seg_max > tol2))
+        _, first_split = np.unique(seg[split], return_index=True)
+        keep[open_idx[split[first_split]]] = True
+        open_idx = open_idx[(seg_max > tol2) & ~keep[open_idx]]
+    return np.flatnonzero(keep)
+
+
+class TrackLevels:
+    """Douglas-Peucker simplifications of one track for every map zoom level.
+
+    The finest level is simplified from the raw fixes and each coarser level
+    from the one above it, so building all levels costs little more than the
+    finest one and picking the polyline for a zoom is a lookup. Chained
+    simplification stays within twice the per-level pixel tolerance.
+    """
+    
+    def __init__(self, lat, lng):
+        self.lat = lat
+        self.lng = lng
+        self.center = [float(lat.mean()), float(lng.mean())] if len(lat) else [0.0, 0.0]
+        # Local equirectangular metres are accurate enough at pixel tolerances
+        x = (lng - self.center[1]) * METERS_PER_DEGREE * math.cos(math.radians(self.center[0]))
+        y = (lat - self.center[0]) * METERS_PER_DEGREE
+        self.levels = [None] * (TRACK_MAX_ZOOM + 1)
+        indices = np.arange(len(lat))
+        for zoom in range(TRACK_MAX_ZOOM, -1, -1):
+            tolerance = meters_per_pixel(self.center[0], zoom) * TRACK_TOLERANCE_PX
+            indices = indices[douglas_peucker(x[indices], y[indices], tolerance)]
+            self.levels[zoom] = indices
+    
+    def __len__(self):
+        return len(self.lat)
+    
+    def fit_zoom(self, width_px, height_px):
+        """Largest zoom at which the whole track fits in a width x height view"""
+        if len(self.lat) < 2:
+            return TRACK_MAX_ZOOM
+        span_y = float(self.lat.max() - self.lat.min()) * METERS_PER_DEGREE / height_px
+        span_x = (float(self.lng.max() - self.lng.min()) * METERS_PER_DEGREE
+                  * math.cos(math.radians(self.center[0])) / width_px)
+        span = max(span_x, span_y)
+        if span == 0:
+            return TRACK_MAX_ZOOM
+        zoom = math.floor(math.log2(meters_per_pixel(self.center[0], 0) / span))
+        return min(max(zoom, 0), TRACK_MAX_ZOOM)
+    
+    def points(self, zoom):
+        """Simplified [lat, lng] vertices for ``zoom``, oldest first"""
+        zoom = min(max(int(zoom), 0), TRACK_MAX_ZOOM)
+        while zoom > 0 and len(self.levels[zoom]) > TRACK_MAX_VERTICES:
+            zoom -= 1
+        indices = self.levels[zoom]
+        return np.column_stack((self.lat[indices], self.lng[indices]))
+
+
+def track_levels(username):
+    """Multi-resolution levels for a user's full stored history.
+
+    The TrackBuffer only holds the latest fixes, so levels are built from the
+    location_history table and cached until the user's stored fixes change.
+    """
+    cache = get_track_levels_cache()
+    levels = cache.get((id(store), username, store.location_history_stamp(username)))
+    if levels is None:
+        stamp, lat, lng = store.location_track(username)
+        levels = TrackLevels(lat, lng)
+        cache.put((id(store), username, stamp), levels)
+    return levels
+
+# ---- Persistent State Store ----
+SAFETAP_DB_PATH = os.environ.get(
+    "SAFETAP_DB_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "safetap.db")
+)
+
+STORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    password TEXT NOT NULL,
+    name TEXT NOT NULL,
+    email TEXT,
+    phone TEXT,
+    user_id TEXT,
+    authority TEXT,
+    role TEXT NOT NULL DEFAULT 'user',
+    created_at TEXT,
+    profile_pic BLOB,
+    status TEXT NOT NULL DEFAULT 'active',
+    last_login TEXT,
+    loc_lat REAL,
+    loc_lng REAL,
+    loc_timestamp TEXT,
+    loc_source TEXT,
+    changed_seq INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_users_role ON users(role);
+CREATE INDEX IF NOT EXISTS idx_users_status ON users(status);
+CREATE INDEX IF NOT EXISTS idx_users_loc_timestamp ON users(loc_timestamp);
+
+CREATE TABLE IF NOT EXISTS location_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL,
+    lat REAL NOT NULL,
+    lng REAL NOT NULL,
+    timestamp TEXT NOT NULL,
+    source TEXT,
+    accuracy REAL
+);
+CREATE INDEX IF NOT EXISTS idx_location_history_user ON location_history(username, timestamp);
+
+CREATE TABLE IF NOT EXISTS panic_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL,
+    user_name TEXT,
+    emergency_type TEXT NOT NULL,
+    lat REAL,
+    lng REAL,
+    accuracy REAL,
+    timestamp TEXT NOT NULL,
+    date TEXT,
+    ts REAL,
+    resolved_at REAL,
+    changed_seq INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_panic_events_username ON panic_events(username);
+CREATE INDEX IF NOT EXISTS idx_panic_events_timestamp ON panic_events(timestamp);
+
+CREATE TABLE IF NOT EXISTS system_logs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_system_logs_timestamp ON system_logs(timestamp);
+
+-- Deleted users, so incremental backups can replay deletions
+CREATE TABLE IF NOT EXISTS deletions (
+    seq INTEGER PRIMARY KEY,
+    entity TEXT NOT NULL,
+    key TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+
+-- Per-user activity history (alerts, location updates, ...)
+CREATE TABLE IF NOT EXISTS user_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL,
+    type TEXT NOT NULL,
+    title TEXT NOT NULL,
+    details TEXT,
+    timestamp TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_user_history_user ON user_history(username, timestamp);
+CREATE INDEX IF NOT EXISTS idx_user_history_type ON user_history(username, type, timestamp);
+
+-- Outgoing alert messages, one per contact and transport, until delivered or given up
+CREATE TABLE IF NOT EXISTS alert_outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    event_id INTEGER,
+    username TEXT NOT NULL,
+    contact_name TEXT,
+    transport TEXT NOT NULL,
+    recipient TEXT NOT NULL,
+    subject TEXT,
+    message TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    enqueued_at REAL NOT NULL,
+    delivered_at REAL,
+    receipt TEXT,
+    last_error TEXT,
+    timestamp TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_alert_outbox_due ON alert_outbox(status, next_attempt);
+CREATE INDEX IF NOT EXISTS idx_alert_outbox_transport ON alert_outbox(status, transport, next_attempt);
+CREATE INDEX IF NOT EXISTS idx_alert_outbox_event ON alert_outbox(event_id);
+CREATE INDEX IF NOT EXISTS idx_alert_outbox_timestamp ON alert_outbox(timestamp);
+
+-- Signed-in browser sessions; only a hash of the session id is stored
+CREATE TABLE IF NOT EXISTS user_sessions (
+    session_key TEXT PRIMARY KEY,
+    username TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_user_sessions_expires ON user_sessions(expires_at);
+CREATE INDEX IF NOT EXISTS idx_user_sessions_username ON user_sessions(username);
+
+-- Daily counts kept for data removed by retention
+CREATE TABLE IF NOT EXISTS daily_rollups (
+    day TEXT NOT NULL,
+    data_class TEXT NOT NULL,
+    key TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (day, data_class, key)
+);
+"""
+
+# Inverted token index over history titles and details, kept in sync by triggers.
+# Optional: SQLite builds without FTS5 fall back to LIKE scans of the user's rows.
+HISTORY_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS user_history_fts USING fts5(
+    title, details, content='user_history', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS user_history_fts_insert AFTER INSERT ON user_history BEGIN
+    INSERT INTO user_history_fts (rowid, title, details) VALUES (new.id, new.title, new.details);
+END;
+CREATE TRIGGER IF NOT EXISTS user_history_fts_delete AFTER DELETE ON user_history BEGIN
+    INSERT INTO user_history_fts (user_history_fts, rowid, title, details)
+    VALUES ('delete', old.id, old.title, old.details);
+END;
+"""
+
+HISTORY_PAGE_SIZE = 50
+
+# Search indexes over username, name, email and phone, maintained by triggers on
+# users: word prefixes (user_terms) and substrings (user_trigrams). Phones are
+# also indexed as bare digits so "0917 123" finds "+63 917-123...".
+USER_SEARCH_VALUES = (
+    "{row}.username, {row}.name, {row}.email, {row}.phone || ' ' || "
+    "replace(replace(replace(replace(replace({row}.phone, ' ', ''), '-', ''), '+', ''), '(', ''), ')', '')"
+)
+USER_SEARCH_SCHEMA = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS user_terms USING fts5(
+    username, name, email, phone, tokenize='unicode61 remove_diacritics 2', prefix='1 2 3'
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS user_trigrams USING fts5(
+    username, name, email, phone, tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS users_search_insert AFTER INSERT ON users BEGIN
+    INSERT INTO user_terms (rowid, username, name, email, phone) VALUES (new.rowid, {USER_SEARCH_VALUES.format(row="new")});
+    INSERT INTO user_trigrams (rowid, username, name, email, phone) VALUES (new.rowid, {USER_SEARCH_VALUES.format(row="new")});
+END;
+CREATE TRIGGER IF NOT EXISTS users_search_delete AFTER DELETE ON users BEGIN
+    DELETE FROM user_terms WHERE rowid = old.rowid;
+    DELETE FROM user_trigrams WHERE rowid = old.rowid;
+END;
+CREATE TRIGGER IF NOT EXISTS users_search_update AFTER UPDATE OF username, name, email, phone ON users BEGIN
+    DELETE FROM user_terms WHERE rowid = old.rowid;
+    DELETE FROM user_trigrams WHERE rowid = old.rowid;
+    INSERT INTO user_terms (rowid, username, name, email, phone) VALUES (new.rowid, {USER_SEARCH_VALUES.format(row="new")});
+    INSERT INTO user_trigrams (rowid, username, name, email, phone) VALUES (new.rowid, {USER_SEARCH_VALUES.format(row="new")});
+END;
+"""
+
+USER_PAGE_SIZE = 50
+
+# Retention data class -> (table, daily rollup key)
+RETENTION_TABLES = {
+    "location": ("location_history", "username"),
+    "history": ("user_history", "type"),
+    "panic_event": ("panic_events", "emergency_type"),
+    "alert": ("alert_outbox", "status"),
+    "system_log": ("system_logs", "COALESCE(json_extract(data, '$.type'), '')")
 }
 
-# ---- Helper Functions ----
-def add_history(event_type, title, details):
-    """Add an event to history"""
-    event = {
-        "type": event_type,
-        "title": title,
-        "details": details,
-        "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "date": datetime.datetime.now().strftime("%B %d, %Y - %H:%M")
+# User fields shown on the tracking map; changing one invalidates cached renders
+MAP_USER_FIELDS = {"name", "email", "phone", "role", "status"}
+
+# User record field -> users table column
+USER_FIELD_COLUMNS = {
+    "password": "password",
+    "name": "name",
+    "email": "email",
+    "phone": "phone",
+    "id": "user_id",
+    "authority": "authority",
+    "role": "role",
+    "created_at": "created_at",
+    "profile_pic": "profile_pic",
+    "status": "status",
+    "last_login": "last_login"
+}
+
+
+def default_admin_record():
+    """Build the built-in administrator account, its default password already hashed"""
+    return {
+        "password": get_credential_engine().hash("admin123"),
+        "name": "System Administrator",
+        "email": "admin@safetap.com",
+        "phone": "+63 900 000 0000",
+        "id": "ADMIN001",
+        "authority": "Administrator",
+        "role": "admin",
+        "created_at": datetime.datetime.now().strftime("%Y-%m-%d"),
+        "profile_pic": None,
+        "status": "active",
+        "last_login": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "current_location": None,
+        "location_history": []
     }
-    st.session_state.history.insert(0, event)
 
-def log_panic_event(username, emergency_type, location):
-    """Log panic button usage for admin tracking"""
-    if username in st.session_state.registered_users:
-        user_name = st.session_state.registered_users[username]["name"]
-        event = {
-            "username": username,
-            "user_name": user_name,
-            "emergency_type": emergency_type,
-            "location": location,
-            "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "date": datetime.datetime.now().strftime("%B %d, %Y - %H:%M")
-        }
-        st.session_state.panic_events.insert(0, event)
 
-def update_user_location(username, lat, lng, source="manual"):
-    """Update user's current location and add to history"""
-    if username in st.session_state.registered_users:
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+class SafeTapStore:
+    """SQLite (WAL) store shared by every session.
+
+    Writes go to the database first and are then mirrored into the in-memory
+    ``users``, ``panic_events`` and ``system_logs`` views that the UI reads.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        # INSERT OR REPLACE must fire the delete triggers that keep the search indexes in sync
+        self.conn.execute("PRAGMA recursive_triggers=ON")
+        self.conn.executescript(STORE_SCHEMA)
+        self._migrate()
+        # Picture blobs staged while a backup is imported
+        self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS import_blobs (sha256 TEXT PRIMARY KEY, data BLOB NOT NULL)")
         
-        location_entry = {
-            "lat": lat,
-            "lng": lng,
-            "timestamp": timestamp,
-            "source": source
-        }
+        self.users = {}
+        self.panic_events = []
+        self.event_index = PanicEventIndex()
+        self.incidents = ActiveIncidentTable()
+        self.stats = SystemStats()
+        self.spatial = SpatialGrid()
+        self.system_logs = []
+        self.map_version = 0  # bumped whenever locations, users on the map or incidents change
+        self.location_fix_count = 0  # rows in location_history, kept in step with every write
+        self.change_seq = self.conn.execute(
+            "SELECT MAX(COALESCE((SELECT MAX(changed_seq) FROM users), 0), "
+            "COALESCE((SELECT MAX(changed_seq) FROM panic_events), 0), "
+            "COALESCE((SELECT MAX(seq) FROM deletions), 0))"
+        ).fetchone()[0]
+        self._load()
         
-        if "location_history" not in st.session_state.registered_users[username]:
-            st.session_state.registered_users[username]["location_history"] = []
+        with self.lock:
+            if not any(u.get("role") == "admin" for u in self.users.values()):
+                self.add_user("admin", default_admin_record())
+    
+    def _migrate(self):
+        """Bring databases created by older versions up to the current schema"""
+        columns = {row["name"] for row in self.conn.execute("PRAGMA table_info(panic_events)")}
+        if "ts" not in columns:
+            self.conn.execute("ALTER TABLE panic_events ADD COLUMN ts REAL")
+        if "resolved_at" not in columns:
+            self.conn.execute("ALTER TABLE panic_events ADD COLUMN resolved_at REAL")
+        self.conn.execute(
+            "UPDATE panic_events SET ts = CAST(strftime('%s', timestamp, 'utc') AS REAL) WHERE ts IS NULL"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_panic_events_ts ON panic_events(ts)")
+        
+        columns = {row["name"] for row in self.conn.execute("PRAGMA table_info(location_history)")}
+        if "accuracy" not in columns:
+            self.conn.execute("ALTER TABLE location_history ADD COLUMN accuracy REAL")
+        
+        # changed_seq orders user and event writes for incremental backups
+        for table in ("users", "panic_events"):
+            columns = {row["name"] for row in self.conn.execute(f"PRAGMA table_info({table})")}
+            if "changed_seq" not in columns:
+                self.conn.execute(f"ALTER TABLE {table} ADD COLUMN changed_seq INTEGER NOT NULL DEFAULT 0")
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_changed_seq ON {table}(changed_seq)")
+        
+        has_fts = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'user_history_fts'").fetchone() is not None
+        try:
+            self.conn.executescript(HISTORY_FTS_SCHEMA)
+            self.history_fts = True
+        except sqlite3.OperationalError:
+            self.history_fts = False
+        if self.history_fts and not has_fts:
+            self.conn.execute("INSERT INTO user_history_fts (user_history_fts) VALUES ('rebuild')")
+        
+        has_search = self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'user_terms'").fetchone() is not None
+        try:
+            self.conn.executescript(USER_SEARCH_SCHEMA)
+            self.user_fts = True
+        except sqlite3.OperationalError:
+            self.user_fts = False
+        if self.user_fts and not has_search:
+            for table in ("user_terms", "user_trigrams"):
+                self.conn.execute(f"INSERT INTO {table} (rowid, username, name, email, phone) "
+                                  f"SELECT rowid, {USER_SEARCH_VALUES.format(row='users')} FROM users")
+    
+    # -- loading --
+    def _load(self):
+        """(Re)build the in-memory views from the database, in place"""
+        with self.lock:
+            users = {row["username"]: self._user_from_row(row)
+                     for row in self.conn.execute("SELECT * FROM users")}
+            
+            fix_count = 0
+            for row in self.conn.execute("SELECT * FROM location_history ORDER BY id"):
+                fix_count += 1
+                user = users.get(row["username"])
+                if user is None:
+                    continue
+                # Replay the same rule add_location applies: late fixes stay out of the buffer
+                track = user["location_history"]
+                epoch = timestamp_to_epoch(row["timestamp"])
+                if not len(track) or epoch >= track.latest_epoch():
+                    track.append(row["lat"], row["lng"], epoch, row["source"])
+            
+            events = [self._event_from_row(row) for row in
+                      self.conn.execute("SELECT * FROM panic_events ORDER BY id DESC")]
+            logs = [json.loads(row["data"]) for row in
+                    self.conn.execute("SELECT data FROM system_logs ORDER BY id DESC")]
+            
+            self.users.clear()
+            self.users.update(users)
+            self.panic_events[:] = events
+            self.event_index.clear()
+            self.incidents.clear()
+            for event in reversed(events):
+                self.event_index.add(event)
+                self.incidents.add(event)
+            self.stats.rebuild(self.users, events, self.event_index.today())
+            self.spatial.clear()
+            for username, user in self.users.items():
+                location = user.get("current_location")
+                if location and user.get("role") != "admin":
+                    self.spatial.update(username, location["lat"], location["lng"])
+            self.system_logs[:] = logs
+            self.location_fix_count = fix_count
+            self.map_version += 1
+    
+    @staticmethod
+    def _user_from_row(row):
+        current_location = None
+        if row["loc_lat"] is not None and row["loc_lng"] is not None:
+            current_location = {
+                "lat": row["loc_lat"],
+                "lng": row["loc_lng"],
+                "timestamp": row["loc_timestamp"],
+                "source": row["loc_source"]
+            }
+        return {
+            "password": row["password"],
+            "name": row["name"],
+            "email": row["email"],
+            "phone": row["phone"],
+            "id": row["user_id"],
+            "authority": row["authority"],
+            "role": row["role"],
+            "created_at": row["created_at"],
+            "profile_pic": row["profile_pic"],
+            "status": row["status"],
+            "last_login": row["last_login"],
+            "current_location": current_location,
+            "location_history": TrackBuffer()
+        }
+    
+    @staticmethod
+    def _event_from_row(row):
+        location = {"lat": row["lat"], "lng": row["lng"]}
+        if row["accuracy"] is not None:
+            location["accuracy"] = row["accuracy"]
+        return {
+            "id": row["id"],
+            "username": row["username"],
+            "user_name": row["user_name"],
+            "emergency_type": row["emergency_type"],
+            "location": location,
+            "timestamp": row["timestamp"],
+            "date": row["date"],
+            "ts": row["ts"],
+            "resolved_at": row["resolved_at"]
+        }
+    
+    @staticmethod
+    def _column_value(field, value):
+        if field == "profile_pic" and isinstance(value, str):
+            return base64.b64decode(value)
+        return value
+    
+    # -- writes --
+    @contextlib.contextmanager
+    def transaction(self):
+        """Run a block of writes as one SQLite transaction"""
+        with self.lock:
+            if self.conn.in_transaction:
+                # Nested blocks join the enclosing transaction, which commits or rolls back as a whole
+                yield self
+                return
+            self.conn.execute("BEGIN")
+            try:
+                yield self
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+    
+    @contextlib.contextmanager
+    def snapshot(self):
+        """Yield a read connection pinned to one consistent WAL snapshot.
+
+        Long reads use their own connection so writers are not blocked;
+        an in-memory database has only the shared one.
+        """
+        if self.path == ":memory:":
+            with self.lock:
+                yield self.conn
+            return
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("BEGIN")
+            yield conn
+        finally:
+            conn.close()
+    
+    def copy_to(self, path):
+        """Write a compacted point-in-time copy of the database to ``path``.
+
+        VACUUM INTO reads from one WAL snapshot, so writers carry on while
+        it runs; a passive checkpoint afterwards keeps the WAL from growing.
+        """
+        if self.path == ":memory:":
+            with self.lock:
+                self.conn.execute("VACUUM INTO ?", (path,))
+            return
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        try:
+            conn.execute("VACUUM INTO ?", (path,))
+            conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+        finally:
+            conn.close()
+    
+    def _next_seq(self):
+        """Next change sequence number; callers hold the lock, so commit order follows it"""
+        self.change_seq += 1
+        return self.change_seq
+    
+    def _insert_user(self, username, user, verb="INSERT"):
+        location = user.get("current_location") or {}
+        cursor = self.conn.execute(
+            f"{verb} INTO users (username, password, name, email, phone, user_id, authority, role, "
+            "created_at, profile_pic, status, last_login, loc_lat, loc_lng, loc_timestamp, loc_source, "
+            "changed_seq) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (username, user["password"], user["name"], user.get("email"), user.get("phone"),
+             user.get("id"), user.get("authority"), user.get("role", "user"), user.get("created_at"),
+             self._column_value("profile_pic", user.get("profile_pic")), user.get("status", "active"),
+             user.get("last_login"), location.get("lat"), location.get("lng"),
+             location.get("timestamp"), location.get("source"), self._next_seq())
+        )
+        for entry in reversed(user.get("location_history") or []):
+            self._insert_location(username, entry)
+        return cursor.rowcount
+    
+    def _insert_location(self, username, entry):
+        self.conn.execute(
+            "INSERT INTO location_history (username, lat, lng, timestamp, source, accuracy) VALUES (?, ?, ?, ?, ?, ?)",
+            (username, entry["lat"], entry["lng"], entry["timestamp"], entry.get("source"), entry.get("accuracy"))
+        )
+    
+    def _insert_event(self, event, verb="INSERT"):
+        location = event.get("location") or {}
+        if event.get("ts") is None:
+            event["ts"] = float(timestamp_to_epoch(event["timestamp"]))
+        cursor = self.conn.execute(
+            f"{verb} INTO panic_events (id, username, user_name, emergency_type, lat, lng, accuracy, "
+            "timestamp, date, ts, resolved_at, changed_seq) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (event.get("id"), event["username"], event.get("user_name"), event["emergency_type"],
+             location.get("lat"), location.get("lng"), location.get("accuracy"),
+             event["timestamp"], event.get("date"), event["ts"], event.get("resolved_at"), self._next_seq())
+        )
+        return cursor.lastrowid if cursor.rowcount else None
+    
+    def _insert_log(self, entry):
+        timestamp = entry.get("timestamp") if isinstance(entry, dict) else None
+        self.conn.execute("INSERT INTO system_logs (timestamp, data) VALUES (?, ?)",
+                          (timestamp, json.dumps(entry, default=str)))
+    
+    def add_user(self, username, user):
+        """Insert a new user record"""
+        with self.lock:
+            with self.transaction():
+                self._insert_user(username, user)
+            self.location_fix_count += len(user.get("location_history") or ())
+            user["location_history"] = TrackBuffer.from_entries(user.get("location_history"))
+            user.setdefault("current_location", None)
+            self.users[username] = user
+            self.stats.add_user(username, user)
+    
+    def update_user(self, username, **fields):
+        """Update stored user fields (keys as in the user record)"""
+        columns = [(USER_FIELD_COLUMNS[f], self._column_value(f, v)) for f, v in fields.items()
+                   if f in USER_FIELD_COLUMNS]
+        with self.lock:
+            if username not in self.users:
+                return False
+            if columns:
+                columns.append(("changed_seq", self._next_seq()))
+                assignments = ", ".join(f"{column} = ?" for column, _ in columns)
+                self.conn.execute(f"UPDATE users SET {assignments} WHERE username = ?",
+                                  [value for _, value in columns] + [username])
+            user = self.users[username]
+            if "status" in fields:
+                self.stats.status_changed(user, user.get("status", "active"), fields["status"])
+            if MAP_USER_FIELDS.intersection(fields):
+                self.map_version += 1
+            user.update(fields)
+            return True
+    
+    def search_users(self, query="", role=None, exclude=(), offset=0, limit=USER_PAGE_SIZE):
+        """Return one page of ranked usernames matching ``query`` and the number of matches.
+        
+        Ranked as: exact username, username prefix, every query word prefixing
+        a word of some field, then substring matches; ties by username.
+        """
+        query = query.strip().lower()
+        source, source_params = "users", []
+        where, params = [], []
+        if role:
+            where.append("role = ?")
+            params.append(role)
+        if exclude:
+            where.append(f"username NOT IN ({', '.join('?' * len(exclude))})")
+            params += list(exclude)
+        if query:
+            words = re.findall(r"[^\W_]+", query)
+            # Phone numbers are matched on their digits whatever the punctuation
+            substring = re.sub(r"\D", "", query) if re.fullmatch(r"[\d\s+()-]+", query) else query
+            escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            if self.user_fts:
+                hits = []
+                if words:
+                    hits.append("SELECT rowid, 2 AS tier FROM user_terms WHERE user_terms MATCH ?")
+                    source_params.append(" ".join(f'"{word}"*' for word in words))
+                if len(substring) >= 3:
+                    hits.append("SELECT rowid, 3 AS tier FROM user_trigrams WHERE user_trigrams MATCH ?")
+                    source_params.append('"' + substring.replace('"', '""') + '"')
+                if not hits:
+                    return [], 0
+                source = (f"(SELECT rowid, MIN(tier) AS tier FROM ({' UNION ALL '.join(hits)}) GROUP BY rowid) AS hits "
+                          "JOIN users ON users.rowid = hits.rowid")
+                tier = "hits.tier"
+            else:
+                where.append("(" + " OR ".join(f"lower({column}) LIKE ? ESCAPE '\\'"
+                                               for column in ("username", "name", "email", "phone")) + ")")
+                params += ["%" + escaped + "%"] * 4
+                tier = "3"
+            order = (f"CASE WHEN lower(username) = ? THEN 0 WHEN lower(username) LIKE ? ESCAPE '\\' THEN 1 "
+                     f"ELSE {tier} END, username")
+            order_params = [query, escaped + "%"]
+        clause = f"WHERE {' AND '.join(where)}" if where else ""
+        with self.lock:
+            if not query:
+                # Listing walks the primary key index; counting is a separate cheap scan
+                total = self.conn.execute(f"SELECT COUNT(*) FROM users {clause}", params).fetchone()[0]
+                rows = self.conn.execute(f"SELECT username FROM users {clause} ORDER BY username LIMIT ? OFFSET ?",
+                                         (*params, limit, offset)).fetchall()
+                return [row[0] for row in rows], total
+            # Matches are ranked anyway, so the total comes from the same pass
+            rows = self.conn.execute(
+                f"SELECT username, COUNT(*) OVER () FROM {source} {clause} ORDER BY {order} LIMIT ? OFFSET ?",
+                (*source_params, *params, *order_params, limit, offset)
+            ).fetchall()
+            if rows:
+                return [row[0] for row in rows], rows[0][1]
+            total = self.conn.execute(f"SELECT COUNT(*) FROM {source} {clause}",
+                                      (*source_params, *params)).fetchone()[0]
+        return [], total
+    
+    def delete_user(self, username):
+        """Delete a user with their location and activity history"""
+        with self.lock:
+            if username not in self.users:
+                return False
+            with self.transaction():
+                deleted = self.conn.execute("DELETE FROM location_history WHERE username = ?", (username,)).rowcount
+                self.conn.execute("DELETE FROM user_history WHERE username = ?", (username,))
+                self.conn.execute("DELETE FROM user_sessions WHERE username = ?", (username,))
+                self.conn.execute("DELETE FROM users WHERE username = ?", (username,))
+                self.conn.execute("INSERT INTO deletions (seq, entity, key) VALUES (?, 'user', ?)",
+                                  (self._next_seq(), username))
+            self.location_fix_count -= deleted
+            self.stats.remove_user(username, self.users.pop(username))
+            self.spatial.remove(username)
+            self.map_version += 1
+            return True
+    
+    def add_location(self, username, entry, epoch=None):
+        """Record a location fix; it becomes the current location unless a
+        newer fix is already held, in which case it is only stored in the database"""
+        if epoch is None:
+            epoch = timestamp_to_epoch(entry["timestamp"])
+        with self.lock:
+            user = self.users[username]
+            track = user["location_history"]
+            newer = not len(track) or epoch >= track.latest_epoch()
+            with self.transaction():
+                self._insert_location(username, entry)
+                if newer:
+                    self.conn.execute(
+                        "UPDATE users SET loc_lat = ?, loc_lng = ?, loc_timestamp = ?, loc_source = ? "
+                        "WHERE username = ?",
+                        (entry["lat"], entry["lng"], entry["timestamp"], entry.get("source"), username)
+                    )
+            self.location_fix_count += 1
+            if newer:
+                self._apply_location(username, entry, epoch)
+            return newer
+    
+    def add_locations(self, fixes):
+        """Record a batch of (username, entry, epoch) fixes in one transaction.
+        
+        Every fix goes to location_history; a fix only becomes the user's
+        current location if it is not older than the one they already have.
+        """
+        fixes = sorted(fixes, key=lambda fix: fix[2])
+        with self.lock:
+            newest = {}
+            accepted = []
+            for username, entry, epoch in fixes:
+                if username not in newest:
+                    track = self.users[username]["location_history"]
+                    newest[username] = track.latest_epoch() if len(track) else None
+                if newest[username] is None or epoch >= newest[username]:
+                    newest[username] = epoch
+                    accepted.append((username, entry, epoch))
+            latest = {username: entry for username, entry, _ in accepted}
+            
+            with self.transaction():
+                self.conn.executemany(
+                    "INSERT INTO location_history (username, lat, lng, timestamp, source, accuracy) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(username, entry["lat"], entry["lng"], entry["timestamp"], entry.get("source"), entry.get("accuracy"))
+                     for username, entry, _ in fixes]
+                )
+                self.conn.executemany(
+                    "UPDATE users SET loc_lat = ?, loc_lng = ?, loc_timestamp = ?, loc_source = ? WHERE username = ?",
+                    [(entry["lat"], entry["lng"], entry["timestamp"], entry.get("source"), username)
+                     for username, entry in latest.items()]
+                )
+            self.location_fix_count += len(fixes)
+            for username, entry, epoch in accepted:
+                self._apply_location(username, entry, epoch)
+        return len(latest)
+    
+    def _apply_location(self, username, entry, epoch):
+        """Update the in-memory views for a committed fix that is not older than the current one"""
+        user = self.users[username]
+        user["location_history"].append(entry["lat"], entry["lng"], epoch, entry.get("source", "unknown"))
+        user["current_location"] = dict(entry)
+        self.stats.location_fix(username, user, epoch)
+        if user.get("role") != "admin":
+            self.spatial.update(username, entry["lat"], entry["lng"])
+            self.map_version += 1
+    
+    def add_panic_event(self, event):
+        """Persist a panic event and return its id"""
+        with self.lock:
+            with self.transaction():
+                event["id"] = self._insert_event(event)
+            self.panic_events.insert(0, event)
+            self.event_index.add(event)
+            self.incidents.add(event)
+            self.stats.panic_event(event)
+            self.map_version += 1
+        return event["id"]
+    
+    def resolve_incident(self, username):
+        """Mark the user's open panic events resolved and close the incident"""
+        resolved_at = time.time()
+        with self.lock:
+            with self.transaction():
+                self.conn.execute(
+                    "UPDATE panic_events SET resolved_at = ?, changed_seq = ? WHERE username = ? AND resolved_at IS NULL",
+                    (resolved_at, self._next_seq(), username)
+                )
+            # Incidents never outlive the day they were raised, so only today's events can be open
+            for event in self.event_index.today():
+                if event["username"] == username and not event.get("resolved_at"):
+                    event["resolved_at"] = resolved_at
+            self.map_version += 1
+            return self.incidents.resolve(username) is not None
+    
+    def merge_into_incident(self, username, location):
+        """Fold a repeated panic press into the user's open incident.
         
-        st.session_state.registered_users[username]["location_history"].insert(0, location_entry)
+        The incident keeps its id and start time but moves to the latest
+        location. Returns the updated event, or None if nothing is open.
+        """
+        with self.transaction():
+            event = self.incidents.get(username)
+            if event is None:
+                return None
+            location = dict(location or {})
+            self.conn.execute(
+                "UPDATE panic_events SET lat = ?, lng = ?, accuracy = ?, changed_seq = ? WHERE id = ?",
+                (location.get("lat"), location.get("lng"), location.get("accuracy"), self._next_seq(), event["id"])
+            )
+            event["location"] = location
+            self.map_version += 1
+            return event
+    
+    def add_system_log(self, entry):
+        """Append an entry to the system log"""
+        with self.lock:
+            with self.transaction():
+                self._insert_log(entry)
+            self.system_logs.insert(0, entry)
+    
+    # -- user history --
+    def add_history(self, username, *events):
+        """Append activity history entries for ``username`` in one transaction"""
+        with self.transaction():
+            self.conn.executemany(
+                "INSERT INTO user_history (username, type, title, details, timestamp) VALUES (?, ?, ?, ?, ?)",
+                [(username, event["type"], event["title"], event.get("details"), event["timestamp"]) for event in events]
+            )
+    
+    def _history_filter(self, username, event_type=None, day=None, search=None):
+        """WHERE clause and parameters for a user's history with optional filters"""
+        where, params = ["username = ?"], [username]
+        if event_type:
+            where.append("type = ?")
+            params.append(event_type)
+        if day:
+            where.append("timestamp >= ? AND timestamp < ?")
+            params += [day, day + "\uffff"]
+        tokens = re.findall(r"\w+", (search or "").lower())
+        if tokens and self.history_fts:
+            # Every token must match, as a word prefix, in the title or details
+            where.append("id IN (SELECT rowid FROM user_history_fts WHERE user_history_fts MATCH ?)")
+            params.append(" ".join(f'"{token}"*' for token in tokens))
+        else:
+            for token in tokens:
+                where.append("(title LIKE ? OR details LIKE ?)")
+                params += [f"%{token}%", f"%{token}%"]
+        return " AND ".join(where), params
+    
+    def history_page(self, username, event_type=None, day=None, search=None, cursor=None, limit=HISTORY_PAGE_SIZE):
+        """One page of history, newest first, and the cursor of the next page (None on the last).
+        
+        The cursor is the (timestamp, id) of the last entry shown, so each
+        page is a seek on the (username, timestamp) index, not an OFFSET scan.
+        """
+        where, params = self._history_filter(username, event_type, day, search)
+        if cursor is not None:
+            where += " AND (timestamp, id) < (?, ?)"
+            params += list(cursor)
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT id, type, title, details, timestamp FROM user_history WHERE {where} "
+                "ORDER BY timestamp DESC, id DESC LIMIT ?", (*params, limit + 1)
+            ).fetchall()
+        events = [dict(row) for row in rows[:limit]]
+        next_cursor = (rows[limit - 1]["timestamp"], rows[limit - 1]["id"]) if len(rows) > limit else None
+        return events, next_cursor
+    
+    def history_count(self, username, event_type=None, day=None, search=None):
+        """Number of history entries matching the filters"""
+        where, params = self._history_filter(username, event_type, day, search)
+        with self.lock:
+            return self.conn.execute(f"SELECT COUNT(*) FROM user_history WHERE {where}", params).fetchone()[0]
+    
+    def history_type_counts(self, username):
+        """Entries per history type for ``username``"""
+        with self.lock:
+            return dict(self.conn.execute(
+                "SELECT type, COUNT(*) FROM user_history WHERE username = ? GROUP BY type", (username,)).fetchall())
+    
+    # -- sessions --
+    def load_sessions(self, now):
+        """Drop expired sessions and return the rest as (key, username, expires_at)"""
+        with self.transaction():
+            self.conn.execute("DELETE FROM user_sessions WHERE expires_at <= ?", (now,))
+            return [tuple(row) for row in self.conn.execute("SELECT session_key, username, expires_at FROM user_sessions")]
+    
+    def save_session(self, key, username, expires_at):
+        """Insert a session or move its expiry"""
+        with self.transaction():
+            self.conn.execute(
+                "INSERT INTO user_sessions (session_key, username, created_at, expires_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(session_key) DO UPDATE SET expires_at = excluded.expires_at",
+                (key, username, time.time(), expires_at)
+            )
+    
+    def delete_sessions(self, keys):
+        with self.transaction():
+            self.conn.executemany("DELETE FROM user_sessions WHERE session_key = ?", [(key,) for key in keys])
+    
+    # -- alert outbox --
+    def enqueue_alerts(self, alerts):
+        """Durably queue alert messages and return their ids.
+        
+        The commit is fsynced even though the store otherwise runs with
+        synchronous=NORMAL: once this returns, the alerts survive a power cut.
+        """
+        now = time.time()
+        timestamp = epoch_to_timestamp(now)
+        with self.lock:
+            self.conn.execute("PRAGMA synchronous=FULL")
+            try:
+                with self.transaction():
+                    ids = [self.conn.execute(
+                        "INSERT INTO alert_outbox (event_id, username, contact_name, transport, recipient, subject, "
+                        "message, next_attempt, enqueued_at, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (alert.get("event_id"), alert["username"], alert.get("contact_name"), alert["transport"],
+                         alert["recipient"], alert.get("subject"), alert["message"],
+                         alert.get("next_attempt", now), now, timestamp)
+                    ).lastrowid for alert in alerts]
+            finally:
+                self.conn.execute("PRAGMA synchronous=NORMAL")
+        return ids
+    
+    def claim_due_alerts(self, now, limit, capacity=None):
+        """Mark due alerts as sending and return them.
+        
+        ``capacity`` maps transport names to how many of their alerts may be
+        claimed; alerts for other transports, and all alerts when it is
+        None, are claimed up to ``limit``.
+        """
+        capacity = capacity or {}
+        others = ", ".join("?" * len(capacity))
+        with self.transaction():
+            rows = []
+            for transport, free in capacity.items():
+                if free > 0:
+                    rows += self.conn.execute(
+                        "SELECT * FROM alert_outbox WHERE status = 'queued' AND transport = ? AND next_attempt <= ? "
+                        "ORDER BY next_attempt LIMIT ?", (transport, now, free)
+                    ).fetchall()
+            rows += self.conn.execute(
+                f"SELECT * FROM alert_outbox WHERE status = 'queued' AND transport NOT IN ({others}) "
+                "AND next_attempt <= ? ORDER BY next_attempt LIMIT ?", (*capacity, now, limit)
+            ).fetchall()
+            self.conn.executemany("UPDATE alert_outbox SET status = 'sending' WHERE id = ?", [(row["id"],) for row in rows])
+        return [dict(row) for row in rows]
+    
+    def requeue_inflight_alerts(self):
+        """Put alerts that were being sent when the process stopped back in the queue"""
+        with self.transaction():
+            return self.conn.execute("UPDATE alert_outbox SET status = 'queued' WHERE status = 'sending'").rowcount
+    
+    def next_alert_due(self, exclude=()):
+        """Epoch when the next queued alert is due, or None; ``exclude`` skips those transports"""
+        with self.lock:
+            return self.conn.execute(
+                f"SELECT MIN(next_attempt) FROM alert_outbox WHERE status = 'queued' "
+                f"AND transport NOT IN ({', '.join('?' * len(exclude))})", tuple(exclude)
+            ).fetchone()[0]
+    
+    def finish_alert(self, alert_id, status, attempts, receipt=None, error=None, next_attempt=None):
+        """Record a delivery attempt: delivered, failed, or queued again for ``next_attempt``"""
+        with self.transaction():
+            self.conn.execute(
+                "UPDATE alert_outbox SET status = ?, attempts = ?, receipt = ?, last_error = ?, "
+                "next_attempt = COALESCE(?, next_attempt), delivered_at = ? WHERE id = ?",
+                (status, attempts, receipt, error, next_attempt, time.time() if status == "delivered" else None, alert_id)
+            )
+    
+    def alert_deliveries(self, event_id):
+        """Outbox rows for one panic event, as delivery receipts"""
+        with self.lock:
+            return [dict(row) for row in self.conn.execute(
+                "SELECT contact_name, transport, recipient, status, attempts, receipt, last_error, enqueued_at, "
+                "delivered_at FROM alert_outbox WHERE event_id = ? ORDER BY id", (event_id,))]
+    
+    def alert_queue_counts(self):
+        """Outbox rows per status"""
+        with self.lock:
+            return dict(self.conn.execute("SELECT status, COUNT(*) FROM alert_outbox GROUP BY status").fetchall())
+    
+    def get_meta(self, key, default=None):
+        """Read a JSON value from the meta table"""
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row["value"]) if row else default
+    
+    def set_meta(self, key, value):
+        """Store a JSON value in the meta table"""
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+    
+    # -- backup import --
+    def reset_for_restore(self):
+        """Delete all users with their history and sessions, events and logs ahead of a full restore"""
+        with self.transaction():
+            for table in ("location_history", "user_history", "user_sessions", "users", "panic_events", "system_logs"):
+                self.conn.execute(f"DELETE FROM {table}")
+            self.conn.execute("DELETE FROM meta WHERE key IN ('backup_high_water', 'backup_pending')")
+    
+    def import_records(self, records, overwrite=False, keep_ids=False):
+        """Write a batch of validated backup records in one transaction.
+        
+        Users are keyed by username and events by id: existing ones are kept,
+        or replaced when ``overwrite`` is set. Fixes and log entries are
+        immutable. Their ids come from the deployment that wrote the backup,
+        so they are only kept on a restore into emptied tables
+        (``keep_ids``); otherwise a fix is added unless the user already has
+        one with the same time and position, and a log entry unless an
+        identical one exists. Returns the number of records written per kind.
+        """
+        verb = "INSERT OR REPLACE" if overwrite else "INSERT OR IGNORE"
+        written = collections.Counter()
+        fixes = []
+        
+        def write_fixes():
+            if keep_ids:
+                sql = ("INSERT OR IGNORE INTO location_history (id, username, lat, lng, timestamp, source, accuracy) "
+                       "VALUES (?, ?, ?, ?, ?, ?, ?)")
+                rows = fixes
+            else:
+                sql = ("INSERT INTO location_history (username, lat, lng, timestamp, source, accuracy) "
+                       "SELECT ?, ?, ?, ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM location_history "
+                       "WHERE username = ? AND timestamp = ? AND lat = ? AND lng = ?)")
+                rows = [(username, lat, lng, timestamp, source, accuracy, username, timestamp, lat, lng)
+                        for _, username, lat, lng, timestamp, source, accuracy in fixes]
+            written["location"] += self.conn.executemany(sql, rows).rowcount
+            fixes.clear()
+        
+        with self.transaction():
+            for record in records:
+                kind = record["kind"]
+                # Runs of fixes go in one executemany; any other record flushes them first to keep order
+                if kind == "location":
+                    fixes.append((record["id"], record["username"], record["lat"], record["lng"],
+                                  record["timestamp"], record.get("source"), record.get("accuracy")))
+                    continue
+                if fixes:
+                    write_fixes()
+                if kind == "blob":
+                    self.conn.execute("INSERT OR REPLACE INTO temp.import_blobs (sha256, data) VALUES (?, ?)",
+                                      (record["sha256"], base64.b64decode(record["data"])))
+                    continue
+                if kind == "user":
+                    user = {field: value for field, value in record.items()
+                            if field not in ("kind", "username", "seq")}
+                    if user.get("profile_pic"):
+                        row = self.conn.execute("SELECT data FROM temp.import_blobs WHERE sha256 = ?",
+                                                (user["profile_pic"]["blob"],)).fetchone()
+                        user["profile_pic"] = row["data"] if row else None
+                    changed = self._insert_user(record["username"], user, verb)
+                elif kind == "deletion":
+                    self.conn.execute("DELETE FROM location_history WHERE username = ?", (record["key"],))
+                    self.conn.execute("DELETE FROM user_history WHERE username = ?", (record["key"],))
+                    changed = self.conn.execute("DELETE FROM users WHERE username = ?", (record["key"],)).rowcount
+                    if changed:
+                        self.conn.execute("INSERT INTO deletions (seq, entity, key) VALUES (?, 'user', ?)",
+                                          (self._next_seq(), record["key"]))
+                elif kind == "panic_event":
+                    changed = self._insert_event(dict(record), verb) is not None
+                else:  # system_log
+                    data = record["data"]
+                    timestamp = data.get("timestamp") if isinstance(data, dict) else None
+                    text = json.dumps(data, default=str)
+                    if keep_ids:
+                        changed = self.conn.execute(
+                            "INSERT OR IGNORE INTO system_logs (id, timestamp, data) VALUES (?, ?, ?)",
+                            (record["id"], timestamp, text)
+                        ).rowcount
+                    else:
+                        changed = self.conn.execute(
+                            "INSERT INTO system_logs (timestamp, data) SELECT ?, ? WHERE NOT EXISTS "
+                            "(SELECT 1 FROM system_logs WHERE timestamp IS ? AND data = ?)",
+                            (timestamp, text, timestamp, text)
+                        ).rowcount
+                if changed:
+                    written[kind] += 1
+            if fixes:
+                write_fixes()
+        return written
+    
+    def finish_import(self, latest_fixes):
+        """Advance current locations to newer imported fixes, drop staged blobs and reload the views"""
+        with self.transaction():
+            self.conn.executemany(
+                "UPDATE users SET loc_lat = ?, loc_lng = ?, loc_timestamp = ?, loc_source = ? "
+                "WHERE username = ? AND (loc_timestamp IS NULL OR loc_timestamp <= ?)",
+                [(fix["lat"], fix["lng"], fix["timestamp"], fix.get("source"), username, fix["timestamp"])
+                 for username, fix in latest_fixes.items()]
+            )
+            self.conn.execute("DELETE FROM temp.import_blobs")
+        self._load()
+        if not any(u.get("role") == "admin" for u in self.users.values()):
+            self.add_user("admin", default_admin_record())
+    
+    # -- retention --
+    def expired_partitions(self, cutoff_day):
+        """List (data class, username, day, rows) for every day partition before ``cutoff_day``.
+        
+        Fixes and activity history are partitioned per user and day so each
+        one is a range of a (username, timestamp) index; events and logs per day.
+        """
+        partitions = []
+        with self.snapshot() as conn:
+            for data_class in ("location", "history"):
+                partitions += [(data_class, row[0], row[1], row[2]) for row in conn.execute(
+                    f"SELECT username, substr(timestamp, 1, 10) AS day, COUNT(*) FROM {RETENTION_TABLES[data_class][0]} "
+                    "WHERE timestamp < ? GROUP BY username, day", (cutoff_day,))]
+            for data_class in ("panic_event", "alert", "system_log"):
+                partitions += [(data_class, None, row[0], row[1]) for row in conn.execute(
+                    f"SELECT substr(timestamp, 1, 10) AS day, COUNT(*) FROM {RETENTION_TABLES[data_class][0]} "
+                    "WHERE timestamp < ? GROUP BY day", (cutoff_day,))]
+        return partitions
+    
+    def drop_partitions(self, partitions, rollup=True):
+        """Delete (data class, username, day) partitions in one transaction.
+        
+        With ``rollup`` each partition is first counted into daily_rollups.
+        Returns (rows deleted per data class, rollup rows written).
+        """
+        deleted = collections.Counter()
+        rolled_up = 0
+        with self.lock:
+            with self.transaction():
+                for data_class, username, day in partitions:
+                    table, key = RETENTION_TABLES[data_class]
+                    # Every timestamp in the partition starts with ``day``, so this is one index range
+                    where, params = "timestamp >= ? AND timestamp < ?", (day, day + "\uffff")
+                    if username is not None:
+                        where, params = "username = ? AND " + where, (username, *params)
+                    if rollup:
+                        counts = self.conn.execute(
+                            f"SELECT {key}, COUNT(*) FROM {table} WHERE {where} GROUP BY 1", params).fetchall()
+                        self.conn.executemany(
+                            "INSERT INTO daily_rollups (day, data_class, key, count) VALUES (?, ?, ?, ?) "
+                            "ON CONFLICT (day, data_class, key) DO UPDATE SET count = count + excluded.count",
+                            [(day, data_class, row[0], row[1]) for row in counts]
+                        )
+                        rolled_up += len(counts)
+                    deleted[data_class] += self.conn.execute(f"DELETE FROM {table} WHERE {where}", params).rowcount
+            self.location_fix_count -= deleted["location"]
+        return deleted, rolled_up
+    
+    def drop_expired_views(self, cutoff_epoch, cutoff_day):
+        """Drop expired fixes, events and log entries from the in-memory views"""
+        with self.lock:
+            for user in self.users.values():
+                user["location_history"].drop_before(cutoff_epoch)
+            dropped = self.event_index.drop_before(cutoff_epoch)
+            if dropped:
+                self.panic_events[:] = [event for event in self.panic_events if event["ts"] >= cutoff_epoch]
+                self.stats.remove_events(dropped)
+                self.map_version += 1
+            self.system_logs[:] = [
+                entry for entry in self.system_logs
+                if not (isinstance(entry, dict) and entry.get("timestamp") and str(entry["timestamp"]) < cutoff_day)
+            ]
+    
+    def free_bytes(self):
+        """Bytes on the database free list, reused by later writes"""
+        with self.lock:
+            pages = self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+            return pages * self.conn.execute("PRAGMA page_size").fetchone()[0]
+    
+    def replace_all(self, users=None, panic_events=None, system_logs=None):
+        """Replace whole collections, e.g. when restoring a backup"""
+        with self.lock:
+            with self.transaction():
+                if users is not None:
+                    self.conn.execute("DELETE FROM location_history")
+                    self.conn.execute("DELETE FROM user_history")
+                    self.conn.execute("DELETE FROM user_sessions")
+                    self.conn.execute("DELETE FROM users")
+                    for username, user in users.items():
+                        self._insert_user(username, user)
+                if panic_events is not None:
+                    self.conn.execute("DELETE FROM panic_events")
+                    for event in reversed(panic_events):
+                        event["id"] = self._insert_event(event)
+                if system_logs is not None:
+                    self.conn.execute("DELETE FROM system_logs")
+                    for entry in reversed(system_logs):
+                        self._insert_log(entry)
+                # Wholesale replacement is not expressible as a change set; the next backup must be full
+                self.conn.execute("DELETE FROM meta WHERE key IN ('backup_high_water', 'backup_pending')")
+            
+            # Rebuild in place so every session holding these objects sees the restore
+            self._load()
+    
+    # -- reads --
+    def users_snapshot(self):
+        """(username, user) pairs copied under the lock, safe to iterate while other threads write"""
+        with self.lock:
+            return list(self.users.items())
+    
+    def location_history_stamp(self, username):
+        """(count, newest id) of a user's stored fixes; changes whenever fixes are added or removed"""
+        with self.lock:
+            return tuple(self.conn.execute(
+                "SELECT COUNT(*), COALESCE(MAX(id), 0) FROM location_history WHERE username = ?", (username,)
+            ).fetchone())
+    
+    def location_track(self, username):
+        """(stamp, lat, lng) with a user's stored fixes as oldest-first arrays"""
+        with self.lock:
+            stamp = self.location_history_stamp(username)
+            rows = self.conn.execute(
+                "SELECT lat, lng FROM location_history WHERE username = ? ORDER BY timestamp, id", (username,)
+            ).fetchall()
+        points = np.array(rows, dtype=np.float64).reshape(-1, 2)
+        return stamp, points[:, 0].copy(), points[:, 1].copy()
+    
+    def recent_locations(self, limit=10):
+        """Newest current locations of non-admin users, newest first"""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT name, loc_lat, loc_lng, loc_timestamp, loc_source FROM users "
+                "WHERE loc_timestamp IS NOT NULL AND role != 'admin' "
+                "ORDER BY loc_timestamp DESC LIMIT ?", (limit,)
+            ).fetchall()
+
+
+@st.cache_resource
+def get_store():
+    """Open the state store shared by all sessions"""
+    return SafeTapStore(SAFETAP_DB_PATH)
+
+# ---- GPS Fix Ingestion Endpoint ----
+# Local HTTP endpoint for batched fixes from tracking clients:
+#   POST /fixes  {"fixes": [{"user": ..., "lat": ..., "lng": ..., "accuracy": ..., "timestamp": ...}]}
+#   GET  /health
+# Clients must send "Authorization: Bearer $SAFETAP_INGEST_TOKEN"; the endpoint
+# only starts once that token is set. SAFETAP_INGEST_PORT=0 disables it outright.
+INGEST_HOST = os.environ.get("SAFETAP_INGEST_HOST", "127.0.0.1")
+INGEST_PORT = int(os.environ.get("SAFETAP_INGEST_PORT", 8765))
+INGEST_TOKEN = os.environ.get("SAFETAP_INGEST_TOKEN")
+INGEST_MAX_BODY = 8 * 1024 * 1024
+INGEST_MAX_FUTURE_SECONDS = 300
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def validate_fix(fix, users, now):
+    """Check one submitted fix; return (username, entry, epoch) or raise ValueError"""
+    if not isinstance(fix, dict):
+        raise ValueError("fix must be an object")
+    username = fix.get("user", fix.get("username"))
+    if username not in users:
+        raise ValueError("unknown user")
+    lat, lng = fix.get("lat"), fix.get("lng")
+    if not _is_number(lat) or not -90 <= lat <= 90:
+        raise ValueError("invalid lat")
+    if not _is_number(lng) or not -180 <= lng <= 180:
+        raise ValueError("invalid lng")
+    accuracy = fix.get("accuracy")
+    if accuracy is not None and (not _is_number(accuracy) or accuracy < 0):
+        raise ValueError("invalid accuracy")
+    
+    timestamp = fix.get("timestamp")
+    if timestamp is None:
+        epoch = int(now)
+    elif _is_number(timestamp):
+        epoch = int(timestamp)
+    elif isinstance(timestamp, str):
+        epoch = timestamp_to_epoch(timestamp)
+    else:
+        raise ValueError("invalid timestamp")
+    if epoch > now + INGEST_MAX_FUTURE_SECONDS:
+        raise ValueError("timestamp in the future")
+    if epoch < 0:
+        raise ValueError("timestamp before 1970")
+    
+    entry = {
+        "lat": float(lat),
+        "lng": float(lng),
+        "timestamp": epoch_to_timestamp(epoch),
+        "source": "gps"
+    }
+    if accuracy is not None:
+        entry["accuracy"] = float(accuracy)
+    return username, entry, epoch
+
+
+class FixIngestServer:
+    """asyncio HTTP server that validates fix batches and writes them through the store.
+
+    Runs its own event loop on a daemon thread; database writes go to a
+    single worker thread so the loop keeps accepting requests meanwhile.
+    """
+    
+    def __init__(self, store, host, port, token=None):
+        self.store = store
+        self.host = host
+        self.port = port
+        self.token = token
+        self.error = None
+        self.running = False
+        self.batches = 0
+        self.fixes_accepted = 0
+        self.fixes_rejected = 0
+        self.busy_seconds = 0.0
+        self._started = threading.Event()
+        self._writer = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="safetap-ingest")
+    
+    def start(self, timeout=5):
+        threading.Thread(target=self._run, name="safetap-ingest-loop", daemon=True).start()
+        self._started.wait(timeout)
+        return self.running
+    
+    def _run(self):
+        try:
+            asyncio.run(self._serve())
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            self.running = False
+            self._started.set()
+    
+    async def _serve(self):
+        server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = server.sockets[0].getsockname()[1]  # resolves port 0 to the one bound
+        self.running = True
+        self._started.set()
+        async with server:
+            await server.serve_forever()
+    
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                
+                length = int(headers.get("content-length") or 0)
+                if length > INGEST_MAX_BODY:
+                    await self._respond(writer, 413, {"error": "request too large"}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                
+                status, payload = await self._route(method, path.split("?", 1)[0], headers, body)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+    
+    async def _respond(self, writer, status, payload, keep_alive=True):
+        body = json.dumps(payload).encode("utf-8")
+        reason = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found",
+                  413: "Payload Too Large"}.get(status, "OK")
+        writer.write(
+            f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+            .encode("latin-1") + body
+        )
+        await writer.drain()
+    
+    async def _route(self, method, path, headers, body):
+        if path == "/health" and method == "GET":
+            return 200, self.metrics()
+        if path != "/fixes" or method != "POST":
+            return 404, {"error": "not found"}
+        if not self.token or not hmac.compare_digest(headers.get("authorization", "").encode("latin-1"),
+                                                     f"Bearer {self.token}".encode("utf-8")):
+            return 401, {"error": "unauthorized"}
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return 400, {"error": "invalid JSON"}
+        fixes = data.get("fixes") if isinstance(data, dict) else data
+        if not isinstance(fixes, list):
+            return 400, {"error": "expected a list of fixes"}
+        
+        started = time.perf_counter()
+        accepted, rejected = [], []
+        now = time.time()
+        users = self.store.users
+        for i, fix in enumerate(fixes):
+            try:
+                accepted.append(validate_fix(fix, users, now))
+            except (ValueError, TypeError, OverflowError, OSError) as e:
+                rejected.append({"index": i, "error": str(e)})
+        
+        current = 0
+        if accepted:
+            loop = asyncio.get_running_loop()
+            current = await loop.run_in_executor(self._writer, self.store.add_locations, accepted)
+        
+        self.batches += 1
+        self.fixes_accepted += len(accepted)
+        self.fixes_rejected += len(rejected)
+        self.busy_seconds += time.perf_counter() - started
+        return 200, {"accepted": len(accepted), "current": current, "rejected": rejected}
+    
+    def metrics(self):
+        return {
+            "running": self.running,
+            "batches": self.batches,
+            "fixes_accepted": self.fixes_accepted,
+            "fixes_rejected": self.fixes_rejected,
+            "avg_batch_ms": self.busy_seconds * 1000 / self.batches if self.batches else 0.0
+        }
+
+
+@st.cache_resource
+def get_fix_ingest_server():
+    """Start the fix ingestion endpoint once per process"""
+    server = FixIngestServer(get_store(), INGEST_HOST, INGEST_PORT, INGEST_TOKEN)
+    if INGEST_PORT and INGEST_TOKEN:
+        server.start()
+    return server
+
+# ---- Alert Dispatch ----
+# Panic alerts are written to the alert_outbox table and delivered by an asyncio
+# dispatcher on its own thread, so the panic action returns once the messages
+# are durably queued. Each transport has its own concurrency limit; failed
+# sends are retried with exponential backoff and every delivery stores the
+# transport's receipt. Configure real transports with:
+#   SAFETAP_SMTP_HOST / _PORT / _USER / _PASSWORD / _SENDER   (email)
+#   SAFETAP_SMS_GATEWAY_URL / SAFETAP_SMS_GATEWAY_TOKEN        (sms, JSON POST)
+# Unconfigured channels use local stand-ins that only record the message.
+ALERT_MAX_ATTEMPTS = 6
+ALERT_BACKOFF_SECONDS = 2.0
+ALERT_BACKOFF_MAX_SECONDS = 300.0
+ALERT_SEND_TIMEOUT = 20.0
+ALERT_CLAIM_BATCH = 100  # alerts for unconfigured transports claimed per pass; they fail at once
+
+
+class AlertRejected(Exception):
+    """A transport refused the message for good; it is not retried"""
+
+
+class AlertTransport:
+    """Delivers one message over a channel. ``send`` returns a receipt id."""
+    
+    name = "base"
+    concurrency = 4
+    
+    async def send(self, recipient, subject, message):
+        raise NotImplementedError
+
+
+class SmtpTransport(AlertTransport):
+    """Email through an SMTP relay; smtplib runs in a worker thread"""
+    
+    name = "email"
+    
+    def __init__(self, host, port=587, sender="alerts@safetap.local", username=None, password=None,
+                 starttls=True, concurrency=4):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.concurrency = concurrency
+    
+    async def send(self, recipient, subject, message):
+        return await asyncio.to_thread(self._send, recipient, subject, message)
+    
+    def _send(self, recipient, subject, message):
+        email = EmailMessage()
+        email["From"] = self.sender
+        email["To"] = recipient
+        email["Subject"] = subject or "SafeTap emergency alert"
+        email["Message-ID"] = make_msgid(domain=self.sender.rpartition("@")[2] or None)
+        email.set_content(message)
+        try:
+            with smtplib.SMTP(self.host, self.port, timeout=ALERT_SEND_TIMEOUT) as smtp:
+                if self.starttls:
+                    smtp.starttls()
+                if self.username:
+                    smtp.login(self.username, self.password or "")
+                smtp.send_message(email)
+        except smtplib.SMTPRecipientsRefused as e:
+            raise AlertRejected(f"recipient refused: {e.recipients}") from e
+        return email["Message-ID"]
+
+
+class HttpSmsTransport(AlertTransport):
+    """SMS through an HTTP gateway: POST {"to", "message"} as JSON"""
+    
+    name = "sms"
+    
+    def __init__(self, url, token=None, concurrency=16):
+        self.url = url
+        self.token = token
+        self.concurrency = concurrency
+    
+    async def send(self, recipient, subject, message):
+        return await asyncio.to_thread(self._send, recipient, message)
+    
+    def _send(self, recipient, message):
+        request = urllib.request.Request(
+            self.url, data=json.dumps({"to": recipient, "message": message}).encode("utf-8"), method="POST",
+            headers={"Content-Type": "application/json",
+                     **({"Authorization": f"Bearer {self.token}"} if self.token else {})}
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=ALERT_SEND_TIMEOUT) as response:
+                body = response.read()
+        except urllib.error.HTTPError as e:
+            # Client errors other than rate limiting will not succeed on retry
+            if 400 <= e.code < 500 and e.code != 429:
+                raise AlertRejected(f"gateway rejected the message ({e.code})") from e
+            raise
+        try:
+            data = json.loads(body or b"{}")
+        except ValueError:
+            data = {}
+        receipt = data.get("id") or data.get("message_id") if isinstance(data, dict) else None
+        return str(receipt or f"http-{response.status}")
+
+
+class LocalTransport(AlertTransport):
+    """Stand-in that keeps messages in memory after a simulated send delay"""
+    
+    def __init__(self, name, latency=0.05, failure_rate=0.0, concurrency=8):
+        self.name = name
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.concurrency = concurrency
+        self.sent = collections.deque(maxlen=1000)
+    
+    async def send(self, recipient, subject, message):
+        await asyncio.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            raise ConnectionError("simulated delivery failure")
+        receipt = f"local-{uuid.uuid4().hex[:12]}"
+        self.sent.append({"receipt": receipt, "to": recipient, "subject": subject, "message": message})
+        return receipt
+
+
+def configured_alert_transports():
+    """Transports from the environment, with local stand-ins for the rest"""
+    transports = {"email": LocalTransport("email"), "sms": LocalTransport("sms")}
+    if os.environ.get("SAFETAP_SMTP_HOST"):
+        transports["email"] = SmtpTransport(
+            os.environ["SAFETAP_SMTP_HOST"],
+            int(os.environ.get("SAFETAP_SMTP_PORT", 587)),
+            os.environ.get("SAFETAP_SMTP_SENDER", "alerts@safetap.local"),
+            os.environ.get("SAFETAP_SMTP_USER"),
+            os.environ.get("SAFETAP_SMTP_PASSWORD")
+        )
+    if os.environ.get("SAFETAP_SMS_GATEWAY_URL"):
+        transports["sms"] = HttpSmsTransport(os.environ["SAFETAP_SMS_GATEWAY_URL"],
+                                             os.environ.get("SAFETAP_SMS_GATEWAY_TOKEN"))
+    return transports
+
+
+class AlertDispatcher:
+    """asyncio loop on a daemon thread that drains the alert outbox.
+    
+    Database calls go to a single worker thread, as in FixIngestServer, so
+    slow sends and queue bookkeeping never block each other.
+    """
+    
+    def __init__(self, store, transports):
+        self.store = store
+        self.transports = dict(transports)
+        self.error = None
+        self.running = False
+        self.delivered = 0
+        self.retried = 0
+        self.failed = 0
+        self.latencies = collections.deque(maxlen=1000)  # enqueue -> receipt, seconds
+        self._loop = None
+        self._wakeup = None
+        self._busy = collections.Counter()  # claimed, unfinished alerts per transport
+        self._inflight = set()
+        self._started = threading.Event()
+        self._db = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="safetap-alerts-db")
+    
+    def register(self, transport):
+        """Add or replace the transport for ``transport.name``"""
+        self.transports[transport.name] = transport
+    
+    def start(self, timeout=5):
+        threading.Thread(target=self._run, name="safetap-alerts", daemon=True).start()
+        self._started.wait(timeout)
+        return self.running
+    
+    def notify(self):
+        """Wake the dispatcher after alerts were queued (thread-safe)"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+    
+    def _run(self):
+        try:
+            asyncio.run(self._serve())
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            self.running = False
+            self._started.set()
+    
+    async def _call(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._db, function, *args)
+    
+    async def _serve(self):
+        self._wakeup = asyncio.Event()
+        await self._call(self.store.requeue_inflight_alerts)
+        self._loop = asyncio.get_running_loop()
+        self.running = True
+        self._started.set()
+        while True:
+            self._wakeup.clear()
+            # Claims never exceed a transport's free concurrency, so no claimed alert waits for a slot
+            capacity = {name: max(1, transport.concurrency) - self._busy[name]
+                        for name, transport in self.transports.items()}
+            alerts = await self._call(self.store.claim_due_alerts, time.time(), ALERT_CLAIM_BATCH, capacity)
+            for alert in alerts:
+                self._busy[alert["transport"]] += 1
+                task = asyncio.create_task(self._deliver(alert))
+                self._inflight.add(task)
+                task.add_done_callback(self._inflight.discard)
+            if alerts:
+                continue
+            # Transports with no free slot are woken by a finishing delivery, not by their due time
+            full = [name for name, free in capacity.items() if free <= 0]
+            due = await self._call(self.store.next_alert_due, full)
+            timeout = None if due is None else max(due - time.time(), 0.0)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+    
+    async def _deliver(self, alert):
+        attempts = alert["attempts"] + 1
+        try:
+            transport = self.transports.get(alert["transport"])
+            if transport is None:
+                raise AlertRejected(f"no {alert['transport']} transport configured")
+            receipt = await asyncio.wait_for(
+                transport.send(alert["recipient"], alert["subject"], alert["message"]), ALERT_SEND_TIMEOUT)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if isinstance(e, AlertRejected) or attempts >= ALERT_MAX_ATTEMPTS:
+                await self._call(self.store.finish_alert, alert["id"], "failed", attempts, None, error)
+                self.failed += 1
+            else:
+                # Exponential backoff with jitter so a gateway outage is not hammered in lockstep
+                delay = min(ALERT_BACKOFF_SECONDS * 2 ** (attempts - 1), ALERT_BACKOFF_MAX_SECONDS)
+                await self._call(self.store.finish_alert, alert["id"], "queued", attempts, None, error,
+                                 time.time() + delay * random.uniform(0.5, 1.0))
+                self.retried += 1
+        else:
+            await self._call(self.store.finish_alert, alert["id"], "delivered", attempts, str(receipt))
+            self.delivered += 1
+            self.latencies.append(time.time() - alert["enqueued_at"])
+        finally:
+            self._busy[alert["transport"]] -= 1
+            self._wakeup.set()
+    
+    def metrics(self):
+        latencies = sorted(self.latencies)
+        
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000 if latencies else 0.0
+        
+        return {
+            "running": self.running,
+            "delivered": self.delivered,
+            "retried": self.retried,
+            "failed": self.failed,
+            "in_flight": len(self._inflight),
+            "p50_ms": percentile(0.5),
+            "p95_ms": percentile(0.95)
+        }
+
+
+@st.cache_resource
+def get_alert_dispatcher():
+    """Start the alert dispatcher once per process"""
+    dispatcher = AlertDispatcher(get_store(), configured_alert_transports())
+    dispatcher.start()
+    return dispatcher
+
+# Panic presses are rate limited before they fan out. A repeat of the same
+# emergency type inside the cooldown, or a burst beyond the per-user token
+# bucket, is merged into the user's open incident. A global token bucket on
+# outgoing messages paces mass events: alerts are still queued, but their
+# first send is spread out so the dispatcher and gateways are not flooded.
+ALERT_COOLDOWN_SECONDS = 300
+ALERT_USER_BURST = 3                 # fan-outs a user can trigger back to back
+ALERT_USER_REFILL_SECONDS = 60       # one more fan-out allowed per interval
+ALERT_GLOBAL_RATE = 50.0             # messages per second across all users
+ALERT_GLOBAL_BURST = 500
+ALERT_LIMITER_MAX_KEYS = 100_000     # per table; oldest entries go first
+
+
+class AlertRateLimiter:
+    """Per-user and per-emergency-type admission plus global pacing.
+    
+    State lives in two OrderedDicts kept in last-touched order. Entries
+    whose cooldown has passed or whose bucket has refilled carry no
+    information and are pruned from the front, and each table is capped at
+    ALERT_LIMITER_MAX_KEYS, so memory stays bounded however many users
+    there are. Evicting an entry early can only admit an extra alert.
+    """
+    
+    def __init__(self, store):
+        self.store = store
+        self.cooldown = (store.get_meta("alert_limits") or {}).get("cooldown", ALERT_COOLDOWN_SECONDS)
+        self.admitted = 0
+        self.merged = 0
+        self.paced = 0
+        self.max_delay = 0.0
+        self._recent = collections.OrderedDict()   # (username, emergency type) -> last fan-out epoch
+        self._buckets = collections.OrderedDict()  # username -> (tokens, epoch)
+        self._global = (float(ALERT_GLOBAL_BURST), time.time())
+        self._lock = threading.Lock()
+    
+    def configure(self, cooldown):
+        cooldown = int(cooldown)
+        if cooldown != self.cooldown:
+            self.cooldown = cooldown
+            self.store.set_meta("alert_limits", {"cooldown": cooldown})
+    
+    def _prune(self, now):
+        while self._recent and (len(self._recent) > ALERT_LIMITER_MAX_KEYS
+                                or next(iter(self._recent.values())) + self.cooldown <= now):
+            self._recent.popitem(last=False)
+        full_after = ALERT_USER_BURST * ALERT_USER_REFILL_SECONDS
+        while self._buckets and (len(self._buckets) > ALERT_LIMITER_MAX_KEYS
+                                 or next(iter(self._buckets.values()))[1] + full_after <= now):
+            self._buckets.popitem(last=False)
+    
+    def admit(self, username, emergency_type, can_merge=True):
+        """Record a fan-out and return True, or False if the press should be merged.
+        
+        Pass ``can_merge=False`` when the user has no open incident: there is
+        nothing to merge into, so the alert always goes out.
+        """
+        now = time.time()
+        key = (username, emergency_type)
+        with self._lock:
+            self._prune(now)
+            last = self._recent.get(key)
+            tokens, updated = self._buckets.get(username, (float(ALERT_USER_BURST), now))
+            tokens = min(float(ALERT_USER_BURST), tokens + (now - updated) / ALERT_USER_REFILL_SECONDS)
+            if can_merge and ((last is not None and now - last < self.cooldown) or tokens < 1):
+                self.merged += 1
+                return False
+            self._recent[key] = now
+            self._recent.move_to_end(key)
+            self._buckets[username] = (max(tokens - 1, 0.0), now)
+            self._buckets.move_to_end(username)
+            self.admitted += 1
+            return True
+    
+    def pace(self, messages):
+        """Take ``messages`` from the global bucket; return how long their first send should wait"""
+        now = time.time()
+        with self._lock:
+            tokens, updated = self._global
+            tokens = min(float(ALERT_GLOBAL_BURST), tokens + (now - updated) * ALERT_GLOBAL_RATE) - messages
+            self._global = (tokens, now)
+            if tokens >= 0:
+                return 0.0
+            delay = -tokens / ALERT_GLOBAL_RATE
+            self.paced += messages
+            self.max_delay = max(self.max_delay, delay)
+            return delay
+    
+    def metrics(self):
+        return {
+            "admitted": self.admitted,
+            "merged": self.merged,
+            "paced": self.paced,
+            "max_delay": self.max_delay,
+            "tracked": len(self._recent) + len(self._buckets)
+        }
+
+
+@st.cache_resource
+def get_alert_limiter():
+    """Share one alert rate limiter across sessions"""
+    return AlertRateLimiter(get_store())
+
+# ---- Panic Hold Timers ----
+# A held panic button fires from this timer thread at exactly the configured
+# duration instead of waiting for the browser's next rerun. The countdown on
+# screen is a fragment that refreshes itself; it only reads the hold's state.
+PANIC_HOLD_REFRESH_SECONDS = 0.2
+PANIC_HOLD_KEEP_SECONDS = 3600  # fired holds nobody collected are dropped after this
+
+
+class PanicHoldTimers:
+    """Runs callbacks at their due time on one daemon thread.
+    
+    Holds sit in a min-heap by due time and the thread sleeps on a
+    Condition until the earliest is due, so firing does not depend on
+    polling. Trigger jitter (fire time minus due time) is kept for metrics.
+    """
+    
+    def __init__(self):
+        self.holds = {}   # hold id -> {"id", "due", "state", "result", ...}
+        self.jitter = collections.deque(maxlen=1000)
+        self.fired = 0
+        self._heap = []   # (due, hold id)
+        self._cond = threading.Condition()
+    
+    def start(self):
+        threading.Thread(target=self._loop, name="safetap-panic-timers", daemon=True).start()
+    
+    def arm(self, due, callback, *args):
+        """Run ``callback(*args)`` at epoch ``due``; returns the hold id"""
+        hold_id = uuid.uuid4().hex
+        with self._cond:
+            self.holds[hold_id] = {"id": hold_id, "due": due, "state": "armed", "result": None,
+                                   "callback": callback, "args": args}
+            heapq.heappush(self._heap, (due, hold_id))
+            self._cond.notify()
+        return hold_id
+    
+    def cancel(self, hold_id):
+        """Cancel an armed hold; False if it has already fired (or is firing)"""
+        with self._cond:
+            hold = self.holds.get(hold_id)
+            if hold is None or hold["state"] != "armed":
+                return hold is None
+            del self.holds[hold_id]
+            return True
+    
+    def get(self, hold_id):
+        with self._cond:
+            return self.holds.get(hold_id)
+    
+    def discard(self, hold_id):
+        with self._cond:
+            self.holds.pop(hold_id, None)
+    
+    def _loop(self):
+        while True:
+            with self._cond:
+                while True:
+                    now = time.time()
+                    if self._heap and self._heap[0][0] <= now:
+                        due, hold_id = heapq.heappop(self._heap)
+                        hold = self.holds.get(hold_id)
+                        if hold is not None and hold["state"] == "armed":
+                            hold["state"] = "firing"
+                            break
+                    else:
+                        self._cond.wait(self._heap[0][0] - now if self._heap else None)
+            self.jitter.append(time.time() - due)
+            try:
+                result = hold["callback"](*hold["args"])
+            except Exception as e:
+                result = {"level": "error", "event_id": None, "message": f"❌ Alert failed: {e}"}
+            with self._cond:
+                hold.update(state="fired", result=result, fired_at=time.time(), callback=None, args=None)
+                self.fired += 1
+                # Sessions that closed before collecting their result leave fired holds behind
+                stale = [h for h, record in self.holds.items()
+                         if record["state"] == "fired" and record["fired_at"] < time.time() - PANIC_HOLD_KEEP_SECONDS]
+                for h in stale:
+                    del self.holds[h]
+    
+    def metrics(self):
+        jitter = sorted(self.jitter)
+        
+        def percentile(p):
+            return jitter[min(len(jitter) - 1, int(p * len(jitter)))] * 1000 if jitter else 0.0
+        
+        return {"fired": self.fired, "armed": sum(1 for h in list(self.holds.values()) if h["state"] == "armed"),
+                "p50_ms": percentile(0.5), "p95_ms": percentile(0.95), "max_ms": jitter[-1] * 1000 if jitter else 0.0}
+
+
+@st.cache_resource
+def get_panic_timers():
+    """Start the panic hold timer thread once per process"""
+    timers = PanicHoldTimers()
+    timers.start()
+    return timers
+
+# ---- Credential Hashing ----
+# Passwords are stored as "scrypt$n$r$p$salt$hash". The scrypt cost n is
+# calibrated at startup so one hash takes about PASSWORD_HASH_TARGET_SECONDS
+# on this machine. Hashing runs on a pool of PASSWORD_HASH_WORKERS threads,
+# which is a deliberate concurrency limit: every hash holds 128 * r * n bytes
+# and a full core, so a burst of sign-ins runs at most that many at once and
+# the rest queue, instead of every session thread hashing in parallel.
+# hashlib releases the GIL, so the hashes that do run use separate cores.
+# Records in any other form are legacy plaintext: they are checked in
+# constant time and rehashed on the next successful login.
+PASSWORD_HASH_TARGET_SECONDS = 0.05
+PASSWORD_HASH_WORKERS = min(4, os.cpu_count() or 1)
+PASSWORD_SCRYPT_R = 8
+PASSWORD_SCRYPT_P = 1
+PASSWORD_SCRYPT_MIN_N = 2 ** 12
+PASSWORD_SCRYPT_MAX_N = 2 ** 20
+
+
+class CredentialEngine:
+    """Hashes and verifies passwords on a bounded thread pool.
+    
+    Callers block until their hash is done; the pool only caps how many
+    hashes run at the same time.
+    """
+    
+    def __init__(self, target_seconds=PASSWORD_HASH_TARGET_SECONDS, workers=PASSWORD_HASH_WORKERS):
+        self.workers = workers
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="safetap-credentials")
+        self.n = self._calibrate(target_seconds)
+        started = time.perf_counter()
+        self._dummy = self._hash(secrets.token_urlsafe())  # verified against for unknown users, to keep timing uniform
+        self.hash_seconds = time.perf_counter() - started
+        self.verified = 0
+        self.rehashed = 0
+    
+    @staticmethod
+    def _scrypt(password, salt, n, r, p):
+        return hashlib.scrypt(password.encode("utf-8"), salt=salt, n=n, r=r, p=p,
+                              maxmem=256 * r * n, dklen=32)
+    
+    def _calibrate(self, target_seconds):
+        """Power-of-two scrypt n whose hash time is nearest the target"""
+        n = PASSWORD_SCRYPT_MIN_N
+        elapsed = min(self._time(n) for _ in range(2))
+        while n < PASSWORD_SCRYPT_MAX_N and elapsed * 1.5 < target_seconds:
+            n *= 2
+            elapsed *= 2
+        return n
+    
+    def _time(self, n):
+        started = time.perf_counter()
+        self._scrypt("calibration", b"\0" * 16, n, PASSWORD_SCRYPT_R, PASSWORD_SCRYPT_P)
+        return time.perf_counter() - started
+    
+    def _hash(self, password):
+        salt = os.urandom(16)
+        digest = self._scrypt(password, salt, self.n, PASSWORD_SCRYPT_R, PASSWORD_SCRYPT_P)
+        return "$".join(["scrypt", str(self.n), str(PASSWORD_SCRYPT_R), str(PASSWORD_SCRYPT_P),
+                         base64.b64encode(salt).decode("ascii"), base64.b64encode(digest).decode("ascii")])
+    
+    def _verify(self, stored, password):
+        parts = stored.split("$")
+        if len(parts) == 6 and parts[0] == "scrypt":
+            try:
+                n, r, p = (int(value) for value in parts[1:4])
+                salt, digest = base64.b64decode(parts[4]), base64.b64decode(parts[5])
+                computed = self._scrypt(password, salt, n, r, p)
+            except (ValueError, OverflowError):
+                return False, None  # malformed record or parameters scrypt rejects
+            ok = hmac.compare_digest(computed, digest)
+            stale = (n, r, p) != (self.n, PASSWORD_SCRYPT_R, PASSWORD_SCRYPT_P)
+        else:
+            ok = hmac.compare_digest(stored.encode("utf-8"), password.encode("utf-8"))
+            stale = True
+        return ok, (self._hash(password) if ok and stale else None)
+    
+    def hash(self, password):
+        """Hash a new password"""
+        return self._pool.submit(self._hash, password).result()
+    
+    def verify(self, stored, password):
+        """Check ``password`` against a stored record: (ok, replacement hash or None).
+        
+        The replacement is set when the record is plaintext or was hashed with
+        other parameters and should be saved in its place. ``stored=None``
+        (unknown user) costs the same as a real check and always fails.
+        """
+        ok, rehash = self._pool.submit(self._verify, stored or self._dummy, password).result()
+        self.verified += 1
+        if stored is None:
+            return False, None
+        if rehash:
+            self.rehashed += 1
+        return ok, rehash
+
+
+@st.cache_resource
+def get_credential_engine():
+    """Calibrate the password hasher once per process"""
+    return CredentialEngine()
+
+# ---- Sign-in Sessions ----
+# Signing in issues a token "<session id>.<HMAC>" that the browser keeps in a
+# cookie. A reload or a reconnect after a restart resumes the session from
+# the cookie with an HMAC check and a dict lookup, without hashing the
+# password again. Sessions slide forward while in use and end after the
+# admin's Session Timeout of inactivity.
+SESSION_COOKIE = "safetap_session"
+SESSION_COOKIE_MAX_AGE = 30 * 24 * 3600  # the server decides expiry; the cookie just has to outlive it
+SESSION_TIMEOUTS = {"15 minutes": 900, "30 minutes": 1800, "1 hour": 3600, "4 hours": 4 * 3600, "8 hours": 8 * 3600}
+SESSION_DEFAULT_TIMEOUT = "1 hour"
+SESSION_REFRESH_FRACTION = 0.25  # persist a new expiry once this share of the timeout has passed
+
+
+class SessionManager:
+    """Signed session tokens backed by the store's user_sessions table.
+    
+    Live sessions are a dict keyed by the SHA-256 of the session id, plus a
+    min-heap with one expiry entry per session. Validating only moves the
+    session's expiry in the dict; an entry popped before its session's
+    current expiry is pushed back, so validation is O(1) and expiry
+    O(log n) per session.
+    """
+    
+    def __init__(self, store):
+        self.store = store
+        secret = store.get_meta("session_secret")
+        if secret is None:
+            secret = secrets.token_hex(32)
+            store.set_meta("session_secret", secret)
+        self._secret = bytes.fromhex(secret)
+        self.timeout_label = (store.get_meta("session_settings") or {}).get("timeout", SESSION_DEFAULT_TIMEOUT)
+        self.sessions = {}  # session key -> {"username", "expires_at", "saved_at"}
+        self._heap = []     # (expires_at, session key)
+        self._lock = threading.Lock()
+        self.resumed = 0
+        now = time.time()
+        for key, username, expires_at in store.load_sessions(now):
+            self.sessions[key] = {"username": username, "expires_at": expires_at, "saved_at": now}
+            self._heap.append((expires_at, key))
+        heapq.heapify(self._heap)
+    
+    @property
+    def timeout(self):
+        return SESSION_TIMEOUTS.get(self.timeout_label, SESSION_TIMEOUTS[SESSION_DEFAULT_TIMEOUT])
+    
+    def configure(self, timeout_label):
+        if timeout_label != self.timeout_label and timeout_label in SESSION_TIMEOUTS:
+            self.timeout_label = timeout_label
+            self.store.set_meta("session_settings", {"timeout": timeout_label})
+    
+    def _signature(self, session_id):
+        return hmac.new(self._secret, session_id.encode("ascii"), hashlib.sha256).hexdigest()
+    
+    @staticmethod
+    def _key(session_id):
+        return hashlib.sha256(session_id.encode("ascii")).hexdigest()
+    
+    def _key_for(self, token):
+        """Session key for a correctly signed token, else None"""
+        if not isinstance(token, str):
+            return None
+        session_id, _, signature = token.partition(".")
+        if not session_id or not session_id.isascii() or not hmac.compare_digest(signature, self._signature(session_id)):
+            return None
+        return self._key(session_id)
+    
+    def _expire(self, now):
+        expired = []
+        while self._heap and self._heap[0][0] <= now:
+            _, key = heapq.heappop(self._heap)
+            session = self.sessions.get(key)
+            if session is None:
+                continue
+            if session["expires_at"] <= now:
+                del self.sessions[key]
+                expired.append(key)
+            else:
+                heapq.heappush(self._heap, (session["expires_at"], key))
+        return expired
+    
+    def create(self, username):
+        """Start a session for ``username`` and return its token"""
+        session_id = secrets.token_urlsafe(24)
+        key = self._key(session_id)
+        now = time.time()
+        expires_at = now + self.timeout
+        with self._lock:
+            self.sessions[key] = {"username": username, "expires_at": expires_at, "saved_at": now}
+            heapq.heappush(self._heap, (expires_at, key))
+        self.store.save_session(key, username, expires_at)
+        return f"{session_id}.{self._signature(session_id)}"
+    
+    def validate(self, token):
+        """Username for a live session token, extending its expiry.
+        
+        None if the token is invalid or expired, or its user has since been
+        deleted or suspended; such sessions are revoked on the spot.
+        """
+        key = self._key_for(token)
+        if key is None:
+            return None
+        now = time.time()
+        save = None
+        with self._lock:
+            expired = self._expire(now)
+            session = self.sessions.get(key)
+            if session is not None and session["expires_at"] <= now:
+                del self.sessions[key]
+                expired.append(key)
+                session = None
+            if session is not None:
+                session["expires_at"] = now + self.timeout
+                if now - session["saved_at"] >= self.timeout * SESSION_REFRESH_FRACTION:
+                    session["saved_at"] = now
+                    save = (key, session["username"], session["expires_at"])
+        if session is not None:
+            user = self.store.users.get(session["username"])
+            if user is None or user.get("status", "active") != "active":
+                with self._lock:
+                    self.sessions.pop(key, None)
+                expired.append(key)
+                session = save = None
+        if expired:
+            self.store.delete_sessions(expired)
+        if save:
+            self.store.save_session(*save)
+        return session["username"] if session is not None else None
+    
+    def revoke(self, token):
+        key = self._key_for(token)
+        if key is not None:
+            with self._lock:
+                self.sessions.pop(key, None)
+            self.store.delete_sessions([key])
+    
+    def revoke_user(self, username):
+        """End every session of ``username``"""
+        with self._lock:
+            keys = [key for key, session in self.sessions.items() if session["username"] == username]
+            for key in keys:
+                del self.sessions[key]
+        self.store.delete_sessions(keys)
+    
+    def revoke_all(self):
+        """End every session, e.g. once a full restore has replaced the accounts"""
+        with self._lock:
+            keys = list(self.sessions)
+            self.sessions.clear()
+            self._heap.clear()
+        self.store.delete_sessions(keys)
+    
+    def __len__(self):
+        with self._lock:
+            expired = self._expire(time.time())
+            count = len(self.sessions)
+        if expired:
+            self.store.delete_sessions(expired)
+        return count
+
+
+@st.cache_resource
+def get_session_manager():
+    """Load sign-in sessions once per process"""
+    return SessionManager(get_store())
+
+# ---- Session State Initialization (No Demo Data) ----
+# Users, panic events and system logs live in the shared store; every session
+# points at the same objects so registrations and alerts are visible to admins.
+store = get_store()
+st.session_state.registered_users = store.users
+st.session_state.panic_events = store.panic_events
+st.session_state.system_logs = store.system_logs
+fix_ingest_server = get_fix_ingest_server()
+alert_dispatcher = get_alert_dispatcher()
+alert_limiter = get_alert_limiter()
+panic_timers = get_panic_timers()
+credentials = get_credential_engine()
+sessions = get_session_manager()
+
+if "view" not in st.session_state:
+    st.session_state.view = "login"
+if "user" not in st.session_state:
+    st.session_state.user = None
+if "panic_active" not in st.session_state:
+    st.session_state.panic_active = False
+if "panic_timer" not in st.session_state:
+    st.session_state.panic_timer = None
+if "panic_hold" not in st.session_state:
+    st.session_state.panic_hold = None
+if "session_token" not in st.session_state:
+    st.session_state.session_token = None
+if "session_cookie" not in st.session_state:
+    st.session_state.session_cookie = None  # (value, max age) still to be written to the browser
+if "location" not in st.session_state:
+    st.session_state.location = None  # No default location
+if "contacts" not in st.session_state:
+    st.session_state.contacts = []  # Empty contacts - user must add
+if "last_alert_event" not in st.session_state:
+    st.session_state.last_alert_event = None
+if "settings" not in st.session_state:
+    st.session_state.settings = {
+        "notifications": True,
+        "location_tracking": True,
+        "high_accuracy": True,
+        "vibration": True,
+        "sound_alerts": True,
+        "voice_recording": True,
+        "auto_send_alerts": True,
+        "panic_duration": 3,
+        "emergency_message": "EMERGENCY! I need immediate assistance. My current location has been shared with this alert."
+    }
+if "sidebar_collapsed" not in st.session_state:
+    st.session_state.sidebar_collapsed = False
+if "map_click_location" not in st.session_state:
+    st.session_state.map_click_location = None
+# Lets the tracking map tell whether it was on screen in the previous run
+st.session_state.script_runs = st.session_state.get("script_runs", 0) + 1
+
+# ---- Emergency Features ----
+if "emergency_type" not in st.session_state:
+    st.session_state.emergency_type = "general"
+if "safety_timer" not in st.session_state:
+    st.session_state.safety_timer = None
+if "fake_call_time" not in st.session_state:
+    st.session_state.fake_call_time = None
+if "safety_network" not in st.session_state:
+    st.session_state.safety_network = []
+if "evidence_recordings" not in st.session_state:
+    st.session_state.evidence_recordings = []
+if "offline_mode" not in st.session_state:
+    st.session_state.offline_mode = False
+
+# ---- Admin Tracking ----
+if "admin_settings" not in st.session_state:
+    st.session_state.admin_settings = {
+        "system_name": "SafeTap Emergency System",
+        "emergency_response_time": "5 minutes",
+        "auto_backup": True,
+        "data_retention_days": 90,
+        "max_users": 1000,
+        "alert_cooldown": alert_limiter.cooldown,
+        "system_status": "operational",
+        "location_update_interval": 30,
+        "map_cluster_threshold": 300
+    }
+
+# ---- Emergency Protocols ----
+EMERGENCY_PROTOCOLS = {
+    "emergency": {
+        "icon": "🚨",
+        "color": "#ff6b6b",
+        "message": "EMERGENCY! I need immediate assistance.",
+        "actions": ["Assess situation", "Call emergency services", "Move to safe location"],
+        "contacts": ["all"],
+        "bg_color": "rgba(255, 107, 107, 0.3)"
+    },
+    "medical": {
+        "icon": "🚑",
+        "color": "#e74c3c",
+        "message": "MEDICAL EMERGENCY! Need immediate medical assistance.",
+        "actions": ["Check responsiveness", "Call emergency services", "Provide first aid if trained"],
+        "contacts": ["emergency", "family"],
+        "bg_color": "rgba(231, 76, 60, 0.3)"
+    },
+    "fire": {
+        "icon": "🔥",
+        "color": "#e67e22",
+        "message": "FIRE EMERGENCY! Need immediate fire department assistance.",
+        "actions": ["Evacuate area", "Call fire department", "Use fire extinguisher if safe"],
+        "contacts": ["emergency", "family"],
+        "bg_color": "rgba(230, 126, 34, 0.3)"
+    },
+    "personal_safety": {
+        "icon": "🛡️",
+        "color": "#9b59b6",
+        "message": "PERSONAL SAFETY ALERT! I feel unsafe and need assistance.",
+        "actions": ["Find safe location", "Contact emergency services", "Stay on phone"],
+        "contacts": ["emergency", "family"],
+        "bg_color": "rgba(155, 89, 182, 0.3)"
+    },
+    "general": {
+        "icon": "⚠️",
+        "color": "#ff6b6b",
+        "message": "GENERAL EMERGENCY! I need immediate assistance.",
+        "actions": ["Assess situation", "Call emergency services", "Move to safe location"],
+        "contacts": ["all"],
+        "bg_color": "rgba(255, 107, 107, 0.3)"
+    }
+}
+
+# ---- Helper Functions ----
+def add_history(event_type, title, details, username=None):
+    """Add an event to ``username``'s history (default: the signed-in user)"""
+    if username is None:
+        if not st.session_state.user:
+            return
+        username = st.session_state.user["username"]
+    event = {
+        "type": event_type,
+        "title": title,
+        "details": details,
+        "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+    store.add_history(username, event)
+
+def log_panic_event(username, emergency_type, location):
+    """Log panic button usage for admin tracking"""
+    if username in store.users:
+        user_name = store.users[username]["name"]
+        now = datetime.datetime.now()
+        event = {
+            "username": username,
+            "user_name": user_name,
+            "emergency_type": emergency_type,
+            "location": location,
+            "timestamp": now.strftime("%Y-%m-%d %H:%M:%S"),
+            "date": now.strftime("%B %d, %Y - %H:%M"),
+            "ts": now.timestamp()
+        }
+        return store.add_panic_event(event)
+
+def update_user_location(username, lat, lng, source="manual"):
+    """Update user's current location and add to history"""
+    if username in store.users:
+        now = datetime.datetime.now()
+        timestamp = now.strftime("%Y-%m-%d %H:%M:%S")
         
-        st.session_state.registered_users[username]["current_location"] = {
+        location_entry = {
             "lat": lat,
             "lng": lng,
             "timestamp": timestamp,
             "source": source
         }
+        store.add_location(username, location_entry, epoch=int(now.timestamp()))
         
         add_history("location", f"Location Updated", 
-                   f"New location: {lat:.6f}, {lng:.6f} via {source}")
+                   f"New location: {lat:.6f}, {lng:.6f} via {source}", username=username)
         
         return True
     return False
 
-def get_user_location(username):
-    """Get user's current location"""
-    if username in st.session_state.registered_users:
-        return st.session_state.registered_users[username].get("current_location")
-    return None
+def get_user_location(username):
+    """Get user's current location"""
+    if username in st.session_state.registered_users:
+        return st.session_state.registered_users[username].get("current_location")
+    return None
+
+def find_users_near(lat, lng, radius_m, exclude=None):
+    """Users within radius_m meters of a point as (distance_m, username), nearest first"""
+    with store.lock:
+        return [(d, u) for d, u in store.spatial.within_radius(lat, lng, radius_m) if u != exclude]
+
+def find_nearest_users(lat, lng, k=5, exclude=None):
+    """The k users closest to a point as (distance_m, username), nearest first"""
+    with store.lock:
+        found = store.spatial.nearest(lat, lng, k + 1 if exclude else k)
+    return [(d, u) for d, u in found if u != exclude][:k]
+
+def find_users_in_bounds(south, west, north, east):
+    """Usernames whose current location is inside a bounding box"""
+    with store.lock:
+        return store.spatial.within_bounds(south, west, north, east)
+
+def start_panic_timer():
+    """Start the panic button timer; the alert fires server-side when it runs out"""
+    if not st.session_state.location:
+        return  # cleared since the button was drawn; create_emergency_button asks for it on this run
+    st.session_state.panic_timer = time.time()
+    st.session_state.panic_active = True
+    st.session_state.panic_hold = panic_timers.arm(
+        st.session_state.panic_timer + st.session_state.settings["panic_duration"], raise_panic_alert,
+        st.session_state.user, dict(st.session_state.location), st.session_state.emergency_type,
+        contact_routes()[st.session_state.emergency_type], st.session_state.settings.get("sound_alerts", True)
+    )
+
+def check_panic_timer():
+    """Return the result of a finished panic hold and clear the panic state, else None"""
+    if not st.session_state.panic_active:
+        return None
+    hold = panic_timers.get(st.session_state.panic_hold)
+    if hold is not None and hold["state"] != "fired":
+        return None
+    st.session_state.panic_active = False
+    st.session_state.panic_timer = None
+    st.session_state.panic_hold = None
+    if hold is None:
+        return {"level": "error", "event_id": None, "message": "❌ The panic timer was lost. Please press the button again."}
+    panic_timers.discard(hold["id"])
+    return hold["result"]
+
+def cancel_panic():
+    """Cancel the panic alert; returns False if it already fired"""
+    if not panic_timers.cancel(st.session_state.panic_hold):
+        return False
+    st.session_state.panic_active = False
+    st.session_state.panic_timer = None
+    st.session_state.panic_hold = None
+    return True
+
+def send_enhanced_emergency_alert():
+    """Send enhanced emergency alert with type-specific messaging"""
+    if not st.session_state.location:
+        st.error("❌ Cannot send alert: No location available. Please update your location first.")
+        return
+    
+    show_panic_result(raise_panic_alert(st.session_state.user, st.session_state.location,
+                                        st.session_state.emergency_type, contact_routes()[st.session_state.emergency_type],
+                                        st.session_state.settings.get("sound_alerts", True)))
+
+def raise_panic_alert(user, location, emergency_type, contacts, sound_alerts=True):
+    """Log a panic event and queue its alerts; returns a result for ``show_panic_result``.
+    
+    ``contacts`` is the routed recipient list for ``emergency_type`` (see
+    ``contact_routes``). Works from any thread: everything it needs is
+    passed in, so the panic hold timer can call it without the session's
+    script context.
+    """
+    protocol = EMERGENCY_PROTOCOLS[emergency_type]
+    username = user["username"] if user else None
+    
+    if username:
+        update_user_location(username, location["lat"], location["lng"], source="panic_alert")
+    
+    event_id = None
+    if username:
+        if not alert_limiter.admit(username, emergency_type, store.incidents.has_emergency(username)):
+            incident = store.merge_into_incident(username, location)
+            if incident is not None:
+                add_history("alert", "Repeated alert merged",
+                            f"Emergency: {emergency_type}. Contacts were already notified; "
+                            f"incident #{incident['id']} location updated", username=username)
+                return {"level": "warning", "event_id": incident["id"],
+                        "message": f"🚨 {protocol['icon']} Your contacts were already alerted. Your open incident has been updated with your latest location."}
+        event_id = log_panic_event(username, emergency_type, location)
+    
+    alerts = alert_messages(event_id, user, location, emergency_type, contacts)
+    delay = alert_limiter.pace(len(alerts))
+    if delay:
+        for alert in alerts:
+            alert["next_attempt"] = time.time() + delay
+    store.enqueue_alerts(alerts)
+    alert_dispatcher.notify()
+    
+    if username:
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        events = [{"type": "alert", "title": f"Alert queued for {contact['name']}",
+                   "details": f"Emergency: {emergency_type}. {protocol['message']}", "timestamp": timestamp}
+                  for contact in contacts]
+        if sound_alerts:
+            events.append({"type": "alert", "title": "Emergency Siren Activated",
+                           "details": "Loud alarm activated to attract attention", "timestamp": timestamp})
+        store.add_history(username, *events)
+    
+    return {"level": "success", "event_id": event_id,
+            "message": f"🚨 {protocol['icon']} {protocol['message']} Queued {len(alerts)} messages to {len(contacts)} contacts!"}
+
+DEFAULT_CONTACT_PRIORITY = 2  # contacts without a priority; only priority 1 is routed for every type
+
+
+def build_contact_routes(contacts):
+    """Recipients per emergency type, in priority order and unique by phone number.
+    
+    A contact is routed for a type when its protocol lists ``"all"`` or the
+    contact's type, and priority-1 contacts are routed for every type.
+    Contacts sharing a name but not a number are different people and are
+    both kept; entries repeating a number (or, without one, an email) are
+    dropped after the first.
+    """
+    # Stable sort: keeps insertion order within a priority
+    ordered = sorted(contacts, key=lambda c: c.get("priority", DEFAULT_CONTACT_PRIORITY))
+    routes = {}
+    for emergency_type, protocol in EMERGENCY_PROTOCOLS.items():
+        seen = set()
+        route = []
+        for contact in ordered:
+            if not ("all" in protocol["contacts"] or contact.get("type") in protocol["contacts"]
+                    or contact.get("priority", DEFAULT_CONTACT_PRIORITY) == 1):
+                continue
+            key = re.sub(r"\D", "", contact.get("number") or "") or (contact.get("email") or "").strip().lower()
+            if key in seen:
+                continue
+            if key:
+                seen.add(key)
+            route.append(contact)
+        routes[emergency_type] = route
+    return routes
+
+def contacts_changed():
+    """Record an edit to the session's contacts; every add, edit or removal must call this"""
+    st.session_state.contacts_version = st.session_state.get("contacts_version", 0) + 1
+
+def add_contact(contact):
+    """Add an emergency contact and rebuild the session's routing table"""
+    st.session_state.contacts.append(contact)
+    contacts_changed()
+    return contact_routes()
+
+def contact_routes():
+    """The session's routing table, rebuilt when the contacts were replaced or edited"""
+    routes = st.session_state.get("contact_routes")
+    contacts = st.session_state.contacts
+    version = st.session_state.get("contacts_version", 0)
+    if routes is None or routes["contacts"] is not contacts or routes["version"] != version:
+        routes = st.session_state.contact_routes = {"contacts": contacts, "version": version,
+                                                    "routes": build_contact_routes(contacts)}
+    return routes["routes"]
+
+def show_panic_result(result):
+    """Show the outcome of ``raise_panic_alert`` and track its delivery receipts"""
+    st.session_state.last_alert_event = result["event_id"]
+    {"success": st.success, "warning": st.warning}.get(result["level"], st.error)(result["message"])
+
+def alert_messages(event_id, user, location, emergency_type, contacts):
+    """Outbox rows for a panic alert: SMS to each contact number, email where one is set"""
+    protocol = EMERGENCY_PROTOCOLS[emergency_type]
+    user = user or {}
+    name = user.get("name") or user.get("username", "A SafeTap user")
+    message = (f"SAFETAP {emergency_type.upper()}: {name} needs help. {protocol['message']} "
+               f"Location: https://maps.google.com/?q={location['lat']:.6f},{location['lng']:.6f} "
+               f"({datetime.datetime.now().strftime('%H:%M:%S')})")
+    alerts = []
+    for contact in contacts:
+        base = {"event_id": event_id, "username": user.get("username", ""), "contact_name": contact["name"],
+                "subject": f"{protocol['icon']} SafeTap emergency alert from {name}", "message": message}
+        if contact.get("number"):
+            alerts.append({**base, "transport": "sms", "recipient": contact["number"]})
+        if contact.get("email"):
+            alerts.append({**base, "transport": "email", "recipient": contact["email"]})
+    return alerts
+
+def register_user(username, password, name, email, phone, authority="Civilian", role="user"):
+    """Register a new user"""
+    if username in st.session_state.registered_users:
+        return False, "Username already exists"
+    
+    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    store.add_user(username, {
+        "password": credentials.hash(password),
+        "name": name,
+        "email": email,
+        "phone": phone,
+        "id": f"USER{len(st.session_state.registered_users):03d}",
+        "authority": authority,
+        "role": role,
+        "created_at": datetime.datetime.now().strftime("%Y-%m-%d"),
+        "profile_pic": None,
+        "status": "active",
+        "last_login": timestamp,
+        "current_location": None,
+        "location_history": []
+    })
+    return True, "User registered successfully"
+
+def authenticate_user(username, password):
+    """Authenticate user credentials.
+    
+    A suspended account with the right password yields (False, user_data)
+    so the caller can say why the sign-in was refused.
+    """
+    user_data = st.session_state.registered_users.get(username)
+    ok, rehash = credentials.verify(user_data["password"] if user_data else None, password)
+    if ok and user_data.get("status", "active") != "active":
+        return False, user_data
+    if ok:
+        changes = {"last_login": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+        if rehash:
+            changes["password"] = rehash
+        store.update_user(username, **changes)
+        return True, user_data
+    return False, None
+
+def save_profile_picture(username, uploaded_file):
+    """Save profile picture to user data"""
+    if username in st.session_state.registered_users:
+        picture = uploaded_file.getvalue() if uploaded_file is not None else None
+        return store.update_user(username, profile_pic=picture)
+    return False
+
+def get_profile_picture(username):
+    """Get profile picture from user data"""
+    if username in st.session_state.registered_users:
+        picture = st.session_state.registered_users[username].get("profile_pic")
+        if picture is not None:
+            return io.BytesIO(picture)
+    return None
+
+def update_user_profile(username, name, email, phone):
+    """Update a user's personal information"""
+    return store.update_user(username, name=name, email=email, phone=phone)
+
+def set_user_status(username, status):
+    """Activate or suspend a user"""
+    if status != "active":
+        sessions.revoke_user(username)
+    return store.update_user(username, status=status)
+
+def reset_user_password(username, password):
+    """Overwrite a user's password and sign out their sessions"""
+    sessions.revoke_user(username)
+    return store.update_user(username, password=credentials.hash(password))
+
+def delete_user(username):
+    """Remove a user and their location history"""
+    sessions.revoke_user(username)
+    return store.delete_user(username)
+
+def begin_session(username):
+    """Sign ``username`` into this browser session and remember it across reloads"""
+    user = st.session_state.registered_users[username]
+    user["username"] = username
+    st.session_state.user = user
+    st.session_state.view = "admin_dashboard" if user.get("role") == "admin" else "main"
+    st.session_state.session_token = sessions.create(username)
+    st.session_state.session_cookie = (st.session_state.session_token, SESSION_COOKIE_MAX_AGE)
+
+def end_session():
+    """Sign out and forget the session cookie"""
+    if st.session_state.session_token:
+        sessions.revoke(st.session_state.session_token)
+    st.session_state.session_token = None
+    st.session_state.session_cookie = ("", 0)
+    st.session_state.user = None
+    st.session_state.view = "login"
+
+def resume_session():
+    """Sign in from the browser's session cookie after a reload; True on success"""
+    token = st.context.cookies.get(SESSION_COOKIE)
+    username = sessions.validate(token) if token else None
+    if username is None or username not in st.session_state.registered_users:
+        return False
+    user = st.session_state.registered_users[username]
+    user["username"] = username
+    st.session_state.user = user
+    st.session_state.session_token = token
+    if st.session_state.view == "login":
+        st.session_state.view = "admin_dashboard" if user.get("role") == "admin" else "main"
+    sessions.resumed += 1
+    return True
+
+def write_session_cookie():
+    """Send a pending session cookie change to the browser.
+    
+    Streamlit gives no hook for response headers, so the cookie is set from
+    script and cannot be HttpOnly; SameSite=Strict keeps it off cross-site
+    requests, and the token is useless without the server-side session it
+    names. Secure is added only when the page itself was loaded over https:
+    browsers drop Secure cookies set from plain-HTTP pages other than
+    localhost, which would silently break resume on a LAN deployment. The
+    check runs in the browser, so it also holds behind a TLS-terminating
+    proxy.
+    """
+    if st.session_state.session_cookie is None:
+        return
+    value, max_age = st.session_state.session_cookie
+    st.session_state.session_cookie = None
+    cookie = f"{SESSION_COOKIE}={value}; path=/; max-age={max_age}; SameSite=Strict"
+    components.html(
+        f"<script>const page = window.parent;"
+        f" page.document.cookie = {json.dumps(cookie)} + (page.location.protocol === 'https:' ? '; Secure' : '');</script>",
+        height=0
+    )
+
+# ---- Admin Functions (No Demo Data) ----
+def get_system_stats():
+    """Get comprehensive system statistics for admin dashboard"""
+    return store.stats.snapshot()
+
+# ---- Backup Export ----
+# Backups are compressed NDJSON: a header, one record per line, and an "end"
+# record with counts. Picture blobs are written once as "blob" records and
+# referenced by digest from user records. Incremental backups hold only the
+# changes after the high-water mark recorded by the previous backup.
+BACKUP_FORMAT = "safetap-backup"
+BACKUP_VERSION = 1
+BACKUP_BATCH_RECORDS = 1000
+BACKUP_COMPRESSIONS = {"gzip": ("ndjson.gz", "application/gzip")}
+if ZSTD_AVAILABLE:
+    BACKUP_COMPRESSIONS["zstd"] = ("ndjson.zst", "application/zstd")
+
+
+def backup_high_water(conn):
+    """Change sequence and append-only row ids visible in a snapshot"""
+    return {
+        "seq": conn.execute(
+            "SELECT MAX(COALESCE((SELECT MAX(changed_seq) FROM users), 0), "
+            "COALESCE((SELECT MAX(changed_seq) FROM panic_events), 0), "
+            "COALESCE((SELECT MAX(seq) FROM deletions), 0))"
+        ).fetchone()[0],
+        # AUTOINCREMENT counters, which unlike MAX(id) never move back when rows are deleted
+        "location_id": conn.execute(
+            "SELECT COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'location_history'), 0)").fetchone()[0],
+        "log_id": conn.execute(
+            "SELECT COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'system_logs'), 0)").fetchone()[0]
+    }
+
+
+_backup_encoder = json.JSONEncoder(separators=(",", ":"), default=str)
+_dump_record = _backup_encoder.encode
+
+
+def iter_backup_lines(conn, high_water, since=None):
+    """Yield NDJSON lines for every record between ``since`` and ``high_water``"""
+    incremental = since is not None
+    if not incremental:
+        since = {"seq": -1, "location_id": 0, "log_id": 0}  # rows from before change tracking have seq 0
+    seq_range = (since["seq"], high_water["seq"])
+    
+    if incremental:
+        for row in conn.execute("SELECT seq, entity, key FROM deletions WHERE seq > ? AND seq <= ? ORDER BY seq",
+                                seq_range):
+            yield _dump_record({"kind": "deletion", "seq": row["seq"], "entity": row["entity"], "key": row["key"]})
+    
+    blobs = set()
+    for row in conn.execute("SELECT * FROM users WHERE changed_seq > ? AND changed_seq <= ? ORDER BY rowid",
+                            seq_range):
+        user = SafeTapStore._user_from_row(row)
+        del user["location_history"]  # exported as location records
+        picture = user["profile_pic"]
+        if picture is not None:
+            digest = hashlib.sha256(picture).hexdigest()
+            if digest not in blobs:
+                blobs.add(digest)
+                yield _dump_record({"kind": "blob", "sha256": digest,
+                                    "data": base64.b64encode(picture).decode("ascii")})
+            user["profile_pic"] = {"blob": digest}
+        yield _dump_record({"kind": "user", "username": row["username"], "seq": row["changed_seq"], **user})
+    
+    # The bulk of a backup; plain tuples skip building a Row per fix
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    cursor.execute("SELECT id, username, lat, lng, timestamp, source, accuracy FROM location_history "
+                   "WHERE id > ? AND id <= ? ORDER BY id", (since["location_id"], high_water["location_id"]))
+    for fix_id, username, lat, lng, timestamp, source, accuracy in cursor:
+        yield _dump_record({"kind": "location", "id": fix_id, "username": username, "lat": lat, "lng": lng,
+                            "timestamp": timestamp, "source": source, "accuracy": accuracy})
+    
+    for row in conn.execute("SELECT * FROM panic_events WHERE changed_seq > ? AND changed_seq <= ? ORDER BY id",
+                            seq_range):
+        yield _dump_record({"kind": "panic_event", "seq": row["changed_seq"], **SafeTapStore._event_from_row(row)})
+    
+    # Log rows already hold JSON text, so they are spliced in without a decode/encode round trip
+    for row in conn.execute("SELECT id, data FROM system_logs WHERE id > ? AND id <= ? ORDER BY id",
+                            (since["log_id"], high_water["log_id"])):
+        yield f'{{"kind":"system_log","id":{row["id"]},"data":{row["data"]}}}'
+
+
+def open_backup_stream(fileobj, compression):
+    """Wrap a binary file in a compressing writer"""
+    if compression == "zstd":
+        return zstandard.ZstdCompressor(level=3).stream_writer(fileobj, closefd=False)
+    return gzip.GzipFile(fileobj=fileobj, mode="wb", compresslevel=6)
+
+
+def write_backup(fileobj, incremental=False, compression="gzip", admin_settings=None):
+    """Stream a full or incremental backup into ``fileobj`` and return its stats.
+    
+    Records are read from one database snapshot and written in small batches,
+    so memory use does not grow with the size of the deployment.
+    """
+    started = time.perf_counter()
+    since = None
+    if incremental:
+        since = (store.get_meta("backup_high_water") or {}).get("high_water")
+        if since is None:
+            raise ValueError("No previous backup to continue from; take a full backup first")
+    
+    records = 0
+    with store.snapshot() as conn:
+        high_water = backup_high_water(conn)
+        stream = open_backup_stream(fileobj, compression)
+        header = {
+            "kind": "header",
+            "format": BACKUP_FORMAT,
+            "version": BACKUP_VERSION,
+            "mode": "incremental" if incremental else "full",
+            "since": since,
+            "high_water": high_water,
+            "export_timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+        batch = [_dump_record(header)]
+        if admin_settings is not None:
+            batch.append(_dump_record({"kind": "admin_settings", "data": admin_settings}))
+        for line in iter_backup_lines(conn, high_water, since):
+            batch.append(line)
+            records += 1
+            if len(batch) >= BACKUP_BATCH_RECORDS:
+                stream.write(("\n".join(batch) + "\n").encode("utf-8"))
+                batch = []
+        batch.append(_dump_record({"kind": "end", "records": records, "high_water": high_water}))
+        stream.write(("\n".join(batch) + "\n").encode("utf-8"))
+        stream.close()
+    
+    stats = {
+        "mode": header["mode"],
+        "records": records,
+        "bytes": fileobj.tell(),
+        "seconds": time.perf_counter() - started,
+        "created_at": header["export_timestamp"],
+        "high_water": high_water
+    }
+    # A generated file may never be saved, so it only becomes the incremental base once confirmed
+    store.set_meta("backup_pending", stats)
+    return stats
+
+
+def confirm_backup(stats):
+    """Make a stored backup the base that the next incremental backup continues from"""
+    with store.lock:
+        previous = (store.get_meta("backup_high_water") or {}).get("high_water")
+        # Only move the mark forward; confirming an older backup must not rewind it
+        if previous is None or stats["high_water"]["seq"] >= previous["seq"]:
+            store.set_meta("backup_high_water", stats)
+
+
+def export_system_data(incremental=False, compression="gzip", admin_settings=None):
+    """Export system data for backup into a temp file handed to the download as is"""
+    temp = tempfile.TemporaryFile()
+    write_backup(temp, incremental, compression, admin_settings)
+    return download_file(temp)
+
+# ---- Backup Import ----
+BACKUP_IMPORT_BATCH = 5000  # records per transaction
+BACKUP_IMPORT_MAX_ERRORS = 20  # invalid records listed in the result
+BACKUP_IMPORT_MODES = {
+    "merge": "Merge – add missing records, keep existing ones",
+    "upsert": "Upsert – add missing records, overwrite existing ones",
+    "replace": "Replace – restore a full backup over all current data"
+}
+_NUMBER = (int, float)
+
+# kind -> {field: (accepted types, required)}
+BACKUP_RECORD_FIELDS = {
+    "user": {"username": (str, True), "password": (str, True), "name": (str, True), "email": (str, False),
+             "phone": (str, False), "id": (str, False), "authority": (str, False), "role": (str, False),
+             "created_at": (str, False), "status": (str, False), "last_login": (str, False),
+             "current_location": (dict, False), "profile_pic": (dict, False)},
+    "location": {"id": (int, True), "username": (str, True), "lat": (_NUMBER, True), "lng": (_NUMBER, True),
+                 "timestamp": (str, True), "source": (str, False), "accuracy": (_NUMBER, False)},
+    "panic_event": {"id": (int, True), "username": (str, True), "user_name": (str, False),
+                    "emergency_type": (str, True), "location": (dict, True), "timestamp": (str, True),
+                    "date": (str, False), "ts": (_NUMBER, False), "resolved_at": (_NUMBER, False)},
+    "system_log": {"id": (int, True), "data": (object, True)},
+    "blob": {"sha256": (str, True), "data": (str, True)},
+    "deletion": {"entity": (str, True), "key": (str, True)},
+    "admin_settings": {"data": (dict, True)},
+    "end": {"records": (int, True)},
+}
+
+
+def _check_timestamp(timestamp):
+    # fromisoformat is far cheaper than strptime; the length pins the "%Y-%m-%d %H:%M:%S" shape
+    if len(timestamp) != 19 or timestamp[10] != " ":
+        raise ValueError(f"invalid timestamp {timestamp!r}")
+    datetime.datetime.fromisoformat(timestamp)
+
+
+def _check_coordinates(location):
+    lat, lng = location.get("lat"), location.get("lng")
+    if not _is_number(lat) or not -90 <= lat <= 90 or not _is_number(lng) or not -180 <= lng <= 180:
+        raise ValueError("invalid coordinates")
+
+
+def validate_backup_record(record):
+    """Check one backup record against its schema; raise ValueError if it does not fit"""
+    if not isinstance(record, dict):
+        raise ValueError("record must be an object")
+    fields = BACKUP_RECORD_FIELDS.get(record.get("kind"))
+    if fields is None:
+        raise ValueError(f"unknown record kind {record.get('kind')!r}")
+    for name, (types, required) in fields.items():
+        value = record.get(name)
+        if value is None:
+            if required:
+                raise ValueError(f"{record['kind']} record is missing {name}")
+        elif isinstance(value, bool) or not isinstance(value, types):
+            raise ValueError(f"{record['kind']} field {name} has the wrong type")
+    
+    kind = record["kind"]
+    if kind == "location":
+        _check_coordinates(record)
+        _check_timestamp(record["timestamp"])
+    elif kind == "panic_event":
+        _check_coordinates(record["location"])
+        _check_timestamp(record["timestamp"])
+    elif kind == "user":
+        if record.get("current_location"):
+            _check_coordinates(record["current_location"])
+        if record.get("profile_pic") and not isinstance(record["profile_pic"].get("blob"), str):
+            raise ValueError("profile_pic must reference a blob")
+    elif kind == "blob":
+        if hashlib.sha256(base64.b64decode(record["data"], validate=True)).hexdigest() != record["sha256"]:
+            raise ValueError("blob does not match its digest")
+    elif kind == "deletion" and record["entity"] != "user":
+        raise ValueError(f"unknown deletion entity {record['entity']!r}")
+
+
+def open_backup_reader(fileobj):
+    """Return a binary line reader over a plain, gzip or zstd backup"""
+    magic = fileobj.read(4)
+    fileobj.seek(0)
+    if magic[:2] == b"\x1f\x8b":
+        return gzip.GzipFile(fileobj=fileobj, mode="rb")
+    if magic == b"\x28\xb5\x2f\xfd":
+        if not ZSTD_AVAILABLE:
+            raise ValueError("zstd backups need the zstandard package")
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(fileobj))
+    return fileobj
+
+
+def import_backup(fileobj, mode="merge", progress=None):
+    """Stream a backup into the store record by record and return import stats.
+    
+    Each line is parsed and validated on its own; invalid records are
+    skipped and reported instead of failing the whole import. Valid records
+    are written in batches, so memory stays flat however large the backup
+    is. A replace runs as one transaction that only commits once the end
+    record confirms the backup is complete, so a truncated or corrupt file
+    leaves the current data in place. ``progress(fraction, stats)`` is
+    called after each batch.
+    """
+    fileobj.seek(0, io.SEEK_END)
+    total_bytes = fileobj.tell() or 1
+    fileobj.seek(0)
+    reader = open_backup_reader(fileobj)
+    
+    first_line = reader.readline()
+    if first_line.strip() == b"{" and reader is fileobj:
+        return import_legacy_backup(fileobj, mode)
+    try:
+        header = json.loads(first_line)
+    except ValueError:
+        header = None
+    if not isinstance(header, dict) or header.get("kind") != "header" or header.get("format") != BACKUP_FORMAT:
+        raise ValueError("Not a SafeTap backup file")
+    if header.get("version", 0) > BACKUP_VERSION:
+        raise ValueError("Backup was written by a newer SafeTap version")
+    if mode == "replace" and header.get("mode") != "full":
+        raise ValueError("Replace needs a full backup, not an incremental one")
+    
+    stats = {"mode": mode, "backup_mode": header.get("mode"), "records": 0, "invalid": 0,
+             "written": collections.Counter(), "present": 0, "errors": [], "admin_settings": None,
+             "complete": False}
+    with store.lock:
+        known_users = set(store.users) if mode != "replace" else set()
+    latest_fixes = {}
+    batch = []
+    accepted = 0  # valid records other than blobs, which are staged rather than written
+    
+    def flush():
+        stats["written"].update(store.import_records(batch, overwrite=mode != "merge", keep_ids=mode == "replace"))
+        batch.clear()
+        if progress:
+            progress(min(fileobj.tell() / total_bytes, 1.0), stats)
+    
+    # A replace is staged in one transaction; merge and upsert commit batch by batch
+    staged = store.transaction() if mode == "replace" else contextlib.nullcontext()
+    try:
+        with staged:
+            if mode == "replace":
+                store.reset_for_restore()
+            for line_no, line in enumerate(reader, start=2):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                    validate_backup_record(record)
+                    kind = record["kind"]
+                    if kind == "end":
+                        stats["complete"] = record["records"] == stats["records"]
+                        break
+                    if kind == "admin_settings":
+                        stats["admin_settings"] = record["data"]
+                        continue
+                    stats["records"] += 1
+                    if kind == "location" and record["username"] not in known_users:
+                        raise ValueError(f"fix for unknown user {record['username']!r}")
+                except ValueError as e:
+                    stats["invalid"] += 1
+                    if len(stats["errors"]) < BACKUP_IMPORT_MAX_ERRORS:
+                        stats["errors"].append(f"line {line_no}: {e}")
+                    continue
+                
+                if kind == "user":
+                    known_users.add(record["username"])
+                elif kind == "deletion":
+                    known_users.discard(record["key"])
+                    latest_fixes.pop(record["key"], None)
+                elif kind == "location":
+                    latest = latest_fixes.get(record["username"])
+                    if latest is None or record["timestamp"] >= latest["timestamp"]:
+                        latest_fixes[record["username"]] = record
+                accepted += kind != "blob"
+                batch.append(record)
+                if len(batch) >= BACKUP_IMPORT_BATCH:
+                    flush()
+            if batch:
+                flush()
+            if mode == "replace" and not stats["complete"]:
+                raise ValueError("The backup is truncated or its record count does not match; nothing was restored")
+    except BaseException:
+        if mode == "replace":
+            latest_fixes.clear()  # rolled back with the rest of the restore
+        raise
+    finally:
+        store.finish_import(latest_fixes)
+    if mode == "replace":
+        sessions.revoke_all()
+    # Valid records not written were already in the store (merge) or duplicated a fix or log entry
+    stats["present"] = accepted - sum(stats["written"].values())
+    return stats
+
+
+def import_legacy_backup(fileobj, mode):
+    """Restore a single-document JSON backup written by earlier versions"""
+    if mode != "replace":
+        raise ValueError("Legacy JSON backups can only be restored with Replace")
+    fileobj.seek(0)
+    data = json.load(fileobj)
+    store.replace_all(
+        users=data.get("users"),
+        panic_events=data.get("panic_events"),
+        system_logs=data.get("system_logs")
+    )
+    sessions.revoke_all()
+    records = sum(len(data.get(key) or []) for key in ("users", "panic_events", "system_logs"))
+    return {"mode": mode, "backup_mode": "legacy", "records": records, "invalid": 0,
+            "written": collections.Counter(records=records), "present": 0, "errors": [],
+            "admin_settings": data.get("admin_settings"), "complete": True}
+
+
+def import_system_data(uploaded_file, mode="merge", progress=None):
+    """Import system data from backup"""
+    try:
+        result = import_backup(uploaded_file, mode, progress)
+    except Exception as e:
+        return False, f"Error importing data: {str(e)}"
+    if result["admin_settings"] is not None and mode != "merge":
+        st.session_state.admin_settings = result["admin_settings"]
+    if mode == "replace" and st.session_state.user:
+        # The restore ended every session; the admin who ran it stays signed in if the backup still has them
+        restored = st.session_state.registered_users.get(st.session_state.user["username"])
+        if restored is not None and restored.get("status", "active") == "active":
+            begin_session(st.session_state.user["username"])
+        else:
+            end_session()
+    written = sum(result["written"].values())
+    message = f"Imported {written:,} of {result['records']:,} records"
+    if result["present"]:
+        message += f" ({result['present']:,} already present)"
+    if result["invalid"]:
+        message += f", skipped {result['invalid']:,} invalid ({'; '.join(result['errors'][:3])})"
+    if not result["complete"]:
+        message += " – the backup looks truncated"
+    return True, message
+
+# ---- Automatic Snapshots ----
+# A background thread copies the database with VACUUM INTO on a schedule and
+# keeps the newest copies as compressed files. To restore one, stop the app
+# and decompress it over the database file.
+SNAPSHOT_DIR = os.environ.get(
+    "SAFETAP_SNAPSHOT_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(SAFETAP_DB_PATH)), "snapshots")
+)
+SNAPSHOT_PREFIX = "safetap-"
+SNAPSHOT_EXTENSIONS = {"gzip": "db.gz", "zstd": "db.zst"}
+SNAPSHOT_INTERVAL_MINUTES = 60
+SNAPSHOT_KEEP = 7
+SNAPSHOT_RETRY_SECONDS = 300
+SNAPSHOT_COPY_BYTES = 1024 * 1024
+
+
+class SnapshotScheduler:
+    """Takes rotated, compressed database snapshots on a daemon thread.
+
+    The schedule is kept in the store's meta table so every session and
+    restart shares it; ``configure`` wakes the thread to apply changes.
+    """
+    
+    def __init__(self, store, directory):
+        self.store = store
+        self.directory = directory
+        self.compression = "zstd" if ZSTD_AVAILABLE else "gzip"
+        self.settings = {"enabled": True, "interval_minutes": SNAPSHOT_INTERVAL_MINUTES, "keep": SNAPSHOT_KEEP}
+        self.settings.update(store.get_meta("auto_backup_settings") or {})
+        self.last = store.get_meta("auto_backup_last")
+        self.runs = collections.deque(maxlen=20)
+        self.started = time.time()
+        self.error = None
+        self.running = False
+        self._run_now = False
+        self._wake = threading.Event()
+        self._lock = threading.Lock()  # one snapshot at a time
+    
+    def start(self):
+        threading.Thread(target=self._loop, name="safetap-snapshots", daemon=True).start()
+    
+    def configure(self, enabled, interval_minutes, keep):
+        settings = {"enabled": bool(enabled), "interval_minutes": int(interval_minutes), "keep": int(keep)}
+        if settings != self.settings:
+            self.settings = settings
+            self.store.set_meta("auto_backup_settings", settings)
+            self._wake.set()
+    
+    def request_snapshot(self):
+        """Take a snapshot now, outside the schedule"""
+        self._run_now = True
+        self._wake.set()
+    
+    def next_due(self):
+        if not self.settings["enabled"]:
+            return None
+        # The first snapshot waits a full interval, so a fresh checkout is not copied on every dev start
+        previous = self.started if self.last is None else self.last["epoch"]
+        return previous + self.settings["interval_minutes"] * 60
+    
+    def _loop(self):
+        while True:
+            due = self.next_due()
+            if self._run_now or (due is not None and time.time() >= due):
+                self._run_now = False
+                try:
+                    self.take_snapshot()
+                    self.error = None
+                except Exception as e:
+                    self.error = str(e)
+                    self._wake.wait(SNAPSHOT_RETRY_SECONDS)
+            else:
+                self._wake.wait(None if due is None else due - time.time())
+            self._wake.clear()
+    
+    def snapshots(self):
+        """Snapshot files, newest first"""
+        if not os.path.isdir(self.directory):
+            return []
+        names = [name for name in os.listdir(self.directory)
+                 if name.startswith(SNAPSHOT_PREFIX) and name.endswith(tuple(SNAPSHOT_EXTENSIONS.values()))]
+        return [os.path.join(self.directory, name) for name in sorted(names, reverse=True)]
+    
+    def take_snapshot(self):
+        """Copy, compress and rotate one snapshot and return its stats"""
+        with self._lock:
+            self.running = True
+            started = time.perf_counter()
+            now = datetime.datetime.now()
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f"{SNAPSHOT_PREFIX}{now.strftime('%Y%m%d-%H%M%S')}."
+                                                f"{SNAPSHOT_EXTENSIONS[self.compression]}")
+            copy_path, partial_path = path + ".tmp", path + ".part"
+            try:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(copy_path)  # VACUUM INTO refuses to overwrite
+                self.store.copy_to(copy_path)
+                copy_seconds = time.perf_counter() - started
+                db_bytes = os.path.getsize(copy_path)
+                with open(copy_path, "rb") as source, open(partial_path, "wb") as target:
+                    stream = open_backup_stream(target, self.compression)
+                    while chunk := source.read(SNAPSHOT_COPY_BYTES):
+                        stream.write(chunk)
+                    stream.close()
+                os.replace(partial_path, path)
+            finally:
+                self.running = False
+                for leftover in (copy_path, partial_path):
+                    with contextlib.suppress(FileNotFoundError):
+                        os.remove(leftover)
+            
+            for old in self.snapshots()[self.settings["keep"]:]:
+                os.remove(old)
+            
+            stats = {
+                "created_at": now.strftime("%Y-%m-%d %H:%M:%S"),
+                "epoch": now.timestamp(),
+                "file": os.path.basename(path),
+                "bytes": os.path.getsize(path),
+                "db_bytes": db_bytes,
+                "copy_seconds": copy_seconds,
+                "seconds": time.perf_counter() - started
+            }
+            self.last = stats
+            self.runs.append(stats)
+            self.store.set_meta("auto_backup_last", stats)
+            return stats
+
+
+@st.cache_resource
+def get_snapshot_scheduler():
+    """Start the snapshot thread once per process"""
+    scheduler = SnapshotScheduler(get_store(), SNAPSHOT_DIR)
+    scheduler.start()
+    return scheduler
+
+
+def show_snapshot_status():
+    """Summarise recent automatic snapshots"""
+    last = snapshot_scheduler.last
+    if snapshot_scheduler.running:
+        st.caption("⏳ Taking a snapshot...")
+    if last:
+        st.caption(f"Last snapshot: {last['created_at']} – {last['bytes'] / 1024 / 1024:,.1f} MB compressed "
+                   f"from {last['db_bytes'] / 1024 / 1024:,.1f} MB in {last['seconds']:.1f} s "
+                   f"(copy {last['copy_seconds']:.1f} s)")
+    runs = list(snapshot_scheduler.runs)
+    if len(runs) > 1:
+        st.caption(f"Average over the last {len(runs)} snapshots: "
+                   f"{sum(run['seconds'] for run in runs) / len(runs):.1f} s, "
+                   f"{sum(run['bytes'] for run in runs) / len(runs) / 1024 / 1024:,.1f} MB")
+    due = snapshot_scheduler.next_due()
+    if due is not None:
+        st.caption(f"Next snapshot: {datetime.datetime.fromtimestamp(max(due, time.time())).strftime('%Y-%m-%d %H:%M')}"
+                   f" · {len(snapshot_scheduler.snapshots())} kept in {snapshot_scheduler.directory}")
+    if snapshot_scheduler.error:
+        st.error(f"Last snapshot failed: {snapshot_scheduler.error}")
+
+# ---- Data Retention ----
+# Fixes, history, panic events and log entries older than the retention window are
+# removed a whole day partition at a time by a background job, optionally
+# after counting them into daily_rollups. Freed pages are reused by SQLite,
+# so the database stops growing once the window is full.
+RETENTION_DAYS = 90
+RETENTION_INTERVAL_HOURS = 6
+RETENTION_BATCH_ROWS = 5000  # rows deleted per transaction, at partition granularity
+
+
+class RetentionJob:
+    """Enforces the data retention window on a daemon thread.
+
+    Like the snapshot schedule, its settings live in the meta table and
+    apply to every session; changing them triggers a run.
+    """
+    
+    def __init__(self, store):
+        self.store = store
+        self.settings = {"days": RETENTION_DAYS, "rollup": True}
+        self.settings.update(store.get_meta("retention_settings") or {})
+        self.last = store.get_meta("retention_last")
+        self.error = None
+        self.running = False
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+    
+    def start(self):
+        threading.Thread(target=self._loop, name="safetap-retention", daemon=True).start()
+    
+    def configure(self, days, rollup):
+        settings = {"days": int(days), "rollup": bool(rollup)}
+        if settings != self.settings:
+            self.settings = settings
+            self.store.set_meta("retention_settings", settings)
+            self.request_run()
+    
+    def request_run(self):
+        self._wake.set()
+    
+    def cutoff(self):
+        """Oldest day still retained, as (date, local midnight epoch)"""
+        day = datetime.date.today() - datetime.timedelta(days=self.settings["days"])
+        return day, datetime.datetime.combine(day, datetime.time.min).timestamp()
+    
+    def _loop(self):
+        # Runs at startup, then every RETENTION_INTERVAL_HOURS or when woken
+        while True:
+            try:
+                self.run()
+                self.error = None
+            except Exception as e:
+                self.error = str(e)
+            self._wake.wait(RETENTION_INTERVAL_HOURS * 3600)
+            self._wake.clear()
+    
+    def run(self):
+        """Drop every expired partition and return what was reclaimed"""
+        with self._lock:
+            self.running = True
+            try:
+                started = time.perf_counter()
+                day, cutoff_epoch = self.cutoff()
+                cutoff_day = day.isoformat()
+                rollup = self.settings["rollup"]
+                free_before = self.store.free_bytes()
+                partitions = self.store.expired_partitions(cutoff_day)
+                
+                deleted = collections.Counter()
+                rolled_up = 0
+                group, rows = [], 0
+                for data_class, username, partition_day, count in partitions:
+                    group.append((data_class, username, partition_day))
+                    rows += count
+                    if rows >= RETENTION_BATCH_ROWS:
+                        group_deleted, group_rolled_up = self.store.drop_partitions(group, rollup)
+                        deleted.update(group_deleted)
+                        rolled_up += group_rolled_up
+                        group, rows = [], 0
+                        time.sleep(0.005)  # let queued writers take the store lock between batches
+                if group:
+                    group_deleted, group_rolled_up = self.store.drop_partitions(group, rollup)
+                    deleted.update(group_deleted)
+                    rolled_up += group_rolled_up
+                self.store.drop_expired_views(cutoff_epoch, cutoff_day)
+                free_after = self.store.free_bytes()
+            finally:
+                self.running = False
+            
+            stats = {
+                "ran_at": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "cutoff": cutoff_day,
+                "partitions": len(partitions),
+                "deleted": {data_class: deleted.get(data_class, 0) for data_class in RETENTION_TABLES},
+                "rolled_up": rolled_up,
+                "reclaimed_bytes": max(free_after - free_before, 0),
+                "free_bytes": free_after,
+                "seconds": time.perf_counter() - started
+            }
+            self.last = stats
+            self.store.set_meta("retention_last", stats)
+            return stats
+
+
+@st.cache_resource
+def get_retention_job():
+    """Start the retention thread once per process"""
+    job = RetentionJob(get_store())
+    job.start()
+    return job
+
+
+def show_retention_status():
+    """Summarise the last retention run"""
+    last = retention_job.last
+    if retention_job.running:
+        st.caption("⏳ Enforcing retention...")
+    if last:
+        deleted = last["deleted"]
+        st.caption(f"Last run: {last['ran_at']} – removed {deleted['location']:,} fixes, "
+                   f"{deleted.get('history', 0):,} history entries, {deleted.get('alert', 0):,} alert messages, "
+                   f"{deleted['panic_event']:,} panic events and {deleted['system_log']:,} log entries "
+                   f"before {last['cutoff']} ({last['partitions']:,} partitions, {last['rolled_up']:,} summary rows) "
+                   f"in {last['seconds']:.1f} s; {last['reclaimed_bytes'] / 1024 / 1024:,.1f} MB freed for reuse")
+    if retention_job.error:
+        st.error(f"Last retention run failed: {retention_job.error}")
+
+# ---- Report Engine ----
+# Reports are read from a database snapshot in column chunks, shaped with
+# vectorized pandas operations and streamed to CSV, Parquet or Arrow files.
+REPORT_CHUNK_ROWS = 100_000
+REPORT_PREVIEW_ROWS = 1000
+
+
+def _title_source(source):
+    return source.fillna("unknown").str.replace("_", " ").str.title()
+
+
+def _shape_user_report(chunk):
+    located = chunk["loc_lat"].notna()
+    location = chunk["loc_lat"].astype(float).astype(str) + ", " + chunk["loc_lng"].astype(float).astype(str)
+    return pd.DataFrame({
+        "User ID": chunk["user_id"],
+        "Username": chunk["username"],
+        "Name": chunk["name"],
+        "Email": chunk["email"],
+        "Phone": chunk["phone"],
+        "Authority": chunk["authority"],
+        "Role": chunk["role"],
+        "Status": chunk["status"].fillna("active"),
+        "Created At": chunk["created_at"],
+        "Last Login": chunk["last_login"].fillna("Never"),
+        "Current Location": location.where(located, "No location"),
+        "Location Updated": chunk["loc_timestamp"].where(located, "Never").fillna("Never")
+    })
+
+
+def _shape_emergency_report(chunk):
+    today_start, today_end = day_bounds()
+    active = chunk["ts"].between(today_start, today_end, inclusive="left") & chunk["resolved_at"].isna()
+    return pd.DataFrame({
+        "Username": chunk["username"],
+        "User Name": chunk["user_name"],
+        "Emergency Type": chunk["emergency_type"],
+        "Timestamp": chunk["timestamp"],
+        "Date": chunk["date"],
+        "Latitude": chunk["lat"].astype(float),
+        "Longitude": chunk["lng"].astype(float),
+        "Status": np.where(active, "Active", "Resolved")
+    })
+
+
+def _shape_location_report(chunk):
+    store.incidents.expire()
+    emergency = chunk["username"].isin(list(store.incidents.open))
+    return pd.DataFrame({
+        "User": chunk["name"],
+        "Username": chunk["username"],
+        "Status": np.select([emergency, chunk["status"] == "active"],
+                            ["🔴 EMERGENCY", "🟢 Active"], "⚪ Inactive"),
+        "Latitude": chunk["loc_lat"].astype(float),
+        "Longitude": chunk["loc_lng"].astype(float),
+        "Last Update": chunk["loc_timestamp"].fillna("Never"),
+        "Source": _title_source(chunk["loc_source"])
+    })
+
+
+def _shape_location_fix_report(chunk):
+    return pd.DataFrame({
+        "Username": chunk["username"],
+        "Latitude": chunk["lat"].astype(float),
+        "Longitude": chunk["lng"].astype(float),
+        "Accuracy (m)": chunk["accuracy"].astype(float),
+        "Timestamp": chunk["timestamp"],
+        "Source": _title_source(chunk["source"])
+    })
+
+
+# name -> (query, row count query, chunk shaper); a None count query uses the
+# store's maintained location_fix_count instead of scanning the table
+REPORTS = {
+    "users": (
+        "SELECT user_id, username, name, email, phone, authority, role, status, created_at, last_login, "
+        "loc_lat, loc_lng, loc_timestamp FROM users WHERE role != 'admin' ORDER BY rowid",
+        "SELECT COUNT(*) FROM users WHERE role != 'admin'",
+        _shape_user_report
+    ),
+    "emergencies": (
+        "SELECT username, COALESCE(user_name, username) AS user_name, emergency_type, timestamp, date, "
+        "lat, lng, ts, resolved_at FROM panic_events ORDER BY id DESC",
+        "SELECT COUNT(*) FROM panic_events",
+        _shape_emergency_report
+    ),
+    "locations": (
+        "SELECT username, name, status, loc_lat, loc_lng, loc_timestamp, loc_source "
+        "FROM users WHERE role != 'admin' ORDER BY rowid",
+        "SELECT COUNT(*) FROM users WHERE role != 'admin'",
+        _shape_location_report
+    ),
+    "location_fixes": (
+        "SELECT username, lat, lng, accuracy, timestamp, source FROM location_history ORDER BY id DESC",
+        None,
+        _shape_location_fix_report
+    ),
+}
+
+
+def report_chunks(name, limit=None):
+    """Yield a report as shaped DataFrame chunks of up to REPORT_CHUNK_ROWS rows"""
+    query, _, shape = REPORTS[name]
+    params = ()
+    if limit is not None:
+        query += " LIMIT ?"
+        params = (limit,)
+    with store.snapshot() as conn:
+        for chunk in pd.read_sql_query(query, conn, params=params, chunksize=REPORT_CHUNK_ROWS):
+            yield shape(chunk)
+
+
+def build_report(name, limit=None):
+    """Return a whole report (or its first ``limit`` rows) as one DataFrame"""
+    chunks = list(report_chunks(name, limit))  # an empty result still yields one empty chunk
+    return chunks[0] if len(chunks) == 1 else pd.concat(chunks, ignore_index=True)
+
+
+def report_row_count(name):
+    """Number of rows a report will contain"""
+    count_query = REPORTS[name][1]
+    if count_query is None:
+        return store.location_fix_count
+    with store.snapshot() as conn:
+        return conn.execute(count_query).fetchone()[0]
+
+
+def report_tables(name):
+    """Yield a report as Arrow tables sharing one schema"""
+    schema = None
+    for chunk in report_chunks(name):
+        table = pa.Table.from_pandas(chunk, preserve_index=False)
+        if schema is None:
+            # Text columns that are empty in the first chunk must not pin the schema to null
+            schema = pa.schema([field.with_type(pa.string()) if pa.types.is_null(field.type) else field
+                                for field in table.schema])
+        yield table.cast(schema)
+
+
+class DownloadFile(io.BufferedReader):
+    """Finished temp file handed to st.download_button as deferred data.
+    
+    Streamlit reads the file once, in full, when the button is clicked; the
+    reader closes itself after that read, which frees the unlinked file.
+    """
+    
+    def read(self, size=-1):
+        data = super().read(size)
+        if size is None or size < 0:
+            self.close()
+        return data
+
+
+def download_file(temp):
+    """Wrap a finished temp file for a deferred download without reading it into memory here"""
+    temp.flush()
+    temp.seek(0)  # the duplicate descriptor shares this offset
+    reader = DownloadFile(io.FileIO(os.dup(temp.fileno()), "rb"))
+    temp.close()
+    return reader
+
+
+def report_csv(name):
+    """Stream a report to a temp CSV file one chunk at a time"""
+    temp = tempfile.TemporaryFile()
+    if PYARROW_AVAILABLE:
+        # Arrow's CSV writer is an order of magnitude faster than DataFrame.to_csv
+        writer = None
+        for table in report_tables(name):
+            if writer is None:
+                writer = pa.csv.CSVWriter(temp, table.schema)
+            writer.write_table(table)
+        writer.close()
+    else:
+        text = io.TextIOWrapper(temp, encoding="utf-8", newline="")
+        header = True
+        for chunk in report_chunks(name):
+            chunk.to_csv(text, index=False, header=header)
+            header = False
+        text.flush()
+        text.detach()
+    return download_file(temp)
+
+
+def report_arrow(name, file_format):
+    """Stream a report to a temp Parquet or Arrow IPC file one chunk at a time"""
+    temp = tempfile.TemporaryFile()
+    writer = None
+    for table in report_tables(name):
+        if writer is None:
+            if file_format == "parquet":
+                writer = pq.ParquetWriter(temp, table.schema)
+            else:
+                writer = pa.ipc.new_file(temp, table.schema)
+        writer.write_table(table)
+    writer.close()
+    return download_file(temp)
+
+
+def show_report_downloads(name, file_stem, label):
+    """Render CSV / Parquet / Arrow download buttons that build the file on click"""
+    stamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+    formats = [("CSV", "csv", "text/csv", lambda: report_csv(name))]
+    if PYARROW_AVAILABLE:
+        formats.append(("Parquet", "parquet", "application/vnd.apache.parquet",
+                        lambda: report_arrow(name, "parquet")))
+        formats.append(("Arrow", "arrow", "application/vnd.apache.arrow.file",
+                        lambda: report_arrow(name, "arrow")))
+    for column, (format_label, extension, mime, build) in zip(st.columns(len(formats)), formats):
+        with column:
+            st.download_button(
+                label=f"📥 Download {label} ({format_label})",
+                data=build,
+                file_name=f"{file_stem}_{stamp}.{extension}",
+                mime=mime,
+                key=f"download_{name}_{extension}",
+                on_click="ignore"
+            )
+
+
+def create_user_report():
+    """Create a comprehensive user report"""
+    return build_report("users")
+
+def create_emergency_report():
+    """Create a comprehensive emergency report"""
+    return build_report("emergencies")
+
+# Shared marker/popup code for the tracking map. Each user is one compact row:
+# [lat, lng, name, username, color, status, role, timestamp, source, phone, email, icon, emergency]
+# Popup and tooltip HTML is only built when a marker is opened or hovered.
+USER_MARKER_JS = """
+function safetapEscape(s) {
+    return String(s).replace(/[&<>"']/g, function (c) {
+        return {"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "'": "&#39;"}[c];
+    });
+}
+
+function safetapUserTooltip(row) {
+    return "<b>" + safetapEscape(row[2]) + "</b><br>" + safetapEscape(row[5]);
+}
+
+function safetapUserPopup(row) {
+    var e = safetapEscape;
+    return '<div style="font-family: Segoe UI, Arial, sans-serif; min-width: 300px; background: white; border-radius: 10px; overflow: hidden;">'
+        + '<div style="background: linear-gradient(135deg, #667eea, #764ba2); color: white; padding: 12px;">'
+        + '<h4 style="margin: 0; font-size: 16px; color: white;">' + e(row[2]) + '</h4>'
+        + '<p style="margin: 5px 0 0 0; font-size: 12px; opacity: 0.9; color: white;">' + e(row[3]) + '</p></div>'
+        + '<div style="padding: 15px;">'
+        + '<div style="display: grid; grid-template-columns: 1fr 1fr; gap: 10px; margin-bottom: 10px;">'
+        + '<div><div style="color: #666; font-size: 11px;">STATUS</div>'
+        + '<div style="font-weight: bold; font-size: 14px; color: #000;">' + e(row[5]) + '</div></div>'
+        + '<div><div style="color: #666; font-size: 11px;">ROLE</div>'
+        + '<div style="font-weight: bold; font-size: 14px; color: #000;">' + e(row[6]) + '</div></div></div>'
+        + '<div style="margin-bottom: 10px;"><div style="color: #666; font-size: 11px;">CURRENT LOCATION</div>'
+        + '<div style="font-family: monospace; background: #f5f5f5; padding: 8px; border-radius: 5px; font-size: 12px; color: #000;">'
+        + row[0].toFixed(6) + ', ' + row[1].toFixed(6) + '</div></div>'
+        + '<div style="margin-bottom: 10px;"><div style="color: #666; font-size: 11px;">LAST UPDATE</div>'
+        + '<div style="font-size: 12px; color: #000;">' + e(row[7]) + '</div>'
+        + '<div style="font-size: 11px; color: #666;">via ' + e(row[8]) + '</div></div>'
+        + '<div style="margin-bottom: 10px;"><div style="color: #666; font-size: 11px;">CONTACT</div>'
+        + '<div style="font-size: 12px; color: #000;">📞 ' + e(row[9]) + '</div>'
+        + '<div style="font-size: 12px; color: #000;">✉️ ' + e(row[10]) + '</div></div>'
+        + '<a href="https://www.google.com/maps?q=' + row[0] + ',' + row[1] + '" target="_blank" '
+        + 'style="display: block; background: linear-gradient(135deg, #667eea, #764ba2); color: white; '
+        + 'text-align: center; padding: 8px; border-radius: 5px; text-decoration: none; font-size: 12px;">'
+        + '📍 Open in Google Maps</a></div></div>';
+}
+
+function safetapBind(marker, row) {
+    marker.bindTooltip(function () { return safetapUserTooltip(row); });
+    marker.bindPopup(function () { return safetapUserPopup(row); }, {maxWidth: 350});
+    return marker;
+}
+
+// Full marker: status icon, accuracy circle and, for emergencies, the zone circle
+function safetapUserMarker(row, layer) {
+    var latlng = new L.LatLng(row[0], row[1]);
+    if (row[12]) {
+        L.circle(latlng, {radius: 200, color: "red", weight: 2, fill: true, fillColor: "red", fillOpacity: 0.2})
+            .bindPopup("Emergency Zone").addTo(layer);
+    }
+    var icon = L.AwesomeMarkers.icon({icon: row[11], prefix: "fa", markerColor: row[4], iconColor: "white"});
+    safetapBind(L.marker(latlng, {icon: icon}), row).addTo(layer);
+    L.circle(latlng, {radius: 50, color: row[4], weight: 1, fill: true, fillColor: row[4], fillOpacity: 0.1})
+        .addTo(layer);
+}
 
-def start_panic_timer():
-    """Start the panic button timer"""
-    st.session_state.panic_timer = time.time()
-    st.session_state.panic_active = True
+// Lightweight marker used inside the high-density cluster layer
+function safetapClusterMarker(row) {
+    return safetapBind(L.circleMarker(new L.LatLng(row[0], row[1]), {
+        radius: 7, color: row[4], fillColor: row[4], fillOpacity: 0.7, weight: 2
+    }), row);
+}
 
-def check_panic_timer():
-    """Check if panic button has been held for required seconds"""
-    if st.session_state.panic_active and st.session_state.panic_timer:
-        elapsed = time.time() - st.session_state.panic_timer
-        required_duration = st.session_state.settings["panic_duration"]
-        if elapsed >= required_duration:
-            st.session_state.panic_active = False
-            st.session_state.panic_timer = None
-            return True
-    return False
+// One persistent user layer per map; refreshes patch it instead of redrawing the map
+function safetapCreateUserLayer(map, clustered) {
+    var state = {version: 0, byUser: {}, markers: L.featureGroup().addTo(map), clusters: null};
+    if (clustered) {
+        state.clusters = L.markerClusterGroup({chunkedLoading: true}).addTo(map);
+    }
+    window.safetapUserState = state;
+}
 
-def cancel_panic():
-    """Cancel the panic alert"""
-    st.session_state.panic_active = False
-    st.session_state.panic_timer = None
+// delta: {version, reset, rows: [changed rows], removed: [usernames]}
+function safetapApplyUserDelta(delta) {
+    var state = window.safetapUserState;
+    if (!state || delta.version <= state.version) {
+        return;
+    }
+    if (delta.reset) {
+        state.markers.clearLayers();
+        if (state.clusters) {
+            state.clusters.clearLayers();
+        }
+        state.byUser = {};
+    }
+    var stale = delta.removed.concat(delta.rows.map(function (row) { return row[3]; }));
+    var staleClustered = [];
+    stale.forEach(function (username) {
+        var entry = state.byUser[username];
+        if (!entry) {
+            return;
+        }
+        if (entry.clustered) {
+            staleClustered.push(entry.layer);
+        } else {
+            state.markers.removeLayer(entry.layer);
+        }
+        delete state.byUser[username];
+    });
+    if (staleClustered.length) {
+        state.clusters.removeLayers(staleClustered);
+    }
+    var clustered = [];
+    delta.rows.forEach(function (row) {
+        var entry;
+        // In high-density mode only emergencies get their own full marker
+        if (state.clusters && !row[12]) {
+            entry = {clustered: true, layer: safetapClusterMarker(row)};
+            clustered.push(entry.layer);
+        } else {
+            entry = {clustered: false, layer: L.featureGroup()};
+            safetapUserMarker(row, entry.layer);
+            entry.layer.addTo(state.markers);
+        }
+        state.byUser[row[3]] = entry;
+    });
+    if (clustered.length) {
+        state.clusters.addLayers(clustered);
+    }
+    state.version = delta.version;
+}
+"""
 
-def send_enhanced_emergency_alert():
-    """Send enhanced emergency alert with type-specific messaging"""
-    if not st.session_state.location:
-        st.error("❌ Cannot send alert: No location available. Please update your location first.")
-        return
-        
-    protocol = EMERGENCY_PROTOCOLS[st.session_state.emergency_type]
-    
-    if st.session_state.user:
-        update_user_location(st.session_state.user["username"], 
-                           st.session_state.location["lat"], 
-                           st.session_state.location["lng"],
-                           source="panic_alert")
+
+class UserMarkerLayer(JSCSSMixin, MacroElement):
+    """Defines the shared marker JS and the persistent user layer on the base map"""
     
-    if st.session_state.user:
-        log_panic_event(st.session_state.user["username"], st.session_state.emergency_type, st.session_state.location)
+    default_js = folium.plugins.MarkerCluster.default_js
+    default_css = folium.plugins.MarkerCluster.default_css
     
-    contacts_to_notify = []
-    if "all" in protocol["contacts"]:
-        contacts_to_notify = st.session_state.contacts
-    else:
-        contacts_to_notify = [c for c in st.session_state.contacts if c["type"] in protocol["contacts"]]
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            {{ this.marker_js }}
+            safetapCreateUserLayer({{ this._parent.get_name() }}, {{ this.clustered|tojson }});
+        {% endmacro %}
+    """)
     
-    priority_contacts = [c for c in st.session_state.contacts if c.get("priority", 0) == 1]
-    contacts_to_notify.extend(priority_contacts)
+    def __init__(self, clustered):
+        super().__init__()
+        self._name = "UserMarkerLayer"
+        self.marker_js = USER_MARKER_JS
+        self.clustered = clustered
+
+
+class UserMarkerDelta(MacroElement):
+    """Applies a batch of changed user rows to the persistent user layer"""
     
-    contacts_to_notify = list({c["name"]: c for c in contacts_to_notify}.values())
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            safetapApplyUserDelta({{ this.delta|tojson }});
+        {% endmacro %}
+    """)
     
-    for contact in contacts_to_notify:
-        add_history("alert", f"Alert sent to {contact['name']}", 
-                   f"Emergency: {st.session_state.emergency_type}. {protocol['message']}")
+    def __init__(self, delta):
+        super().__init__()
+        self._name = "UserMarkerDelta"
+        self.delta = delta
+
+def use_clustered_map():
+    """Whether the tracking map should use the high-density clustered layer"""
+    threshold = st.session_state.admin_settings.get("map_cluster_threshold", 300)
+    return len(store.spatial) > threshold
+
+@st.cache_resource
+def get_track_levels_cache():
+    """Track simplifications shared by all admin sessions, keyed by user and stored-fix stamp"""
+    return LRUCache(TRACK_LEVELS_CACHE_SIZE)
+
+def show_track_map(username):
+    """Draw a user's whole location history as one zoom-simplified polyline"""
+    build_start = time.perf_counter()
+    levels = track_levels(username)
+    build_ms = (time.perf_counter() - build_start) * 1000
     
-    if st.session_state.settings.get("sound_alerts", True):
-        add_history("alert", "Emergency Siren Activated", "Loud alarm activated to attract attention")
+    map_key = f"track_map_{username}"
+    fit_zoom = levels.fit_zoom(1200, 500)
+    # st_folium mirrors its last reported view into session state under its key
+    zoom = (st.session_state.get(map_key) or {}).get("zoom") or fit_zoom
+    points = levels.points(zoom).tolist()
     
-    st.success(f"🚨 {protocol['icon']} {protocol['message']} Sent to {len(contacts_to_notify)} contacts!")
-
-def register_user(username, password, name, email, phone, authority="Civilian", role="user"):
-    """Register a new user"""
-    if username in st.session_state.registered_users:
-        return False, "Username already exists"
+    m = folium.Map(location=levels.center, zoom_start=fit_zoom, control_scale=True)
+    folium.Marker(points[0], tooltip="First fix", icon=folium.Icon(color="green", icon="play", prefix="fa")).add_to(m)
+    folium.Marker(points[-1], tooltip="Latest fix", icon=folium.Icon(color="red", icon="flag", prefix="fa")).add_to(m)
+    track_layer = folium.FeatureGroup(name="Track", control=False)
+    if len(points) > 1:
+        folium.PolyLine(points, color="#667eea", weight=4, opacity=0.8).add_to(track_layer)
     
-    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    st.session_state.registered_users[username] = {
-        "password": password,
-        "name": name,
-        "email": email,
-        "phone": phone,
-        "id": f"USER{len(st.session_state.registered_users):03d}",
-        "authority": authority,
-        "role": role,
-        "created_at": datetime.datetime.now().strftime("%Y-%m-%d"),
-        "profile_pic": None,
-        "status": "active",
-        "last_login": timestamp,
-        "current_location": None,
-        "location_history": []
-    }
-    return True, "User registered successfully"
-
-def authenticate_user(username, password):
-    """Authenticate user credentials"""
-    if username in st.session_state.registered_users:
-        user_data = st.session_state.registered_users[username]
-        if user_data["password"] == password:
-            user_data["last_login"] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            return True, user_data
-    return False, None
+    st_folium(m, key=map_key, width=1200, height=500, returned_objects=["zoom"],
+              feature_group_to_add=track_layer)
+    st.caption(f"🧭 {len(levels):,} fixes drawn as {len(points):,} vertices at zoom {zoom} · "
+               f"levels ready in {build_ms:,.1f} ms")
 
-def save_profile_picture(username, uploaded_file):
-    """Save profile picture to user data"""
-    if username in st.session_state.registered_users:
-        st.session_state.registered_users[username]["profile_pic"] = uploaded_file
-        return True
-    return False
+# ---- Map Row Cache ----
+# The live map stays mounted in the browser and only receives marker deltas
+# (see sync_tracking_map), so what is worth caching is the marker rows, not
+# rendered map HTML: they are keyed by store.map_version and shared by every
+# admin session, and an unchanged rerun costs a dictionary lookup. The base
+# map cannot be cached either way, since st_folium attaches the delta layer
+# to the folium object it is given.
+MAP_ROW_CACHE_SIZE = 8
+# Marker colours also depend on location age (30 min) and incident expiry,
+# so cached rows are only reused within the same minute
+MAP_ROW_CACHE_SECONDS = 60
 
-def get_profile_picture(username):
-    """Get profile picture from user data"""
-    if username in st.session_state.registered_users:
-        return st.session_state.registered_users[username].get("profile_pic")
-    return None
 
-# ---- Admin Functions (No Demo Data) ----
-def get_system_stats():
-    """Get comprehensive system statistics for admin dashboard"""
-    total_users = len([u for u in st.session_state.registered_users.values() if u.get("role") != "admin"])
-    active_users = len([u for u in st.session_state.registered_users.values() 
-                       if u.get("role") != "admin" and u.get("status") == "active"])
-    total_emergencies = len(st.session_state.panic_events)
-    today_emergencies = len([e for e in st.session_state.panic_events 
-                           if e["timestamp"].startswith(datetime.datetime.now().strftime("%Y-%m-%d"))])
-    
-    emergency_types = {}
-    for event in st.session_state.panic_events:
-        e_type = event["emergency_type"]
-        emergency_types[e_type] = emergency_types.get(e_type, 0) + 1
+class LRUCache:
+    """Small thread-safe least-recently-used cache"""
     
-    users_in_emergency = len(set([e["username"] for e in st.session_state.panic_events 
-                                if e["timestamp"].startswith(datetime.datetime.now().strftime("%Y-%m-%d"))]))
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.items = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
     
-    recent_location_users = 0
-    five_min_ago = (datetime.datetime.now() - datetime.timedelta(minutes=5)).strftime("%Y-%m-%d %H:%M:%S")
-    for user in st.session_state.registered_users.values():
-        if user.get("role") == "admin":
-            continue
-        loc = user.get("current_location")
-        if loc and loc.get("timestamp", "") >= five_min_ago:
-            recent_location_users += 1
+    def get(self, key):
+        with self.lock:
+            if key in self.items:
+                self.items.move_to_end(key)
+                self.hits += 1
+                return self.items[key]
+            self.misses += 1
+            return None
     
-    return {
-        "total_users": total_users,
-        "active_users": active_users,
-        "total_emergencies": total_emergencies,
-        "today_emergencies": today_emergencies,
-        "emergency_types": emergency_types,
-        "users_in_emergency": users_in_emergency,
-        "recent_location_users": recent_location_users
-    }
+    def put(self, key, value):
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
 
-def export_system_data():
-    """Export system data for backup"""
-    export_data = {
-        "users": st.session_state.registered_users,
-        "panic_events": st.session_state.panic_events,
-        "system_logs": st.session_state.system_logs,
-        "admin_settings": st.session_state.admin_settings,
-        "export_timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    }
-    return json.dumps(export_data, indent=2)
 
-def import_system_data(uploaded_file):
-    """Import system data from backup"""
-    try:
-        data = json.load(uploaded_file)
-        st.session_state.registered_users = data.get("users", st.session_state.registered_users)
-        st.session_state.panic_events = data.get("panic_events", st.session_state.panic_events)
-        st.session_state.system_logs = data.get("system_logs", st.session_state.system_logs)
-        st.session_state.admin_settings = data.get("admin_settings", st.session_state.admin_settings)
-        return True, "System data imported successfully"
-    except Exception as e:
-        return False, f"Error importing data: {str(e)}"
+@st.cache_resource
+def get_map_row_cache():
+    """Tracking map rows shared by all admin sessions"""
+    return LRUCache(MAP_ROW_CACHE_SIZE)
 
-def create_user_report():
-    """Create a comprehensive user report"""
-    users_data = []
-    for username, user_data in st.session_state.registered_users.items():
-        if user_data.get("role") == "admin":
-            continue
-            
-        location = user_data.get('current_location')
-        location_str = f"{location.get('lat', 'N/A')}, {location.get('lng', 'N/A')}" if location else "No location"
-        location_time = location.get('timestamp', 'Never') if location else "Never"
-        
-        users_data.append({
-            "User ID": user_data["id"],
-            "Username": username,
-            "Name": user_data["name"],
-            "Email": user_data["email"],
-            "Phone": user_data["phone"],
-            "Authority": user_data["authority"],
-            "Role": user_data["role"],
-            "Status": user_data.get("status", "active"),
-            "Created At": user_data["created_at"],
-            "Last Login": user_data.get("last_login", "Never"),
-            "Current Location": location_str,
-            "Location Updated": location_time
-        })
-    return pd.DataFrame(users_data)
+def get_tracking_map_rows():
+    """Return {username: row} for every located non-admin user"""
+    cache = get_map_row_cache()
+    key = (id(store), store.map_version, int(time.time() // MAP_ROW_CACHE_SECONDS))
+    rows = cache.get(key)
+    if rows is None:
+        rows = build_tracking_map_rows()
+        cache.put(key, rows)
+    return rows
 
-def create_emergency_report():
-    """Create a comprehensive emergency report"""
-    emergencies_data = []
-    for event in st.session_state.panic_events:
-        emergencies_data.append({
-            "Username": event["username"],
-            "User Name": event.get("user_name", event["username"]),
-            "Emergency Type": event["emergency_type"],
-            "Timestamp": event["timestamp"],
-            "Date": event["date"],
-            "Latitude": event["location"]["lat"],
-            "Longitude": event["location"]["lng"],
-            "Status": "Active" if event["timestamp"].startswith(datetime.datetime.now().strftime("%Y-%m-%d")) else "Resolved"
-        })
-    return pd.DataFrame(emergencies_data)
-
-def create_live_tracking_map():
-    """Create an enhanced folium map with all users' real-time locations"""
-    locations = []
-    for username, user_data in st.session_state.registered_users.items():
-        if user_data.get("role") != "admin" and user_data.get("current_location"):
-            loc = user_data["current_location"]
-            if isinstance(loc, dict) and "lat" in loc and "lng" in loc:
-                locations.append((loc["lat"], loc["lng"]))
-    
-    if locations:
-        avg_lat = sum([loc[0] for loc in locations]) / len(locations)
-        avg_lng = sum([loc[1] for loc in locations]) / len(locations)
-    else:
-        avg_lat, avg_lng = 14.5995, 120.9842  # Default center
-    
-    m = folium.Map(location=[avg_lat, avg_lng], zoom_start=13, control_scale=True)
-    
-    folium.TileLayer(
-        'https://{s}.basemaps.cartocdn.com/light_all/{z}/{x}/{y}{r}.png',
-        name='CartoDB Light',
-        attr='© OpenStreetMap, © CartoDB'
-    ).add_to(m)
-    
-    folium.TileLayer(
-        'https://{s}.basemaps.cartocdn.com/dark_all/{z}/{x}/{y}{r}.png',
-        name='CartoDB Dark',
-        attr='© OpenStreetMap, © CartoDB'
-    ).add_to(m)
-    
-    folium.TileLayer(
-        'OpenStreetMap',
-        name='OpenStreetMap'
-    ).add_to(m)
-    
-    folium.plugins.Fullscreen().add_to(m)
-    folium.plugins.MousePosition().add_to(m)
+def build_tracking_map_rows():
+    """Build the compact marker row for each located user"""
+    store.incidents.expire()
+    rows = {}
     
-    for username, user_data in st.session_state.registered_users.items():
+    for username, user_data in store.users_snapshot():
         if user_data.get("role") == "admin":
             continue
             
@@ -956,135 +4980,92 @@ def create_live_tracking_map():
         except:
             is_recent = False
         
-        if user_data.get("status") == "active" and is_recent:
-            color = "green"
-            status_icon = "🟢"
-        elif user_data.get("status") == "active":
-            color = "orange"
-            status_icon = "🟡"
-        else:
-            color = "gray"
-            status_icon = "⚪"
-        
-        has_emergency = False
-        for event in st.session_state.panic_events:
-            if event["username"] == username and event["timestamp"].startswith(datetime.datetime.now().strftime("%Y-%m-%d")):
-                has_emergency = True
-                color = "red"
-                status_icon = "🔴"
-                break
-        
-        popup_html = f"""
-        <div style="font-family: 'Segoe UI', Arial, sans-serif; min-width: 300px; background: white; border-radius: 10px; overflow: hidden;">
-            <div style="background: linear-gradient(135deg, #667eea, #764ba2); color: white; padding: 12px;">
-                <h4 style="margin: 0; font-size: 16px; color: white;">{user_data['name']}</h4>
-                <p style="margin: 5px 0 0 0; font-size: 12px; opacity: 0.9; color: white;">{username}</p>
-            </div>
-            <div style="padding: 15px;">
-                <div style="display: grid; grid-template-columns: 1fr 1fr; gap: 10px; margin-bottom: 10px;">
-                    <div>
-                        <div style="color: #666; font-size: 11px;">STATUS</div>
-                        <div style="font-weight: bold; font-size: 14px; color: #000;">{status_icon} {user_data.get('status', 'active').title()}</div>
-                    </div>
-                    <div>
-                        <div style="color: #666; font-size: 11px;">ROLE</div>
-                        <div style="font-weight: bold; font-size: 14px; color: #000;">{user_data['role'].title()}</div>
-                    </div>
-                </div>
-                <div style="margin-bottom: 10px;">
-                    <div style="color: #666; font-size: 11px;">CURRENT LOCATION</div>
-                    <div style="font-family: monospace; background: #f5f5f5; padding: 8px; border-radius: 5px; font-size: 12px; color: #000;">
-                        {lat:.6f}, {lng:.6f}
-                    </div>
-                </div>
-                <div style="margin-bottom: 10px;">
-                    <div style="color: #666; font-size: 11px;">LAST UPDATE</div>
-                    <div style="font-size: 12px; color: #000;">{timestamp}</div>
-                    <div style="font-size: 11px; color: #666;">via {source.replace('_', ' ').title()}</div>
-                </div>
-                <div style="margin-bottom: 10px;">
-                    <div style="color: #666; font-size: 11px;">CONTACT</div>
-                    <div style="font-size: 12px; color: #000;">📞 {user_data['phone']}</div>
-                    <div style="font-size: 12px; color: #000;">✉️ {user_data['email']}</div>
-                </div>
-                <a href="https://www.google.com/maps?q={lat},{lng}" target="_blank" 
-                   style="display: block; background: linear-gradient(135deg, #667eea, #764ba2); color: white; 
-                          text-align: center; padding: 8px; border-radius: 5px; text-decoration: none; font-size: 12px;">
-                    📍 Open in Google Maps
-                </a>
-            </div>
-        </div>
-        """
-        
+        has_emergency = store.incidents.has_emergency(username)
         if has_emergency:
-            icon = folium.Icon(
-                color="red",
-                icon="exclamation-triangle",
-                prefix="fa",
-                icon_color="white"
-            )
-            folium.Circle(
-                [lat, lng],
-                radius=200,
-                color="red",
-                weight=2,
-                fill=True,
-                fillColor="red",
-                fillOpacity=0.2,
-                popup="Emergency Zone"
-            ).add_to(m)
+            color, status_icon, icon = "red", "🔴", "exclamation-triangle"
+        elif user_data.get("status") == "active" and is_recent:
+            color, status_icon, icon = "green", "🟢", "user-check"
         elif user_data.get("status") == "active":
-            if is_recent:
-                icon = folium.Icon(
-                    color="green",
-                    icon="user-check",
-                    prefix="fa",
-                    icon_color="white"
-                )
-            else:
-                icon = folium.Icon(
-                    color="orange",
-                    icon="user-clock",
-                    prefix="fa",
-                    icon_color="white"
-                )
+            color, status_icon, icon = "orange", "🟡", "user-clock"
         else:
-            icon = folium.Icon(
-                color="gray",
-                icon="user-slash",
-                prefix="fa",
-                icon_color="white"
-            )
+            color, status_icon, icon = "gray", "⚪", "user-slash"
         
-        folium.Marker(
-            [lat, lng],
-            popup=folium.Popup(popup_html, max_width=350),
-            tooltip=f"<b>{user_data['name']}</b><br>{status_icon} {user_data.get('status', 'active').title()}",
-            icon=icon
-        ).add_to(m)
-        
-        folium.Circle(
-            [lat, lng],
-            radius=50,
-            color=color,
-            weight=1,
-            fill=True,
-            fillColor=color,
-            fillOpacity=0.1
-        ).add_to(m)
+        rows[username] = (
+            lat, lng, user_data['name'], username, color,
+            f"{status_icon} {user_data.get('status', 'active').title()}", user_data['role'].title(),
+            timestamp, source.replace('_', ' ').title(), user_data['phone'], user_data['email'],
+            icon, has_emergency
+        )
+    
+    return rows
+
+def sync_tracking_map(base_key):
+    """Return (delta, changed) with the marker rows this session's map has not seen yet"""
+    client = st.session_state.get("tracking_map_client")
+    # A map that was not on screen last run, or whose base map changed, starts empty;
+    # fragment reruns happen within one script run, so the same run also counts
+    fresh = (client is None or client["key"] != base_key
+             or st.session_state.script_runs - client["run"] not in (0, 1))
+    if fresh:
+        version = client["version"] if client else 0
+        client = {"key": base_key, "version": version, "rows": {}, "delta": None}
+        st.session_state.tracking_map_client = client
+    client["run"] = st.session_state.script_runs
+    
+    rows = get_tracking_map_rows()
+    seen = client["rows"]
+    changed = [row for username, row in rows.items() if seen.get(username) != row]
+    removed = [username for username in seen if username not in rows]
+    if fresh or changed or removed:
+        # Unchanged deltas are resent verbatim so the component skips re-evaluating them
+        client["version"] += 1
+        client["delta"] = {"version": client["version"], "reset": fresh, "rows": changed, "removed": removed}
+        client["rows"] = rows
+        return client["delta"], len(changed) + len(removed)
+    return client["delta"], 0
+
+def create_live_tracking_map(center, clustered):
+    """Create the static base map; user markers are streamed into it by sync_tracking_map"""
+    m = folium.Map(location=center, zoom_start=13, control_scale=True)
+    
+    folium.TileLayer(
+        'https://{s}.basemaps.cartocdn.com/light_all/{z}/{x}/{y}{r}.png',
+        name='CartoDB Light',
+        attr='© OpenStreetMap, © CartoDB'
+    ).add_to(m)
+    
+    folium.TileLayer(
+        'https://{s}.basemaps.cartocdn.com/dark_all/{z}/{x}/{y}{r}.png',
+        name='CartoDB Dark',
+        attr='© OpenStreetMap, © CartoDB'
+    ).add_to(m)
     
+    folium.TileLayer(
+        'OpenStreetMap',
+        name='OpenStreetMap'
+    ).add_to(m)
+    
+    folium.plugins.Fullscreen().add_to(m)
+    folium.plugins.MousePosition().add_to(m)
+    UserMarkerLayer(clustered).add_to(m)
     folium.LayerControl(position='topright').add_to(m)
     
     return m
 
+def tracking_map_center(rows):
+    """Average position of the mapped users"""
+    if not rows:
+        return [14.5995, 120.9842]  # Default center
+    return [sum(row[0] for row in rows.values()) / len(rows),
+            sum(row[1] for row in rows.values()) / len(rows)]
+
 def get_active_emergencies():
     """Get currently active emergencies"""
-    today = datetime.datetime.now().strftime("%Y-%m-%d")
-    active = []
-    for event in st.session_state.panic_events:
-        if event["timestamp"].startswith(today):
-            active.append(event)
-    return active
+    return [event for event in store.event_index.today() if not event.get("resolved_at")]
+
+def resolve_emergency(username):
+    """Close a user's open emergency"""
+    return store.resolve_incident(username)
 
 # ---- Sidebar with User Info ----
 def show_sidebar():
@@ -1155,14 +5136,14 @@ def show_sidebar():
                 """, unsafe_allow_html=True)
             
             if st.button("🚪 Logout", use_container_width=True, key="sidebar_logout"):
-                st.session_state.user = None
-                st.session_state.view = "login"
+                end_session()
                 st.rerun()
 
 # ---- Mini Dashboard (No Demo Data) ----
 def show_mini_dashboard():
-    alerts_sent = len([h for h in st.session_state.history if h["type"] == "alert"])
-    location_updates = len([h for h in st.session_state.history if h["type"] == "location"])
+    history_counts = store.history_type_counts(st.session_state.user["username"])
+    alerts_sent = history_counts.get("alert", 0)
+    location_updates = history_counts.get("location", 0)
     contacts_count = len(st.session_state.contacts)
     
     st.markdown("""
@@ -1199,18 +5180,7 @@ def create_emergency_button():
     protocol = EMERGENCY_PROTOCOLS[st.session_state.emergency_type]
     
     if st.session_state.panic_active:
-        elapsed = time.time() - st.session_state.panic_timer
-        required_duration = st.session_state.settings["panic_duration"]
-        progress = min(elapsed / required_duration, 1.0)
-        st.progress(progress, text=f"HOLDING... {int(elapsed)}s / {required_duration}s")
-        
-        st.warning(f"{protocol['icon']} {protocol['message']}")
-        
-        col1, col2, col3 = st.columns([1, 2, 1])
-        with col2:
-            if st.button("❌ Cancel Alert", key="cancel_panic", use_container_width=True):
-                cancel_panic()
-                st.rerun()
+        show_panic_hold()
     else:
         col1, col2, col3 = st.columns([1, 2, 1])
         with col2:
@@ -1230,11 +5200,29 @@ def create_emergency_button():
             </script>
             """, unsafe_allow_html=True)
 
+@st.fragment(run_every=PANIC_HOLD_REFRESH_SECONDS)
+def show_panic_hold():
+    """Hold countdown; reruns on its own so only the button area redraws"""
+    hold = panic_timers.get(st.session_state.panic_hold)
+    if hold is None or hold["state"] == "fired":
+        st.rerun()  # the alert went out: redraw the page with its result
+    
+    protocol = EMERGENCY_PROTOCOLS[st.session_state.emergency_type]
+    required_duration = hold["due"] - st.session_state.panic_timer
+    elapsed = min(time.time() - st.session_state.panic_timer, required_duration)
+    st.progress(elapsed / required_duration, text=f"HOLDING... {int(elapsed)}s / {required_duration:g}s")
+    
+    st.warning(f"{protocol['icon']} {protocol['message']}")
+    
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col2:
+        if st.button("❌ Cancel Alert", key="cancel_panic", use_container_width=True):
+            cancel_panic()
+            st.rerun()
+
 # ---- Main View ----
 def show_main():
-    if check_panic_timer():
-        send_enhanced_emergency_alert()
-        st.rerun()
+    panic_result = check_panic_timer()
     
     st.markdown('<div class="safe-header"><h1>🛡️ SafeTap Dashboard</h1><p>Emergency Response System</p></div>', unsafe_allow_html=True)
     
@@ -1248,9 +5236,33 @@ def show_main():
         
         st.write("")
     
+    if panic_result:
+        show_panic_result(panic_result)
     create_emergency_button()
+    show_alert_deliveries()
     show_mini_dashboard()
 
+def show_alert_deliveries():
+    """Delivery receipts for the user's latest panic alert"""
+    if st.session_state.last_alert_event is None:
+        return
+    deliveries = store.alert_deliveries(st.session_state.last_alert_event)
+    if not deliveries:
+        return
+    
+    status_icons = {"queued": "⏳", "sending": "📤", "delivered": "✅", "failed": "❌"}
+    delivered = sum(1 for d in deliveries if d["status"] == "delivered")
+    with st.expander(f"📨 Alert delivery: {delivered}/{len(deliveries)} delivered", expanded=delivered < len(deliveries)):
+        st.dataframe(pd.DataFrame([{
+            "Contact": d["contact_name"],
+            "Channel": d["transport"],
+            "To": d["recipient"],
+            "Status": f"{status_icons.get(d['status'], '')} {d['status']}",
+            "Attempts": d["attempts"],
+            "Receipt": d["receipt"] or d["last_error"] or "",
+            "Latency": f"{d['delivered_at'] - d['enqueued_at']:.2f} s" if d["delivered_at"] else ""
+        } for d in deliveries]), use_container_width=True, hide_index=True)
+
 # ---- Profile View ----
 def show_profile():
     st.markdown('<div class="safe-header"><h1>👤 User Profile</h1><p>Manage your account information</p></div>', unsafe_allow_html=True)
@@ -1296,6 +5308,7 @@ def show_profile():
                 authority = st.text_input("Authority", value=st.session_state.user.get('authority', ''), disabled=True)
                 
                 if st.form_submit_button("💾 Update Profile"):
+                    update_user_profile(st.session_state.user["username"], name, email, phone)
                     st.session_state.user['name'] = name
                     st.session_state.user['email'] = email
                     st.session_state.user['phone'] = phone
@@ -1323,6 +5336,7 @@ def show_profile():
             with st.form("new_contact"):
                 new_name = st.text_input("Contact Name")
                 new_number = st.text_input("Phone Number")
+                new_email = st.text_input("Email (optional)")
                 contact_type = st.selectbox("Type", ["Family", "Friend", "Emergency", "Other"])
                 
                 if st.form_submit_button("➕ Add Contact"):
@@ -1330,11 +5344,12 @@ def show_profile():
                         new_contact = {
                             "name": new_name,
                             "number": new_number,
+                            "email": new_email.strip() or None,
                             "type": contact_type.lower(),
                             "icon": "👤",
-                            "priority": 2
+                            "priority": DEFAULT_CONTACT_PRIORITY
                         }
-                        st.session_state.contacts.append(new_contact)
+                        add_contact(new_contact)
                         st.success(f"✅ Added {new_name} to emergency contacts!")
                         st.rerun()
                     else:
@@ -1419,24 +5434,35 @@ def show_settings():
 def show_history():
     st.markdown('<div class="safe-header"><h1>📚 History</h1><p>View your emergency activity history</p></div>', unsafe_allow_html=True)
     
-    if not st.session_state.history:
+    username = st.session_state.user["username"]
+    if not store.history_count(username):
         st.info("📝 No history records yet. Your emergency alerts and activities will appear here.")
     else:
         col1, col2, col3 = st.columns(3)
         with col1:
             filter_type = st.selectbox("Filter by Type", ["All", "Alert", "Location", "System"])
         with col2:
-            date_filter = st.date_input("Filter by Date", value=datetime.datetime.now())
+            date_filter = st.date_input("Filter by Date", value=None)
         with col3:
             search_term = st.text_input("Search History")
         
-        for i, event in enumerate(st.session_state.history):
-            if filter_type != "All" and event["type"] != filter_type.lower():
-                continue
-            
-            if search_term and search_term.lower() not in event["title"].lower() and search_term.lower() not in event["details"].lower():
-                continue
-            
+        event_type = None if filter_type == "All" else filter_type.lower()
+        day = date_filter.isoformat() if date_filter else None
+        
+        # Cursors of the pages visited so far; new filters start again at the first page
+        filters = (username, event_type, day, search_term)
+        pages = st.session_state.get("history_pages")
+        if pages is None or pages["filters"] != filters:
+            pages = st.session_state.history_pages = {"filters": filters, "cursors": [None]}
+        cursors = pages["cursors"]
+        
+        events, next_cursor = store.history_page(username, event_type, day, search_term, cursors[-1])
+        matching = store.history_count(username, event_type, day, search_term)
+        st.caption(f"{matching:,} matching events · page {len(cursors)} of {max(1, -(-matching // HISTORY_PAGE_SIZE))}")
+        if not events:
+            st.info("No history matches these filters")
+        
+        for event in events:
             with st.container():
                 col1, col2 = st.columns([3, 1])
                 
@@ -1453,10 +5479,18 @@ def show_history():
                     st.write(event["details"])
                 
                 with col2:
-                    st.write(f"**{event['date']}**")
+                    st.write(f"**{datetime.datetime.fromisoformat(event['timestamp']).strftime('%B %d, %Y - %H:%M')}**")
                     st.caption(event["timestamp"])
                 
                 st.divider()
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            st.button("⬅️ Newer", use_container_width=True, disabled=len(cursors) == 1,
+                      on_click=cursors.pop)
+        with col2:
+            st.button("Older ➡️", use_container_width=True, disabled=next_cursor is None,
+                      on_click=cursors.append, args=(next_cursor,))
 
 # ---- My Location View ----
 def show_my_location():
@@ -1562,21 +5596,39 @@ def show_my_location():
             """, unsafe_allow_html=True)
 
 # ---- Live Tracking View for Admin ----
+def show_tracking_map():
+    """Live map and its marker caption; run as a fragment so it refreshes on its own"""
+    clustered = use_clustered_map()
+    delta, changed = sync_tracking_map(("clustered" if clustered else "individual", id(store)))
+    client = st.session_state.tracking_map_client
+    if "center" not in client:
+        client["center"] = tracking_map_center(client["rows"])
+    delta_group = folium.FeatureGroup(name="Marker updates", control=False)
+    UserMarkerDelta(delta).add_to(delta_group)
+    focus = st.session_state.get("map_focus")
+    # Base map stays mounted across reruns, so pan and zoom survive refreshes;
+    # center/zoom only move the view when a new focus point is requested
+    st_folium(
+        create_live_tracking_map(client["center"], clustered),
+        key="live_tracking_map",
+        width=1200,
+        height=600,
+        returned_objects=[],
+        feature_group_to_add=delta_group,
+        center=focus,
+        zoom=16 if focus else None
+    )
+    update_note = f"{changed} marker updates sent ({len(json.dumps(delta)) / 1024:,.1f} KB)" if changed else "no marker changes"
+    st.caption(f"🗺️ {len(client['rows'])} located users · "
+               f"{'clustered' if clustered else 'individual'} markers · {update_note}")
+
 def show_live_tracking():
     st.markdown('<div class="safe-header"><h1>🗺️ Live User Tracking</h1><p>Real-time location tracking</p></div>', unsafe_allow_html=True)
     
-    total_users = len([u for u in st.session_state.registered_users.values() if u.get("role") != "admin"])
-    active_users = len([u for u in st.session_state.registered_users.values() 
-                       if u.get("role") != "admin" and u.get("status") == "active"])
-    
-    recent_users = 0
-    five_min_ago = (datetime.datetime.now() - datetime.timedelta(minutes=5)).strftime("%Y-%m-%d %H:%M:%S")
-    for user in st.session_state.registered_users.values():
-        if user.get("role") == "admin":
-            continue
-        loc = user.get("current_location")
-        if loc and loc.get("timestamp", "") >= five_min_ago:
-            recent_users += 1
+    stats = get_system_stats()
+    total_users = stats["total_users"]
+    active_users = stats["active_users"]
+    recent_users = stats["recent_location_users"]
     
     update_interval = st.session_state.admin_settings.get("location_update_interval", 30)
     
@@ -1592,8 +5644,8 @@ def show_live_tracking():
     
     col1, col2, col3, col4 = st.columns(4)
     with col1:
-        if st.button("🔄 Refresh Map", use_container_width=True):
-            st.rerun()
+        # The click itself reruns the script; the map then receives only changed markers
+        st.button("🔄 Refresh Map", use_container_width=True)
     with col2:
         show_history_toggle = st.checkbox("Show Location History")
     
@@ -1603,8 +5655,7 @@ def show_live_tracking():
         st.info("No users registered yet. Users will appear here once they register and set their location.")
     else:
         st.markdown('<div class="map-container">', unsafe_allow_html=True)
-        live_map = create_live_tracking_map()
-        folium_static(live_map, width=1200, height=600)
+        st.fragment(show_tracking_map, run_every=update_interval)()
         st.markdown('</div>', unsafe_allow_html=True)
         
         st.markdown("""
@@ -1622,50 +5673,22 @@ def show_live_tracking():
         
         st.subheader("📋 User Location List")
         
-        location_data = []
-        for username, user_data in st.session_state.registered_users.items():
-            if user_data.get("role") == "admin":
-                continue
-                
-            location = user_data.get("current_location")
-            lat = location.get("lat", "N/A") if location else "N/A"
-            lng = location.get("lng", "N/A") if location else "N/A"
-            timestamp = location.get("timestamp", "Never") if location else "Never"
-            source = location.get("source", "unknown") if location else "unknown"
-            
-            has_emergency = False
-            for event in st.session_state.panic_events:
-                if event["username"] == username and event["timestamp"].startswith(datetime.datetime.now().strftime("%Y-%m-%d")):
-                    has_emergency = True
-                    break
-            
-            status = "🔴 EMERGENCY" if has_emergency else "🟢 Active" if user_data.get("status") == "active" else "⚪ Inactive"
-            
-            location_data.append({
-                "User": user_data["name"],
-                "Username": username,
-                "Status": status,
-                "Latitude": f"{lat:.6f}" if lat != "N/A" else "N/A",
-                "Longitude": f"{lng:.6f}" if lng != "N/A" else "N/A",
-                "Last Update": timestamp,
-                "Source": source.replace("_", " ").title() if source != "unknown" else "Unknown"
-            })
-        
-        if location_data:
-            df = pd.DataFrame(location_data)
-            st.dataframe(df, use_container_width=True, hide_index=True)
-            
-            csv = df.to_csv(index=False)
-            st.download_button(
-                label="📥 Download Location Report (CSV)",
-                data=csv,
-                file_name=f"user_locations_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                mime="text/csv"
+        location_report = build_report("locations")
+        if not location_report.empty:
+            st.dataframe(
+                location_report,
+                use_container_width=True,
+                hide_index=True,
+                column_config={
+                    "Latitude": st.column_config.NumberColumn(format="%.6f"),
+                    "Longitude": st.column_config.NumberColumn(format="%.6f")
+                }
             )
+            show_report_downloads("locations", "user_locations", "Location Report")
         
         if show_history_toggle:
             st.subheader("📍 Location History")
-            user_list = [u for u in st.session_state.registered_users.keys() if u != "admin"]
+            user_list = [u for u, _ in store.users_snapshot() if u != "admin"]
             if user_list:
                 selected_user = st.selectbox("Select user to view history", user_list)
                 
@@ -1674,15 +5697,13 @@ def show_live_tracking():
                     history = user_data.get("location_history", [])
                     
                     if history:
-                        for entry in history[:20]:
-                            with st.container():
-                                col1, col2 = st.columns([3, 1])
-                                with col1:
-                                    st.write(f"📍 **Location:** {entry['lat']:.6f}, {entry['lng']:.6f}")
-                                    st.caption(f"Source: {entry['source'].replace('_', ' ').title()}")
-                                with col2:
-                                    st.write(f"🕐 {entry['timestamp']}")
-                                st.divider()
+                        show_track_map(selected_user)
+                        with store.lock:
+                            recent = pd.DataFrame(history[:20])
+                        recent["source"] = recent["source"].str.replace("_", " ").str.title()
+                        st.dataframe(recent.rename(columns={"lat": "Latitude", "lng": "Longitude",
+                                                            "timestamp": "Time", "source": "Source"}),
+                                     use_container_width=True, hide_index=True)
                     else:
                         st.info("No location history for this user")
 
@@ -1731,38 +5752,35 @@ def show_admin_dashboard():
         st.subheader("🚨 Active Emergencies Now")
         for event in active_emergencies[:5]:
             with st.container():
-                col1, col2, col3 = st.columns([2, 2, 1])
+                col1, col2, col3, col4 = st.columns([2, 2, 1, 1])
                 with col1:
                     st.write(f"**{event.get('user_name', event['username'])}**")
                     st.caption(event['emergency_type'].title())
                 with col2:
                     location = event['location']
                     st.write(f"📍 {location['lat']:.6f}, {location['lng']:.6f}")
+                    nearby = find_users_near(location['lat'], location['lng'], NEARBY_USERS_RADIUS_M,
+                                             exclude=event['username'])
+                    st.caption(f"👥 {len(nearby)} users within {NEARBY_USERS_RADIUS_M} m")
                 with col3:
-                    if st.button(f"View on Map", key=f"view_active_{event['timestamp']}"):
+                    if st.button(f"View on Map", key=f"view_active_{event['id']}"):
+                        st.session_state.map_focus = [location['lat'], location['lng']]
                         st.session_state.view = "live_tracking"
                         st.rerun()
+                with col4:
+                    if st.button("✅ Resolve", key=f"resolve_active_{event['id']}"):
+                        resolve_emergency(event["username"])
+                        st.success(f"Emergency for {event['username']} resolved")
+                        st.rerun()
                 st.divider()
     
     st.subheader("📍 Recent Location Updates")
-    recent_locations = []
-    for username, user_data in st.session_state.registered_users.items():
-        if user_data.get("role") == "admin":
-            continue
-        loc = user_data.get("current_location")
-        if loc and "timestamp" in loc:
-            recent_locations.append({
-                "User": user_data["name"],
-                "Location": f"{loc.get('lat', 'N/A')}, {loc.get('lng', 'N/A')}",
-                "Time": loc.get('timestamp', 'Unknown'),
-                "Source": loc.get('source', 'unknown')
-            })
-    
-    recent_locations.sort(key=lambda x: x["Time"], reverse=True)
+    recent_locations = store.recent_locations(10)
     
     if recent_locations:
-        for loc in recent_locations[:10]:
-            st.caption(f"👤 {loc['User']} - 📍 {loc['Location']} - 🕐 {loc['Time']} - via {loc['Source']}")
+        for loc in recent_locations:
+            st.caption(f"👤 {loc['name']} - 📍 {loc['loc_lat']}, {loc['loc_lng']} - 🕐 {loc['loc_timestamp']} "
+                       f"- via {loc['loc_source'] or 'unknown'}")
     else:
         st.info("No location updates yet")
     
@@ -1788,20 +5806,29 @@ def show_user_management():
         
         col1, col2 = st.columns([2, 1])
         with col1:
-            search_term = st.text_input("🔍 Search users by name, email, or username")
+            search_term = st.text_input("🔍 Search users by name, email, phone, or username")
         with col2:
             role_filter = st.selectbox("Filter by Role", ["All", "admin", "user"])
         
+        # New search terms start again at the first page
+        if st.session_state.get("user_list_filters") != (search_term, role_filter):
+            st.session_state.user_list_filters = (search_term, role_filter)
+            st.session_state.user_list_page = 1
+        role = None if role_filter == "All" else role_filter
+        page = st.session_state.get("user_list_page", 1)
+        usernames, total = store.search_users(search_term, role, exclude=("admin",),
+                                              offset=(page - 1) * USER_PAGE_SIZE)
+        if not usernames and page > 1:
+            # Users were removed since the page was picked; show the last page instead
+            page = st.session_state.user_list_page = max(1, -(-total // USER_PAGE_SIZE))
+            usernames, total = store.search_users(search_term, role, exclude=("admin",),
+                                                  offset=(page - 1) * USER_PAGE_SIZE)
+        
         users_data = []
-        for username, user_data in st.session_state.registered_users.items():
-            if username == "admin":
-                continue
-                
-            if search_term and search_term.lower() not in username.lower() and search_term.lower() not in user_data['name'].lower() and search_term.lower() not in user_data['email'].lower():
-                continue
-            if role_filter != "All" and user_data['role'] != role_filter:
-                continue
-                
+        for username in usernames:
+            user_data = st.session_state.registered_users.get(username)
+            if user_data is None:
+                continue  # deleted since the page was read
             location = user_data.get('current_location')
             location_str = f"{location.get('lat', 'N/A')}, {location.get('lng', 'N/A')}" if location else "Not set"
             location_time = location.get('timestamp', 'Never') if location else "Never"
@@ -1822,6 +5849,14 @@ def show_user_management():
         if users_data:
             df = pd.DataFrame(users_data)
             st.dataframe(df, use_container_width=True, hide_index=True)
+            pages = max(1, -(-total // USER_PAGE_SIZE))
+            col1, col2 = st.columns([3, 1])
+            with col1:
+                st.caption(f"Showing {(page - 1) * USER_PAGE_SIZE + 1:,}–{(page - 1) * USER_PAGE_SIZE + len(users_data):,} "
+                           f"of {total:,} matching users")
+            with col2:
+                if pages > 1:
+                    st.number_input("Page", min_value=1, max_value=pages, key="user_list_page")
             
             st.subheader("User Actions")
             selected_user = st.selectbox("Select user to manage", [u["Username"] for u in users_data])
@@ -1832,25 +5867,28 @@ def show_user_management():
                 
                 with col1:
                     if st.button("🔄 Reset Password", key="reset_pass"):
-                        st.session_state.registered_users[selected_user]["password"] = "temp123"
+                        reset_user_password(selected_user, "temp123")
                         st.success(f"Password reset to 'temp123' for {selected_user}")
                 
                 with col2:
                     new_status = "suspended" if user_data.get('status') == 'active' else 'active'
                     if st.button(f"🔒 {new_status.title()} User", key="toggle_status"):
-                        st.session_state.registered_users[selected_user]["status"] = new_status
+                        set_user_status(selected_user, new_status)
                         st.success(f"User {selected_user} {new_status}")
                         st.rerun()
                 
                 with col3:
                     if st.button("📍 View on Map", key="view_location"):
+                        location = user_data.get("current_location")
+                        if location:
+                            st.session_state.map_focus = [location["lat"], location["lng"]]
                         st.session_state.view = "live_tracking"
                         st.rerun()
                 
                 with col4:
                     if st.button("🗑️ Delete User", key="delete_user"):
                         if selected_user != st.session_state.user["username"]:
-                            del st.session_state.registered_users[selected_user]
+                            delete_user(selected_user)
                             st.success(f"User {selected_user} deleted")
                             st.rerun()
                         else:
@@ -1892,30 +5930,20 @@ def show_user_management():
         
         with col1:
             if st.button("📋 Generate User Report", use_container_width=True):
-                user_report = create_user_report()
+                user_report = build_report("users", limit=REPORT_PREVIEW_ROWS)
                 if not user_report.empty:
                     st.dataframe(user_report, use_container_width=True)
-                    
-                    csv = user_report.to_csv(index=False)
-                    st.download_button(
-                        label="📥 Download User Report (CSV)",
-                        data=csv,
-                        file_name=f"user_report_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                        mime="text/csv"
-                    )
+                    total = report_row_count("users")
+                    if total > len(user_report):
+                        st.caption(f"Showing the first {len(user_report):,} of {total:,} users")
+                    show_report_downloads("users", "user_report", "User Report")
                 else:
                     st.info("No users to report")
         
         with col2:
             if st.button("📊 User Statistics", use_container_width=True):
                 stats = get_system_stats()
-                
-                roles = {}
-                for user in st.session_state.registered_users.values():
-                    if user.get("role") == "admin":
-                        continue
-                    role = user['role']
-                    roles[role] = roles.get(role, 0) + 1
+                roles = stats["users_by_role"]
                 
                 if roles and PLOTLY_AVAILABLE:
                     fig = px.pie(
@@ -1936,22 +5964,62 @@ def show_system_analytics():
     with tab1:
         st.subheader("System Performance Metrics")
         st.info("Performance metrics will be displayed here based on actual system data.")
+        
+        st.write("**📡 GPS Fix Ingestion**")
+        if fix_ingest_server.error:
+            st.warning(f"Ingestion endpoint not running: {fix_ingest_server.error}")
+        elif not INGEST_PORT:
+            st.info("Ingestion endpoint is disabled (SAFETAP_INGEST_PORT=0)")
+        elif not fix_ingest_server.running:
+            st.info("Ingestion endpoint is disabled until SAFETAP_INGEST_TOKEN is set")
+        else:
+            ingest = fix_ingest_server.metrics()
+            col1, col2, col3, col4 = st.columns(4)
+            with col1:
+                st.metric("Endpoint", f"{INGEST_HOST}:{INGEST_PORT}")
+            with col2:
+                st.metric("Batches", ingest["batches"])
+            with col3:
+                st.metric("Fixes Accepted", ingest["fixes_accepted"], f"{ingest['fixes_rejected']} rejected")
+            with col4:
+                st.metric("Avg Batch Time", f"{ingest['avg_batch_ms']:.1f} ms")
+        
+        st.write("**📨 Alert Dispatch**")
+        if not alert_dispatcher.running:
+            st.warning(f"Alert dispatcher not running: {alert_dispatcher.error or 'stopped'}")
+        else:
+            dispatch = alert_dispatcher.metrics()
+            queue = store.alert_queue_counts()
+            col1, col2, col3, col4 = st.columns(4)
+            with col1:
+                st.metric("Queued", queue.get("queued", 0) + queue.get("sending", 0), f"{dispatch['in_flight']} in flight")
+            with col2:
+                st.metric("Delivered", dispatch["delivered"], f"{dispatch['retried']} retries")
+            with col3:
+                st.metric("Failed", dispatch["failed"])
+            with col4:
+                st.metric("Dispatch Latency p50 / p95", f"{dispatch['p50_ms']:.0f} / {dispatch['p95_ms']:.0f} ms")
+            timers = panic_timers.metrics()
+            st.caption(f"Panic hold timer: {timers['fired']:,} fired, {timers['armed']} armed; trigger jitter "
+                       f"p50 {timers['p50_ms']:.1f} ms, p95 {timers['p95_ms']:.1f} ms, max {timers['max_ms']:.1f} ms")
+            limits = alert_limiter.metrics()
+            st.caption(f"Rate limiter: {limits['admitted']:,} alerts sent, {limits['merged']:,} repeats merged into open incidents, "
+                       f"{limits['paced']:,} messages paced (max delay {limits['max_delay']:.1f} s), "
+                       f"{limits['tracked']:,} entries tracked")
+            st.caption("Transports: " + ", ".join(f"{name} ({type(t).__name__}, {t.concurrency} concurrent)"
+                                                  for name, t in sorted(alert_dispatcher.transports.items())))
     
     with tab2:
         st.subheader("Emergency Analytics")
         
         if st.session_state.panic_events:
-            emergency_report = create_emergency_report()
+            emergency_report = build_report("emergencies", limit=REPORT_PREVIEW_ROWS)
             if not emergency_report.empty:
                 st.dataframe(emergency_report, use_container_width=True)
-                
-                csv = emergency_report.to_csv(index=False)
-                st.download_button(
-                    label="📥 Download Emergency Report (CSV)",
-                    data=csv,
-                    file_name=f"emergency_report_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                    mime="text/csv"
-                )
+                total = report_row_count("emergencies")
+                if total > len(emergency_report):
+                    st.caption(f"Showing the latest {len(emergency_report):,} of {total:,} emergencies")
+                show_report_downloads("emergencies", "emergency_report", "Emergency Report")
         else:
             st.info("No emergency data available for analytics")
     
@@ -1964,22 +6032,53 @@ def show_system_analytics():
             st.subheader("📤 Export System Data")
             st.write("Export all system data for backup or analysis")
             
-            export_data = export_system_data()
+            last_backup = store.get_meta("backup_high_water")
+            if last_backup:
+                st.caption(f"Last backup: {last_backup['created_at']} ({last_backup['mode']}, "
+                           f"{last_backup['records']:,} records, {last_backup['bytes'] / 1024:,.0f} KB "
+                           f"in {last_backup['seconds']:.1f} s)")
+            backup_mode = st.radio("Backup type", ["Full", "Incremental"], horizontal=True,
+                                   disabled=last_backup is None,
+                                   help="Incremental backups contain only changes since the last confirmed backup")
+            compression = st.selectbox("Compression", list(BACKUP_COMPRESSIONS))
+            extension, mime = BACKUP_COMPRESSIONS[compression]
+            incremental = backup_mode == "Incremental"
+            admin_settings = dict(st.session_state.admin_settings)
             st.download_button(
                 label="📥 Download System Backup",
-                data=export_data,
-                file_name=f"safetap_backup_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
-                mime="application/json"
+                # Built on click, off the script thread
+                data=lambda: export_system_data(incremental, compression, admin_settings),
+                file_name=f"safetap_backup_{'incr' if incremental else 'full'}_"
+                          f"{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}",
+                mime=mime,
+                on_click="ignore"
             )
+            pending = store.get_meta("backup_pending")
+            if pending and pending != last_backup:
+                st.caption(f"Unconfirmed {pending['mode']} backup from {pending['created_at']} "
+                           f"({pending['records']:,} records). Incremental backups continue from the last "
+                           "confirmed backup until you confirm the file was saved.")
+                if st.button("✅ Confirm Backup Saved", key="confirm_backup"):
+                    confirm_backup(pending)
+                    st.rerun()
+            
+            st.write(f"Export the location fix history ({report_row_count('location_fixes'):,} fixes)")
+            show_report_downloads("location_fixes", "location_fixes", "Location Fixes")
         
         with col2:
             st.subheader("📥 Import System Data")
             st.write("Import system data from backup file")
             
-            uploaded_file = st.file_uploader("Choose backup file", type="json")
+            uploaded_file = st.file_uploader("Choose backup file", type=["gz", "zst", "ndjson", "json"])
             if uploaded_file is not None:
+                import_mode = st.radio("Import mode", list(BACKUP_IMPORT_MODES), format_func=BACKUP_IMPORT_MODES.get)
                 if st.button("🔄 Import Data"):
-                    success, message = import_system_data(uploaded_file)
+                    progress_bar = st.progress(0.0, text="Importing backup...")
+                    success, message = import_system_data(
+                        uploaded_file, import_mode,
+                        progress=lambda fraction, stats: progress_bar.progress(
+                            fraction, text=f"Importing backup... {stats['records']:,} records")
+                    )
                     if success:
                         st.success(f"✅ {message}")
                         st.rerun()
@@ -1991,11 +6090,8 @@ def show_system_analytics():
         
         with col1:
             if st.button("🗑️ Clear Old History", use_container_width=True):
-                if len(st.session_state.history) > 100:
-                    st.session_state.history = st.session_state.history[:100]
-                    st.success("✅ Old history cleared")
-                else:
-                    st.info("No old history to clear")
+                retention_job.request_run()
+                st.success(f"✅ Clearing history older than {retention_job.settings['days']} days in the background")
 
 # ---- System Settings ----
 def show_system_settings():
@@ -2033,19 +6129,57 @@ def show_system_settings():
                 max_value=300,
                 value=st.session_state.admin_settings.get("location_update_interval", 30)
             )
+            
+            st.session_state.admin_settings["map_cluster_threshold"] = st.number_input(
+                "Cluster Map Markers Above (users)",
+                min_value=10,
+                max_value=100000,
+                value=st.session_state.admin_settings.get("map_cluster_threshold", 300)
+            )
         
         with col2:
-            st.session_state.admin_settings["auto_backup"] = st.toggle(
-                "Automatic Backups",
-                value=st.session_state.admin_settings.get("auto_backup", True)
+            # The snapshot schedule is shared by every session, so it is read from the scheduler
+            schedule = snapshot_scheduler.settings
+            auto_backup = st.toggle("Automatic Backups", value=schedule["enabled"])
+            st.session_state.admin_settings["auto_backup"] = auto_backup
+            backup_interval = st.number_input(
+                "Backup Interval (minutes)",
+                min_value=5,
+                max_value=1440,
+                value=schedule["interval_minutes"],
+                disabled=not auto_backup
             )
+            backup_keep = st.number_input(
+                "Snapshots Kept",
+                min_value=1,
+                max_value=100,
+                value=schedule["keep"],
+                disabled=not auto_backup
+            )
+            snapshot_scheduler.configure(auto_backup, backup_interval, backup_keep)
+            show_snapshot_status()
+            if st.button("💾 Snapshot Now", disabled=snapshot_scheduler.running):
+                snapshot_scheduler.request_snapshot()
+                st.info("Snapshot started in the background")
             
-            st.session_state.admin_settings["data_retention_days"] = st.slider(
+            retention = retention_job.settings
+            retention_days = st.slider(
                 "Data Retention (days)",
                 min_value=30,
                 max_value=365,
-                value=st.session_state.admin_settings.get("data_retention_days", 90)
+                value=retention["days"]
+            )
+            st.session_state.admin_settings["data_retention_days"] = retention_days
+            retention_rollup = st.toggle(
+                "Keep Daily Summaries of Expired Data",
+                value=retention["rollup"],
+                help="Count expired fixes, history, panic events and log entries per day before removing them"
             )
+            retention_job.configure(retention_days, retention_rollup)
+            show_retention_status()
+            if st.button("🧹 Enforce Retention Now", disabled=retention_job.running):
+                retention_job.request_run()
+                st.info("Retention run started in the background")
             
             st.session_state.admin_settings["system_status"] = st.selectbox(
                 "System Status",
@@ -2059,12 +6193,17 @@ def show_system_settings():
         col1, col2 = st.columns(2)
         
         with col1:
-            st.session_state.admin_settings["alert_cooldown"] = st.number_input(
+            # The cooldown is shared by every session, so it is read from the limiter
+            alert_cooldown = st.number_input(
                 "Alert Cooldown (seconds)",
                 min_value=60,
                 max_value=3600,
-                value=st.session_state.admin_settings.get("alert_cooldown", 300)
+                value=alert_limiter.cooldown,
+                help="Repeat panic presses of the same type inside this window are merged into the open incident"
             )
+            st.session_state.admin_settings["alert_cooldown"] = alert_cooldown
+            if alert_cooldown != alert_limiter.cooldown:
+                alert_limiter.configure(alert_cooldown)
         
         with col2:
             enable_location_tracking = st.toggle("Enable Location Tracking", value=True)
@@ -2082,14 +6221,21 @@ def show_system_settings():
             enable_2fa = st.toggle("Enable Two-Factor Authentication", value=False)
             session_timeout = st.selectbox(
                 "Session Timeout",
-                options=["15 minutes", "30 minutes", "1 hour", "4 hours", "8 hours"],
-                index=2
+                options=list(SESSION_TIMEOUTS),
+                index=list(SESSION_TIMEOUTS).index(sessions.timeout_label),
+                help="Signed-in sessions end after this long without activity"
             )
+            sessions.configure(session_timeout)
         
         with col2:
             enable_audit_log = st.toggle("Enable Audit Logging", value=True)
             max_login_attempts = st.number_input("Max Login Attempts", min_value=3, max_value=10, value=5)
         
+        st.caption(f"🔐 Passwords are hashed with scrypt (n={credentials.n:,}, about {credentials.hash_seconds * 1000:.0f} ms "
+                   f"per hash on {credentials.workers} worker thread{'s' if credentials.workers != 1 else ''}); "
+                   f"{credentials.rehashed:,} legacy records upgraded at login; "
+                   f"{len(sessions):,} active sign-in sessions, {sessions.resumed:,} resumed from a cookie")
+        
         st.subheader("Danger Zone")
         
         col1, col2 = st.columns(2)
@@ -2102,9 +6248,10 @@ def show_system_settings():
                     "auto_backup": True,
                     "data_retention_days": 90,
                     "max_users": 1000,
-                    "alert_cooldown": 300,
+                    "alert_cooldown": alert_limiter.cooldown,  # shared; changed only through its own setting
                     "system_status": "operational",
-                    "location_update_interval": 30
+                    "location_update_interval": 30,
+                    "map_cluster_threshold": 300
                 }
                 st.success("✅ All settings reset to defaults")
         
@@ -2152,19 +6299,12 @@ def show_login():
                     if authenticated:
                         expected_role = "admin" if role == "Admin" else "user"
                         if user_data.get("role") == expected_role:
-                            st.session_state.user = user_data
-                            st.session_state.user["username"] = username
-                            
-                            if user_data.get("role") == "admin":
-                                st.session_state.view = "admin_dashboard"
-                            else:
-                                st.session_state.view = "main"
-                            
-                            st.success(f"✅ Welcome back, {user_data['name']}!")
-                            time.sleep(1)
+                            begin_session(username)
                             st.rerun()
                         else:
                             st.error(f"❌ This account is not registered as {role}")
+                    elif user_data is not None:
+                        st.error("❌ This account is suspended; contact an administrator")
                     else:
                         st.error("❌ Invalid username or password")
                 else:
@@ -2194,11 +6334,7 @@ def show_login():
                                 new_username, new_password, new_name, new_email, new_phone, new_authority, "user"
                             )
                             if success:
-                                st.success(f"✅ {message}")
-                                st.session_state.user = st.session_state.registered_users[new_username]
-                                st.session_state.user["username"] = new_username
-                                st.session_state.view = "main"
-                                time.sleep(2)
+                                begin_session(new_username)
                                 st.rerun()
                             else:
                                 st.error(f"❌ {message}")
@@ -2210,6 +6346,16 @@ def show_login():
         st.markdown('</div>', unsafe_allow_html=True)
 
 # ---- Main App Logic ----
+snapshot_scheduler = get_snapshot_scheduler()
+retention_job = get_retention_job()
+
+if st.session_state.user is None:
+    resume_session()
+elif st.session_state.session_token and sessions.validate(st.session_state.session_token) is None:
+    end_session()
+    st.warning("⏱️ Your session has expired. Please sign in again.")
+write_session_cookie()
+
 if st.session_state.user and st.session_state.view not in ["login", "signup"]:
     show_sidebar()
 
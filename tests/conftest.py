@@ -0,0 +1,99 @@
+import json
+import pathlib
+import runpy
+import shutil
+import subprocess
+
+import pytest
+import streamlit as st
+
+APP = pathlib.Path(__file__).resolve().parent.parent / "SAFETAP.py"
+
+
+@pytest.fixture(scope="session")
+def app(tmp_path_factory):
+    """The app's module namespace, run once in bare mode against a scratch database"""
+    root = tmp_path_factory.mktemp("safetap")
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv("SAFETAP_DB_PATH", str(root / "safetap.db"))
+        mp.setenv("SAFETAP_SNAPSHOT_DIR", str(root / "snapshots"))
+        mp.setenv("SAFETAP_INGEST_PORT", "0")
+        st.cache_resource.clear()
+        yield runpy.run_path(str(APP))
+    st.cache_resource.clear()
+
+
+@pytest.fixture
+def store(app):
+    return app["store"]
+
+
+@pytest.fixture
+def fresh_store(app, tmp_path):
+    """A separate, empty store for tests that need exact counts"""
+    store = app["SafeTapStore"](str(tmp_path / "fresh.db"))
+    yield store
+    store.conn.close()
+
+
+@pytest.fixture
+def make_user(app):
+    """Build user records from one copy of the default admin record (hashing its password once)"""
+    base = app["default_admin_record"]()
+    
+    def make(name, role="user", **fields):
+        return base | {"name": name, "role": role, "id": name.upper(), "location_history": []} | fields
+    return make
+
+
+MARKER_JS_HARNESS = """
+function layer(kind) {
+    return {
+        kind: kind, children: [],
+        addTo: function (parent) { parent.children.push(this); return this; },
+        bindTooltip: function (f) { this.tooltip = f; return this; },
+        bindPopup: function (f) { this.popup = f; return this; },
+        clearLayers: function () { this.children = []; },
+        removeLayer: function (l) { this.children = this.children.filter(function (c) { return c !== l; }); },
+        addLayers: function (ls) { this.children = this.children.concat(ls); },
+        removeLayers: function (ls) { this.children = this.children.filter(function (c) { return ls.indexOf(c) < 0; }); }
+    };
+}
+var window = {};
+var L = {
+    LatLng: function (lat, lng) { this.lat = lat; this.lng = lng; },
+    featureGroup: function () { return layer("group"); },
+    markerClusterGroup: function () { return layer("clusters"); },
+    circle: function () { return layer("circle"); },
+    marker: function () { return layer("marker"); },
+    circleMarker: function () { return layer("circleMarker"); },
+    AwesomeMarkers: {icon: function (options) { return options; }}
+};
+var input = JSON.parse(require("fs").readFileSync(0, "utf8"));
+eval(input.js);
+safetapCreateUserLayer(layer("map"), input.clustered);
+input.deltas.forEach(safetapApplyUserDelta);
+var state = window.safetapUserState, users = {};
+Object.keys(state.byUser).forEach(function (username) {
+    var entry = state.byUser[username];
+    var marker = entry.clustered ? entry.layer : entry.layer.children.filter(function (c) { return c.kind === "marker"; })[0];
+    users[username] = {clustered: entry.clustered, parts: entry.clustered ? 1 : entry.layer.children.length,
+                       popup: marker.popup(), tooltip: marker.tooltip()};
+});
+console.log(JSON.stringify({version: state.version, markers: state.markers.children.length,
+                            clusters: state.clusters ? state.clusters.children.length : null, users: users}));
+"""
+
+
+@pytest.fixture
+def apply_marker_deltas(app):
+    """Run the tracking map's marker JS in node against a stub Leaflet and report the resulting layers"""
+    node = shutil.which("node")
+    if node is None:
+        pytest.skip("node is not installed")
+    
+    def run(clustered, deltas):
+        payload = json.dumps({"js": app["USER_MARKER_JS"], "clustered": clustered, "deltas": deltas})
+        result = subprocess.run([node, "-e", MARKER_JS_HARNESS], input=payload, capture_output=True, text=True, check=True)
+        return json.loads(result.stdout)
+    return run
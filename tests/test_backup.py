@@ -0,0 +1,60 @@
+import gzip
+import io
+import json
+
+from streamlit.runtime.download_data_util import convert_data_to_bytes_and_infer_mime
+
+
+def backup_records(data):
+    payload, _ = convert_data_to_bytes_and_infer_mime(data, ValueError("unsupported download data"))
+    return [json.loads(line) for line in gzip.decompress(payload).decode("utf-8").splitlines()]
+
+
+def full_backup(app):
+    """Take a full backup and confirm it, so incrementals continue from it"""
+    records = backup_records(app["export_system_data"]())
+    app["confirm_backup"](app["store"].get_meta("backup_pending"))
+    return records
+
+
+def test_export_streams_a_downloadable_file(app):
+    app["register_user"]("backup_user", "pw", "Backup User", "b@example.com", "0917 111 1111")
+    data = app["export_system_data"]()
+    assert isinstance(data, io.BufferedReader)
+    records = backup_records(data)
+    assert data.closed
+    assert records[0]["kind"] == "header" and records[0]["mode"] == "full"
+    assert records[-1]["kind"] == "end"
+    assert records[-1]["records"] == len(records) - 2
+    assert any(r["kind"] == "user" and r["username"] == "backup_user" for r in records)
+
+
+def test_incremental_export_contains_only_changes(app):
+    full_backup(app)
+    app["register_user"]("backup_later", "pw", "Later", "l@example.com", "0917 222 2222")
+    records = backup_records(app["export_system_data"](incremental=True))
+    assert records[0]["mode"] == "incremental"
+    users = [r["username"] for r in records if r["kind"] == "user"]
+    assert users == ["backup_later"]
+
+
+def test_unconfirmed_backup_does_not_move_the_incremental_base(app):
+    full_backup(app)
+    app["register_user"]("backup_lost", "pw", "Lost", "x@example.com", "0917 333 3333")
+    backup_records(app["export_system_data"](incremental=True))  # generated but never saved
+    records = backup_records(app["export_system_data"](incremental=True))
+    assert [r["username"] for r in records if r["kind"] == "user"] == ["backup_lost"]
+    
+    app["confirm_backup"](app["store"].get_meta("backup_pending"))
+    records = backup_records(app["export_system_data"](incremental=True))
+    assert not [r for r in records if r["kind"] == "user"]
+
+
+def test_confirming_an_older_backup_does_not_rewind_the_base(app):
+    full_backup(app)
+    older = app["store"].get_meta("backup_pending")
+    app["register_user"]("backup_newer", "pw", "Newer", "n@example.com", "0917 444 4444")
+    full_backup(app)
+    app["confirm_backup"](older)
+    records = backup_records(app["export_system_data"](incremental=True))
+    assert not [r for r in records if r["kind"] == "user"]
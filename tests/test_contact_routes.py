@@ -0,0 +1,74 @@
+import pytest
+import streamlit as st
+
+
+def contact(name, kind, priority, number=None, email=None):
+    return {"name": name, "type": kind, "priority": priority, "number": number, "email": email}
+
+
+CONTACTS = [
+    contact("Alex", "friend", 2, "0917 111 1111"),
+    contact("Bea", "family", 3, "0917-222-2222"),
+    contact("Cris", "friend", 1, "0917 333 3333"),
+    contact("Dina", "family", 2, "09172222222"),
+    contact("Eli", "emergency", 2, email="Help@example.com"),
+    contact("Fe", "emergency", 3, email=" help@example.com "),
+    contact("Alex", "friend", 2, "0917 444 4444"),
+]
+
+
+def names(route):
+    return [(c["name"], c.get("number")) for c in route]
+
+
+def test_routes_follow_protocols_priority_and_dedupe(app):
+    routes = app["build_contact_routes"](CONTACTS)
+    assert set(routes) == set(app["EMERGENCY_PROTOCOLS"])
+    assert names(routes["medical"]) == [("Cris", "0917 333 3333"), ("Dina", "09172222222"), ("Eli", None)]
+    assert names(routes["general"]) == [("Cris", "0917 333 3333"), ("Alex", "0917 111 1111"), ("Dina", "09172222222"),
+                                        ("Eli", None), ("Alex", "0917 444 4444")]
+    assert routes["emergency"] == routes["general"]
+    assert app["build_contact_routes"]([]) == {kind: [] for kind in app["EMERGENCY_PROTOCOLS"]}
+
+
+@pytest.fixture
+def session_contacts(monkeypatch):
+    monkeypatch.setitem(st.session_state, "contacts", [dict(c) for c in CONTACTS[:2]])
+    monkeypatch.setitem(st.session_state, "contact_routes", None)
+    return st.session_state.contacts
+
+
+def test_session_table_is_rebuilt_only_when_contacts_change(app, session_contacts):
+    routes = app["contact_routes"]()
+    assert app["contact_routes"]() is routes
+    assert names(routes["general"]) == [("Alex", "0917 111 1111"), ("Bea", "0917-222-2222")]
+    routes = app["add_contact"](CONTACTS[2])
+    assert names(routes["medical"]) == [("Cris", "0917 333 3333"), ("Bea", "0917-222-2222")]
+    session_contacts.pop()
+    app["contacts_changed"]()
+    assert names(app["contact_routes"]()["medical"]) == [("Bea", "0917-222-2222")]
+
+
+def test_edits_that_keep_the_list_length_rebuild_the_table(app, session_contacts):
+    assert names(app["contact_routes"]()["medical"]) == [("Bea", "0917-222-2222")]
+    session_contacts[0]["priority"] = 1  # Alex becomes a priority contact
+    app["contacts_changed"]()
+    assert names(app["contact_routes"]()["medical"]) == [("Alex", "0917 111 1111"), ("Bea", "0917-222-2222")]
+    session_contacts.pop()
+    app["add_contact"](contact("Gil", "family", 2, "0917 555 5555"))
+    assert names(app["contact_routes"]()["medical"]) == [("Alex", "0917 111 1111"), ("Gil", "0917 555 5555")]
+
+
+def test_missing_priority_ranks_as_the_default(app):
+    routes = app["build_contact_routes"]([contact("Hal", "friend", 3, "1"),
+                                          {"name": "Ivy", "type": "friend", "number": "2"}])
+    assert names(routes["general"]) == [("Ivy", "2"), ("Hal", "1")]
+    assert routes["medical"] == []
+
+
+def test_alert_messages_cover_every_channel(app):
+    route = app["build_contact_routes"](CONTACTS)["medical"]
+    alerts = app["alert_messages"](9, {"username": "ann", "name": "Ann"}, {"lat": 14.5, "lng": 121.0}, "medical", route)
+    assert [(a["transport"], a["recipient"]) for a in alerts] == [
+        ("sms", "0917 333 3333"), ("sms", "09172222222"), ("email", "Help@example.com")]
+    assert all(a["event_id"] == 9 and "14.500000,121.000000" in a["message"] for a in alerts)
@@ -0,0 +1,80 @@
+import concurrent.futures
+import threading
+import time
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def engine(app):
+    return app["CredentialEngine"](target_seconds=0, workers=1)
+
+
+def test_hash_and_verify(engine):
+    stored = engine.hash("correct horse")
+    assert stored.startswith("scrypt$") and "correct horse" not in stored
+    assert engine.verify(stored, "correct horse") == (True, None)
+    assert engine.verify(stored, "wrong") == (False, None)
+
+
+def test_legacy_plaintext_is_rehashed_on_success(engine):
+    ok, rehash = engine.verify("hunter2", "hunter2")
+    assert ok and rehash.startswith("scrypt$")
+    assert engine.verify(rehash, "hunter2") == (True, None)
+    assert engine.verify("hunter2", "hunter3") == (False, None)
+
+
+def test_other_parameters_are_rehashed(app, engine):
+    stronger = app["CredentialEngine"](target_seconds=0, workers=1)
+    stronger.n = engine.n * 2
+    ok, rehash = engine.verify(stronger.hash("pw"), "pw")
+    assert ok and rehash.split("$")[1] == str(engine.n)
+
+
+def test_unknown_user_always_fails(engine):
+    assert engine.verify(None, "") == (False, None)
+    assert engine.verify(None, "anything") == (False, None)
+
+
+def test_seeded_admin_is_stored_hashed(app, fresh_store):
+    stored = fresh_store.users["admin"]["password"]
+    assert stored.startswith("scrypt$")
+    row = fresh_store.conn.execute("SELECT password FROM users WHERE username = 'admin'").fetchone()
+    assert row[0] == stored
+    assert app["credentials"].verify(stored, "admin123") == (True, None)
+
+
+@pytest.mark.parametrize("stored", ["scrypt$3$8$1$AAAA$AAAA", "scrypt$16384$0$1$AAAA$AAAA",
+                                    "scrypt$99999999999999999999$8$1$AAAA$AAAA", "scrypt$x$8$1$AAAA$AAAA"])
+def test_malformed_records_fail_instead_of_raising(engine, stored):
+    assert engine.verify(stored, "pw") == (False, None)
+
+
+def test_pool_caps_concurrent_hashes_and_keeps_throughput(app):
+    engine = app["CredentialEngine"](target_seconds=0, workers=2)
+    stored = engine.hash("pw")
+    state = {"active": 0, "peak": 0}
+    lock = threading.Lock()
+    scrypt = engine._scrypt
+    
+    def counting_scrypt(*args):
+        with lock:
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+        try:
+            time.sleep(0.1)  # stands in for a slow hash; like hashlib.scrypt it releases the GIL
+            return scrypt(*args)
+        finally:
+            with lock:
+                state["active"] -= 1
+    
+    engine._scrypt = counting_scrypt
+    sign_ins = 8
+    started = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(sign_ins) as sessions:
+        results = list(sessions.map(lambda _: engine.verify(stored, "pw"), range(sign_ins)))
+    elapsed = time.perf_counter() - started
+    assert results == [(True, None)] * sign_ins
+    assert state["peak"] == 2
+    # Two at a time: four rounds of 100 ms, not one round or eight
+    assert 0.4 <= elapsed < 0.7, f"{sign_ins / elapsed:.0f} sign-ins/s"
@@ -0,0 +1,51 @@
+import pytest
+
+
+@pytest.fixture
+def history_store(fresh_store):
+    events = []
+    for i in range(130):
+        day = 1 + i // 50
+        events.append({"type": ["location", "emergency", "login"][i % 3], "title": f"Entry {i}",
+                       "details": "panic near the market" if i % 10 == 0 else "routine check",
+                       "timestamp": f"2026-03-0{day} 10:{(i % 50) // 2:02d}:00"})  # pairs share a timestamp
+    for event in events:
+        fresh_store.add_history("ann", event)
+    fresh_store.add_history("bob", {"type": "login", "title": "Bob", "details": "panic", "timestamp": "2026-03-01 09:00:00"})
+    return fresh_store
+
+
+def walk(store, **filters):
+    entries, cursor = [], None
+    while True:
+        page, cursor = store.history_page("ann", cursor=cursor, limit=7, **filters)
+        entries += page
+        if cursor is None:
+            return entries
+
+
+def test_pages_cover_everything_once_newest_first(history_store):
+    entries = walk(history_store)
+    assert len(entries) == 130 and len({entry["id"] for entry in entries}) == 130
+    keys = [(entry["timestamp"], entry["id"]) for entry in entries]
+    assert keys == sorted(keys, reverse=True)
+
+
+@pytest.mark.parametrize("fts", [True, False])
+def test_filters_and_counts_agree(history_store, fts):
+    history_store.history_fts = history_store.history_fts and fts
+    filters = [{"event_type": "emergency"}, {"day": "2026-03-02"}, {"search": "PANIC mark"},
+               {"event_type": "location", "day": "2026-03-01", "search": "panic"}]
+    expected = [43, 50, 13, 2]
+    for f, count in zip(filters, expected):
+        entries = walk(history_store, **f)
+        assert len(entries) == count == history_store.history_count("ann", **f)
+    assert history_store.history_type_counts("ann") == {"location": 44, "emergency": 43, "login": 43}
+
+
+def test_deleting_or_restoring_users_clears_their_history(history_store, make_user):
+    history_store.add_user("ann", make_user("Ann"))
+    assert history_store.delete_user("ann")
+    assert history_store.history_count("ann") == 0
+    history_store.reset_for_restore()
+    assert history_store.conn.execute("SELECT COUNT(*) FROM user_history").fetchone()[0] == 0
@@ -0,0 +1,124 @@
+import gzip
+import io
+import json
+
+import pytest
+from streamlit.runtime.download_data_util import convert_data_to_bytes_and_infer_mime
+
+
+@pytest.fixture
+def use_store(app, monkeypatch):
+    """Point the module-level backup functions at a given store"""
+    def use(store):
+        monkeypatch.setitem(app["import_backup"].__globals__, "store", store)
+        return store
+    return use
+
+
+@pytest.fixture
+def other_store(app, tmp_path):
+    store = app["SafeTapStore"](str(tmp_path / "other.db"))
+    yield store
+    store.conn.close()
+
+
+def backup(app):
+    payload, _ = convert_data_to_bytes_and_infer_mime(app["export_system_data"](), ValueError("unsupported"))
+    return payload
+
+
+def populate(store, make_user):
+    store.add_user("ann", make_user("Ann"))
+    store.add_user("bob", make_user("Bob", status="suspended"))
+    for minute in range(3):
+        store.add_location("ann", {"lat": 14.5 + minute / 100, "lng": 121.0, "timestamp": f"2026-02-01 10:0{minute}:00",
+                                   "source": "gps"})
+    store.add_panic_event({"username": "ann", "user_name": "Ann", "emergency_type": "medical",
+                           "location": {"lat": 14.5, "lng": 121.0}, "timestamp": "2026-02-01 10:05:00"})
+
+
+def test_full_backup_round_trips_through_replace(app, fresh_store, other_store, use_store, make_user):
+    populate(use_store(fresh_store), make_user)
+    data = backup(app)
+    use_store(other_store)
+    stats = app["import_backup"](io.BytesIO(data), mode="replace")
+    assert stats["complete"] and stats["invalid"] == 0
+    assert set(other_store.users) == {"admin", "ann", "bob"}
+    assert other_store.users["bob"]["status"] == "suspended"
+    assert [e["lat"] for e in other_store.users["ann"]["location_history"]] == [14.52, 14.51, 14.5]
+    assert other_store.users["ann"]["current_location"]["lat"] == 14.52
+    assert [e["emergency_type"] for e in other_store.panic_events] == ["medical"]
+    assert other_store.location_fix_count == 3
+
+
+def test_truncated_backup_does_not_replace_anything(app, fresh_store, other_store, use_store, make_user):
+    populate(use_store(fresh_store), make_user)
+    lines = gzip.decompress(backup(app)).splitlines()
+    other_store.add_user("kept", make_user("Kept"))
+    other_store.add_location("kept", {"lat": 1.0, "lng": 1.0, "timestamp": "2026-02-01 09:00:00"})
+    use_store(other_store)
+    with pytest.raises(ValueError, match="nothing was restored"):
+        app["import_backup"](io.BytesIO(b"\n".join(lines[:-1])), mode="replace")
+    assert set(other_store.users) == {"admin", "kept"}
+    assert other_store.conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 2
+    assert other_store.users["kept"]["current_location"]["lat"] == 1.0
+    assert other_store.location_fix_count == 1
+
+
+def test_merged_fixes_are_not_dropped_on_id_collisions(app, fresh_store, other_store, use_store, make_user):
+    populate(use_store(fresh_store), make_user)
+    data = backup(app)
+    # The other deployment already used fix ids 1-3 for its own user
+    other_store.add_user("ann", make_user("Ann"))
+    other_store.add_user("zed", make_user("Zed"))
+    for second in range(3):
+        other_store.add_location("zed", {"lat": 2.0, "lng": 2.0, "timestamp": f"2026-02-01 09:00:0{second}"})
+    use_store(other_store)
+    stats = app["import_backup"](io.BytesIO(data), mode="merge")
+    assert stats["written"]["location"] == 3
+    assert len(other_store.users["ann"]["location_history"]) == 3
+    assert other_store.location_fix_count == 6
+    
+    again = app["import_backup"](io.BytesIO(data), mode="merge")
+    assert again["written"]["location"] == 0
+    assert again["present"] == again["records"] - again["invalid"] - sum(again["written"].values())
+    assert again["present"] >= 3
+    assert other_store.location_fix_count == 6
+
+
+@pytest.mark.parametrize("mode, expected", [("merge", "Ann Local"), ("upsert", "Ann")])
+def test_merge_keeps_and_upsert_overwrites_existing_users(app, fresh_store, other_store, use_store, make_user,
+                                                          mode, expected):
+    populate(use_store(fresh_store), make_user)
+    data = backup(app)
+    other_store.add_user("ann", make_user("Ann Local"))
+    use_store(other_store)
+    stats = app["import_backup"](io.BytesIO(data), mode=mode)
+    assert stats["complete"]
+    assert other_store.users["ann"]["name"] == expected
+    assert "bob" in other_store.users
+
+
+def test_invalid_records_are_skipped_and_reported(app, fresh_store, use_store, make_user):
+    use_store(fresh_store)
+    user = {"kind": "user", "username": "cid", "password": "x", "name": "Cid"}
+    lines = [
+        {"kind": "header", "format": app["BACKUP_FORMAT"], "version": 1, "mode": "full"},
+        user,
+        {"kind": "user", "username": "dee", "name": "Dee"},
+        {"kind": "location", "id": 1, "username": "ghost", "lat": 1.0, "lng": 2.0, "timestamp": "2026-02-01 10:00:00"},
+        {"kind": "location", "id": 2, "username": "cid", "lat": 91.0, "lng": 2.0, "timestamp": "2026-02-01 10:00:00"},
+        {"kind": "end", "records": 4},
+    ]
+    payload = b"\n".join(json.dumps(line).encode() for line in lines[:2]) + b"\nnot json\n" + \
+        b"\n".join(json.dumps(line).encode() for line in lines[2:])
+    stats = app["import_backup"](io.BytesIO(payload), mode="merge")
+    assert stats["invalid"] == 4 and len(stats["errors"]) == 4
+    assert not stats["complete"]
+    assert "cid" in fresh_store.users and "dee" not in fresh_store.users
+
+
+def test_rejects_files_that_are_not_backups(app, fresh_store, use_store):
+    use_store(fresh_store)
+    with pytest.raises(ValueError, match="Not a SafeTap backup"):
+        app["import_backup"](io.BytesIO(b'{"kind": "something"}\n'))
@@ -0,0 +1,43 @@
+import datetime
+import time
+
+
+def event(event_id, username, ts, **fields):
+    return {"id": event_id, "username": username, "ts": ts, **fields}
+
+
+def test_latest_open_event_wins(app):
+    table = app["ActiveIncidentTable"]()
+    now = time.time()
+    table.add(event(1, "jo", now - 10))
+    table.add(event(2, "jo", now - 5))
+    table.add(event(3, "jo", now - 20))  # an older event never replaces a newer one
+    table.add(event(4, "kim", now, resolved_at=now))
+    assert table.get("jo")["id"] == 2
+    assert not table.has_emergency("kim")
+    assert len(table) == 1
+    assert table.resolve("jo")["id"] == 2 and table.get("jo") is None
+
+
+def test_incidents_expire_at_the_end_of_their_day(app):
+    table = app["ActiveIncidentTable"]()
+    yesterday = datetime.datetime.combine(datetime.date.today() - datetime.timedelta(days=1), datetime.time(23, 0))
+    table.add(event(1, "old", yesterday.timestamp()))
+    assert table.get("old") is None
+    now = time.time()
+    table.add(event(2, "jo", now))
+    table.expire(app["incident_expiry"](now) + 1)
+    assert len(table.open) == 0 and not table.expiry_heap
+
+
+def test_store_opens_and_resolves_incidents(app, fresh_store, make_user):
+    fresh_store.add_user("jo", make_user("Jo"))
+    now = datetime.datetime.now()
+    event_id = fresh_store.add_panic_event({"username": "jo", "user_name": "Jo", "emergency_type": "fire",
+                                            "location": None, "timestamp": now.strftime("%Y-%m-%d %H:%M:%S"),
+                                            "ts": now.timestamp()})
+    assert fresh_store.incidents.get("jo")["id"] == event_id
+    assert fresh_store.resolve_incident("jo")
+    assert not fresh_store.incidents.has_emergency("jo")
+    assert fresh_store.panic_events[0]["resolved_at"]
+    assert not fresh_store.resolve_incident("jo")
@@ -0,0 +1,111 @@
+import asyncio
+import http.client
+import json
+import time
+
+import pytest
+
+
+@pytest.fixture
+def users():
+    return {"alice": {"name": "Alice"}}
+
+
+def test_validate_fix_accepts_a_good_fix(app, users):
+    now = time.time()
+    username, entry, epoch = app["validate_fix"](
+        {"username": "alice", "lat": 14.6, "lng": 121.0, "accuracy": 5, "timestamp": now - 10}, users, now)
+    assert username == "alice" and epoch == int(now - 10)
+    assert entry["lat"] == 14.6 and entry["accuracy"] == 5.0 and entry["source"] == "gps"
+
+
+@pytest.mark.parametrize("fix, error", [
+    ({"username": "bob", "lat": 0, "lng": 0}, "unknown user"),
+    ({"username": "alice", "lat": 91, "lng": 0}, "invalid lat"),
+    ({"username": "alice", "lat": 0, "lng": float("nan")}, "invalid lng"),
+    ({"username": "alice", "lat": 0, "lng": 0, "accuracy": -1}, "invalid accuracy"),
+    ({"username": "alice", "lat": 0, "lng": 0, "timestamp": 1e20}, "future"),
+    ({"username": "alice", "lat": 0, "lng": 0, "timestamp": -1e20}, "before 1970"),
+    ({"username": "alice", "lat": 0, "lng": 0, "timestamp": -1}, "before 1970"),
+    ({"username": "alice", "lat": 0, "lng": 0, "timestamp": [1]}, "invalid timestamp"),
+])
+def test_validate_fix_rejects_bad_fixes(app, users, fix, error):
+    with pytest.raises(ValueError, match=error):
+        app["validate_fix"](fix, users, time.time())
+
+
+AUTH = {"authorization": "Bearer s3cret"}
+
+
+def post(server, fixes, headers=AUTH):
+    return asyncio.run(server._route("POST", "/fixes", headers, json.dumps({"fixes": fixes}).encode()))
+
+
+@pytest.fixture
+def alice_store(fresh_store, make_user):
+    fresh_store.add_user("alice", make_user("Alice"))
+    return fresh_store
+
+
+@pytest.mark.parametrize("token, headers", [(None, {}), (None, {"authorization": "Bearer "}),
+                                            ("s3cret", {}), ("s3cret", {"authorization": "Bearer wrong"})])
+def test_fixes_need_the_configured_token(app, alice_store, token, headers):
+    server = app["FixIngestServer"](alice_store, "127.0.0.1", 0, token)
+    status, _ = post(server, [{"username": "alice", "lat": 14.6, "lng": 121.0}], headers)
+    assert status == 401
+    assert alice_store.users["alice"]["current_location"] is None
+
+
+def test_one_bad_fix_does_not_abort_the_batch(app, alice_store):
+    server = app["FixIngestServer"](alice_store, "127.0.0.1", 0, "s3cret")
+    status, payload = post(server, [
+        {"username": "alice", "lat": 14.6, "lng": 121.0},
+        {"username": "alice", "lat": 14.6, "lng": 121.0, "timestamp": -1e20},
+        {"username": "nobody", "lat": 0, "lng": 0},
+    ])
+    assert status == 200
+    assert server.batches == 1 and server.fixes_accepted == 1 and server.fixes_rejected == 2
+    assert [r["index"] for r in payload["rejected"]] == [1, 2]
+    assert alice_store.users["alice"]["current_location"]["lat"] == 14.6
+
+
+def test_batch_keeps_only_the_newest_fix_current(app, alice_store):
+    now = int(time.time())
+    alice_store.add_location("alice", {"lat": 1.0, "lng": 1.0, "timestamp": app["epoch_to_timestamp"](now - 60)})
+    current = alice_store.add_locations([
+        ("alice", {"lat": 3.0, "lng": 3.0, "timestamp": app["epoch_to_timestamp"](now - 10)}, now - 10),
+        ("alice", {"lat": 0.0, "lng": 0.0, "timestamp": app["epoch_to_timestamp"](now - 120)}, now - 120),
+        ("alice", {"lat": 2.0, "lng": 2.0, "timestamp": app["epoch_to_timestamp"](now - 30)}, now - 30),
+    ])
+    assert current == 1
+    assert [e["lat"] for e in alice_store.users["alice"]["location_history"]] == [3.0, 2.0, 1.0]
+    row = alice_store.conn.execute("SELECT loc_lat FROM users WHERE username = 'alice'").fetchone()
+    assert row[0] == 3.0
+    assert alice_store.conn.execute("SELECT COUNT(*) FROM location_history").fetchone()[0] == 4
+
+
+def test_sustains_thousands_of_fixes_per_second_over_http(app, fresh_store, make_user):
+    users = [f"rider{i}" for i in range(200)]
+    for username in users:
+        fresh_store.add_user(username, make_user(username))
+    server = app["FixIngestServer"](fresh_store, "127.0.0.1", 0, "s3cret")
+    assert server.start()
+    
+    batches, batch_size = 20, 500
+    now = time.time()
+    bodies = [json.dumps({"fixes": [
+        {"user": users[i % len(users)], "lat": 14.5 + i / 1e5, "lng": 121.0, "accuracy": 8,
+         "timestamp": now - batches + b}
+        for i in range(batch_size)]}) for b in range(batches)]
+    conn = http.client.HTTPConnection("127.0.0.1", server.port, timeout=30)
+    started = time.perf_counter()
+    for body in bodies:
+        conn.request("POST", "/fixes", body, {"Authorization": "Bearer s3cret", "Content-Type": "application/json"})
+        response = conn.getresponse()
+        assert response.status == 200 and json.loads(response.read())["accepted"] == batch_size
+    rate = batches * batch_size / (time.perf_counter() - started)
+    conn.close()
+    
+    print(f"ingested {rate:,.0f} fixes/s")
+    assert rate > 2000
+    assert fresh_store.conn.execute("SELECT COUNT(*) FROM location_history").fetchone()[0] == batches * batch_size
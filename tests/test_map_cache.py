@@ -0,0 +1,50 @@
+import datetime
+
+import pytest
+
+
+@pytest.fixture
+def cached_rows(app, fresh_store, monkeypatch):
+    cache = app["LRUCache"](2)
+    monkeypatch.setitem(app["get_tracking_map_rows"].__globals__, "store", fresh_store)
+    monkeypatch.setitem(app["get_tracking_map_rows"].__globals__, "get_map_row_cache", lambda: cache)
+    monkeypatch.setitem(app["get_tracking_map_rows"].__globals__, "MAP_ROW_CACHE_SECONDS", 10 ** 9)
+    return app["get_tracking_map_rows"], cache
+
+
+def test_lru_cache_evicts_least_recently_used(app):
+    cache = app["LRUCache"](2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None and cache.get("a") == 1 and cache.get("c") == 3
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_unchanged_reruns_reuse_the_rows(fresh_store, cached_rows, make_user):
+    get_rows, cache = cached_rows
+    fresh_store.add_user("ivy", make_user("Ivy"))
+    first = get_rows()
+    assert get_rows() is first
+    assert cache.hits == 1
+
+
+def test_location_fix_invalidates_the_rows(fresh_store, cached_rows, make_user):
+    get_rows, cache = cached_rows
+    fresh_store.add_user("ivy", make_user("Ivy"))
+    assert get_rows() == {}
+    now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    fresh_store.add_location("ivy", {"lat": 14.6, "lng": 121.0, "timestamp": now, "source": "gps"})
+    rows = get_rows()
+    assert rows["ivy"][:4] == (14.6, 121.0, "Ivy", "ivy")
+    assert cache.misses == 2
+
+
+def test_late_fix_keeps_the_cached_rows(fresh_store, cached_rows, make_user):
+    get_rows, cache = cached_rows
+    fresh_store.add_user("ivy", make_user("Ivy"))
+    fresh_store.add_location("ivy", {"lat": 14.6, "lng": 121.0, "timestamp": "2026-01-01 10:00:00", "source": "gps"})
+    rows = get_rows()
+    fresh_store.add_location("ivy", {"lat": 15.0, "lng": 121.0, "timestamp": "2026-01-01 09:00:00", "source": "gps"})
+    assert get_rows() is rows
@@ -0,0 +1,45 @@
+import pytest
+import streamlit as st
+
+
+def render(m):
+    root = m.get_root()
+    root.render()
+    return root.render()
+
+
+@pytest.mark.parametrize("located, threshold, clustered", [(3, 5, False), (6, 5, True), (6, 6, False)])
+def test_cluster_mode_switches_above_the_threshold(app, fresh_store, monkeypatch, located, threshold, clustered):
+    monkeypatch.setitem(app["use_clustered_map"].__globals__, "store", fresh_store)
+    monkeypatch.setitem(st.session_state.admin_settings, "map_cluster_threshold", threshold)
+    for i in range(located):
+        fresh_store.spatial.update(f"u{i}", 14.0, 121.0)
+    assert app["use_clustered_map"]() is clustered
+
+
+@pytest.mark.parametrize("clustered", [False, True])
+def test_base_map_carries_the_layer_but_no_markers(app, clustered):
+    html = render(app["create_live_tracking_map"]([14.5, 121.0], clustered))
+    assert "markercluster" in html.lower()
+    assert f", {str(clustered).lower()});" in html
+    assert "safetapApplyUserDelta(" in html
+    assert html.count("safetapCreateUserLayer(map_") == 1
+
+
+def row(username, emergency=False):
+    return [14.5, 121.0, username.title(), username, "red" if emergency else "green", "Active", "User",
+            "2026-01-01 00:00:00", "Gps", "+63", f"{username}@example.com", "user-check", emergency]
+
+
+@pytest.mark.parametrize("clustered", [False, True])
+def test_only_emergencies_get_full_markers_in_cluster_mode(apply_marker_deltas, clustered):
+    rows = [row(f"u{i}") for i in range(50)] + [row("sos", emergency=True)]
+    result = apply_marker_deltas(clustered, [{"version": 1, "reset": True, "rows": rows, "removed": []}])
+    assert len(result["users"]) == 51
+    assert result["users"]["sos"] == result["users"]["sos"] | {"clustered": False, "parts": 3}
+    if clustered:
+        assert (result["clusters"], result["markers"]) == (50, 1)
+        assert result["users"]["u0"]["clustered"]
+    else:
+        assert (result["clusters"], result["markers"]) == (None, 51)
+        assert result["users"]["u0"]["parts"] == 2
@@ -0,0 +1,54 @@
+import datetime
+import random
+import time
+
+
+def at(day, hour, minute=0):
+    return datetime.datetime.combine(day, datetime.time(hour, minute)).timestamp()
+
+
+def test_range_queries_match_a_linear_scan(app):
+    rng = random.Random(3)
+    start = at(datetime.date(2026, 3, 1), 0)
+    events = [{"id": i, "ts": start + rng.randrange(10 * 86400)} for i in range(500)]
+    index = app["PanicEventIndex"](events)
+    assert len(index) == 500 and len(index.days) == 10
+    for _ in range(50):
+        lo = start + rng.randrange(11 * 86400)
+        hi = lo + rng.randrange(3 * 86400)
+        expected = sorted((e for e in events if lo <= e["ts"] < hi), key=lambda e: e["ts"])
+        assert [e["ts"] for e in index.between(lo, hi, newest_first=False)] == [e["ts"] for e in expected]
+        assert index.count(lo, hi) == len(expected)
+    newest = index.between(start, start + 11 * 86400)
+    assert [e["ts"] for e in newest] == sorted((e["ts"] for e in events), reverse=True)
+
+
+def test_today_and_last_minutes(app):
+    now = time.time()
+    yesterday = at(datetime.date.today() - datetime.timedelta(days=1), 12)
+    index = app["PanicEventIndex"]([{"id": 1, "ts": yesterday}, {"id": 2, "ts": now - 3600}, {"id": 3, "ts": now - 60}])
+    assert [e["id"] for e in index.last_minutes(5)] == [3]
+    assert {e["id"] for e in index.today()} <= {2, 3} and index.today()[0]["id"] == 3
+
+
+def test_store_indexes_new_and_reloaded_events(app, tmp_path, make_user):
+    path = str(tmp_path / "events.db")
+    store = app["SafeTapStore"](path)
+    store.add_user("kai", make_user("Kai"))
+    stamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    event_id = store.add_panic_event({"username": "kai", "user_name": "Kai", "emergency_type": "medical",
+                                      "location": {"lat": 1.0, "lng": 2.0}, "timestamp": stamp})
+    assert [e["id"] for e in store.event_index.today()] == [event_id]
+    store.conn.close()
+    
+    reopened = app["SafeTapStore"](path)
+    assert [e["id"] for e in reopened.event_index.today()] == [event_id]
+    reopened.conn.close()
+
+
+def test_drop_before_removes_whole_days(app):
+    day = datetime.date(2026, 3, 10)
+    index = app["PanicEventIndex"]([{"id": i, "ts": at(day + datetime.timedelta(days=i), 9)} for i in range(4)])
+    dropped = index.drop_before(at(day + datetime.timedelta(days=2), 18))
+    assert [e["id"] for e in dropped] == [0, 1]
+    assert len(index) == 2 and index.count(0, at(day, 23) + 10 * 86400) == 2
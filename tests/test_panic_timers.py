@@ -0,0 +1,69 @@
+import threading
+import time
+
+import pytest
+
+
+@pytest.fixture
+def timers(app):
+    timers = app["PanicHoldTimers"]()
+    timers.start()
+    return timers
+
+
+def wait_fired(timers, hold_id, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        hold = timers.get(hold_id)
+        if hold is not None and hold["state"] == "fired":
+            return hold
+        time.sleep(0.005)
+    raise AssertionError(f"hold {hold_id} did not fire")
+
+
+def test_holds_fire_on_time_and_in_due_order(timers):
+    order = []
+    lock = threading.Lock()
+    
+    def record(name):
+        with lock:
+            order.append((name, time.time()))
+        return name
+    
+    now = time.time()
+    late = timers.arm(now + 0.3, record, "late")
+    early = timers.arm(now + 0.1, record, "early")  # armed second, must wake the sleeping thread
+    assert wait_fired(timers, late)["result"] == "late"
+    assert wait_fired(timers, early)["result"] == "early"
+    assert [name for name, _ in order] == ["early", "late"]
+    assert order[0][1] - (now + 0.1) < 0.25
+    assert timers.metrics()["fired"] == 2 and timers.metrics()["armed"] == 0
+
+
+def test_cancel_before_and_after_firing(timers):
+    fired = threading.Event()
+    cancelled = timers.arm(time.time() + 0.1, fired.set)
+    assert timers.cancel(cancelled)
+    done = timers.arm(time.time(), lambda: "sent")
+    wait_fired(timers, done)
+    assert not timers.cancel(done)
+    time.sleep(0.2)
+    assert not fired.is_set() and timers.get(cancelled) is None
+    timers.discard(done)
+    assert timers.get(done) is None
+
+
+def test_callback_errors_become_an_error_result(timers):
+    def boom():
+        raise RuntimeError("gateway down")
+    hold = wait_fired(timers, timers.arm(time.time(), boom))
+    assert hold["result"]["level"] == "error" and "gateway down" in hold["result"]["message"]
+
+
+def test_panic_press_without_a_location_arms_nothing(app):
+    state = app["st"].session_state
+    armed = app["panic_timers"].metrics()["armed"]
+    state.location, state.panic_active = None, False
+    app["start_panic_timer"]()
+    assert not state.panic_active
+    assert app["panic_timers"].metrics()["armed"] == armed
@@ -0,0 +1,37 @@
+import datetime
+
+import pytest
+
+
+def test_popups_are_built_from_rows_and_escaped(apply_marker_deltas):
+    row = [14.5, 121.25, "<img src=x onerror=alert(1)>", "mallory", "green", "🟢 Active", "User",
+           "2026-01-01 00:00:00", "Gps", "+63 '1'", "m@example.com", "user-check", False]
+    user = apply_marker_deltas(False, [{"version": 1, "reset": True, "rows": [row], "removed": []}])["users"]["mallory"]
+    assert "<img" not in user["popup"] and "&lt;img src=x onerror=alert(1)&gt;" in user["popup"]
+    assert "14.500000, 121.250000" in user["popup"] and "+63 &#39;1&#39;" in user["popup"]
+    assert user["tooltip"] == "<b>&lt;img src=x onerror=alert(1)&gt;</b><br>🟢 Active"
+
+
+@pytest.fixture
+def map_rows(app, fresh_store, make_user, monkeypatch):
+    monkeypatch.setitem(app["build_tracking_map_rows"].__globals__, "store", fresh_store)
+    now = datetime.datetime.now()
+    recent = now.strftime("%Y-%m-%d %H:%M:%S")
+    stale = (now - datetime.timedelta(hours=2)).strftime("%Y-%m-%d %H:%M:%S")
+    for name, status, stamp in [("ann", "active", recent), ("bob", "active", stale),
+                                ("cat", "suspended", recent), ("dan", "active", recent), ("eve", "active", None)]:
+        fresh_store.add_user(name, make_user(name.title(), status=status))
+        if stamp:
+            fresh_store.add_location(name, {"lat": 14.5, "lng": 121.0, "timestamp": stamp, "source": "panic_alert"})
+    fresh_store.add_panic_event({"username": "dan", "user_name": "Dan", "emergency_type": "fire", "location": None,
+                                 "timestamp": recent, "ts": now.timestamp()})
+    return app["build_tracking_map_rows"]()
+
+
+def test_rows_carry_compact_marker_fields(map_rows):
+    assert set(map_rows) == {"ann", "bob", "cat", "dan"}  # admin and unlocated users are left out
+    assert {name: row[4] for name, row in map_rows.items()} == {
+        "ann": "green", "bob": "orange", "cat": "gray", "dan": "red"}
+    ann = map_rows["ann"]
+    assert len(ann) == 13 and ann[5] == "🟢 Active" and ann[8] == "Panic Alert" and ann[12] is False
+    assert map_rows["dan"][11] == "exclamation-triangle" and map_rows["dan"][12] is True
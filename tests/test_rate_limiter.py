@@ -0,0 +1,80 @@
+import time
+
+import pytest
+
+
+class Clock:
+    """Stands in for the time module with a settable time()"""
+    
+    def __init__(self, now):
+        self.now = now
+    
+    def time(self):
+        return self.now
+    
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+
+@pytest.fixture
+def clock(app, monkeypatch):
+    clock = Clock(1_800_000_000.0)
+    monkeypatch.setitem(app["AlertRateLimiter"].__init__.__globals__, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def limiter(app, fresh_store, clock):
+    return app["AlertRateLimiter"](fresh_store)
+
+
+def test_repeat_of_the_same_type_is_merged_within_the_cooldown(app, limiter, clock):
+    assert limiter.admit("ann", "fire")
+    assert not limiter.admit("ann", "fire")
+    assert limiter.admit("ann", "fire", can_merge=False)  # nothing open to merge into
+    assert limiter.admit("ann", "medical")
+    assert not limiter.admit("ann", "crime")  # out of burst tokens
+    clock.now += app["ALERT_COOLDOWN_SECONDS"]
+    assert limiter.admit("ann", "fire")
+    assert limiter.admit("bob", "fire")
+
+
+def test_user_bucket_refills_over_time(app, limiter, clock):
+    for kind in ("fire", "medical", "crime"):
+        assert limiter.admit("ann", kind)
+    assert not limiter.admit("ann", "flood")
+    clock.now += app["ALERT_USER_REFILL_SECONDS"]
+    assert limiter.admit("ann", "flood")
+    assert limiter.metrics()["merged"] == 1
+
+
+def test_cooldown_setting_persists(app, limiter, fresh_store):
+    limiter.configure(30)
+    assert app["AlertRateLimiter"](fresh_store).cooldown == 30
+
+
+def test_global_pacing_spreads_a_storm(app, limiter, clock):
+    burst, rate = app["ALERT_GLOBAL_BURST"], app["ALERT_GLOBAL_RATE"]
+    assert limiter.pace(burst) == 0.0
+    assert limiter.pace(int(rate)) == pytest.approx(1.0)
+    clock.now += 2
+    assert limiter.pace(int(rate)) == pytest.approx(0.0)
+
+
+def test_idle_entries_are_pruned(app, limiter, clock):
+    for i in range(50):
+        limiter.admit(f"user{i}", "fire")
+    clock.now += max(app["ALERT_COOLDOWN_SECONDS"], app["ALERT_USER_BURST"] * app["ALERT_USER_REFILL_SECONDS"])
+    limiter.admit("late", "fire")
+    assert limiter.metrics()["tracked"] == 2
+
+
+def test_settings_view_does_not_overwrite_the_shared_cooldown(app, monkeypatch):
+    shared = app["alert_limiter"]
+    monkeypatch.setattr(shared, "cooldown", shared.cooldown)
+    monkeypatch.setattr(shared, "configure", lambda cooldown: pytest.fail("configure called without a change"))
+    shared.cooldown = 900  # set by another admin after this session loaded its settings
+    app["st"].session_state.admin_settings["alert_cooldown"] = 300
+    app["show_system_settings"]()
+    assert shared.cooldown == 900
+    assert app["st"].session_state.admin_settings["alert_cooldown"] == 900
@@ -0,0 +1,72 @@
+import io
+
+import pytest
+from streamlit.runtime.download_data_util import convert_data_to_bytes_and_infer_mime
+
+
+@pytest.fixture
+def seeded(app):
+    app["register_user"]("report_user", "pw", "Report User", "r@example.com", "0917 000 0000")
+    app["log_panic_event"]("report_user", "medical", {"lat": 14.6, "lng": 121.0, "accuracy": 10})
+    return app
+
+
+def download(data):
+    """What Streamlit does with deferred download data on click"""
+    payload, _ = convert_data_to_bytes_and_infer_mime(data, ValueError("unsupported download data"))
+    return payload
+
+
+@pytest.mark.parametrize("name", ["users", "emergencies"])
+def test_report_csv_is_a_self_closing_file(seeded, name):
+    data = seeded["report_csv"](name)
+    assert isinstance(data, io.BufferedReader)
+    payload = download(data)
+    assert data.closed
+    assert payload.decode("utf-8").splitlines()[0]
+
+
+def test_download_file_reads_from_the_start(app, tmp_path):
+    temp = open(tmp_path / "report.csv", "w+b")
+    temp.write(b"a,b\n1,2\n")
+    data = app["download_file"](temp)
+    assert temp.closed
+    assert data.read() == b"a,b\n1,2\n"
+    assert data.closed
+
+
+@pytest.mark.parametrize("file_format", ["parquet", "arrow"])
+def test_report_arrow_round_trips(seeded, file_format):
+    if not seeded["PYARROW_AVAILABLE"]:
+        pytest.skip("pyarrow not installed")
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    payload = download(seeded["report_arrow"]("users", file_format))
+    if file_format == "parquet":
+        table = pq.read_table(io.BytesIO(payload))
+    else:
+        table = pa.ipc.open_file(pa.BufferReader(payload)).read_all()
+    assert table.num_rows == seeded["report_row_count"]("users")
+
+
+def test_download_callables_return_supported_data(seeded, monkeypatch):
+    captured = []
+    monkeypatch.setattr(seeded["st"], "download_button", lambda **kwargs: captured.append(kwargs))
+    seeded["show_report_downloads"]("users", "user_report", "User Report")
+    assert captured
+    for kwargs in captured:
+        assert download(kwargs["data"]())
+
+
+def test_location_fix_count_is_maintained_without_scanning(app, fresh_store, make_user, monkeypatch):
+    monkeypatch.setitem(app["report_row_count"].__globals__, "store", fresh_store)
+    history = [{"lat": 1.0, "lng": 1.0, "timestamp": f"2026-01-01 00:00:0{i}", "source": "gps"} for i in range(3)]
+    fresh_store.add_user("una", make_user("Una", location_history=history))
+    fresh_store.add_user("vic", make_user("Vic"))
+    fresh_store.add_location("vic", {"lat": 2.0, "lng": 2.0, "timestamp": "2026-01-01 00:00:00"})
+    fresh_store.add_locations([("vic", {"lat": 3.0, "lng": 3.0, "timestamp": "2026-01-01 00:00:05"}, 1767225605)] * 2)
+    assert app["report_row_count"]("location_fixes") == 6
+    fresh_store.delete_user("una")
+    assert app["report_row_count"]("location_fixes") == 3
+    fresh_store._load()
+    assert fresh_store.location_fix_count == 3
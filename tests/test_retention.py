@@ -0,0 +1,50 @@
+import datetime
+
+import pytest
+
+
+def stamp(days_ago, hour=12):
+    moment = datetime.datetime.combine(datetime.date.today() - datetime.timedelta(days=days_ago), datetime.time(hour))
+    return moment.strftime("%Y-%m-%d %H:%M:%S"), moment.timestamp()
+
+
+@pytest.fixture
+def aged_store(fresh_store, make_user):
+    store = fresh_store
+    store.add_user("ann", make_user("Ann"))
+    for days_ago in (200, 120, 10, 0):
+        timestamp, _ = stamp(days_ago)
+        store.add_location("ann", {"lat": 14.5, "lng": 121.0, "timestamp": timestamp, "source": "gps"})
+    for days_ago, kind in ((150, "fire"), (150, "fire"), (5, "medical")):
+        timestamp, ts = stamp(days_ago)
+        store.add_panic_event({"username": "ann", "user_name": "Ann", "emergency_type": kind,
+                               "location": {"lat": 14.5, "lng": 121.0}, "timestamp": timestamp, "ts": ts})
+    return store
+
+
+def test_expired_partitions_are_dropped_everywhere(app, aged_store):
+    job = app["RetentionJob"](aged_store)
+    job.configure(90, True)
+    stats = job.run()
+    assert stats["deleted"]["location"] == 2 and stats["deleted"]["panic_event"] == 2
+    
+    assert [entry["timestamp"] for entry in aged_store.users["ann"]["location_history"]] == [stamp(0)[0], stamp(10)[0]]
+    assert aged_store.conn.execute("SELECT COUNT(*) FROM location_history").fetchone()[0] == 2
+    assert aged_store.location_fix_count == 2
+    assert [event["emergency_type"] for event in aged_store.panic_events] == ["medical"]
+    assert len(aged_store.event_index) == 1
+    assert aged_store.stats.snapshot()["emergency_types"] == {"medical": 1}
+    rollups = aged_store.conn.execute(
+        "SELECT day, key, count FROM daily_rollups WHERE data_class = 'panic_event'").fetchall()
+    assert [tuple(row) for row in rollups] == [(stamp(150)[0][:10], "fire", 2)]
+    assert aged_store.get_meta("retention_last")["cutoff"] == job.cutoff()[0].isoformat()
+    
+    assert job.run()["partitions"] == 0
+
+
+def test_rollups_are_optional(app, aged_store):
+    job = app["RetentionJob"](aged_store)
+    job.configure(30, False)
+    assert job.run()["rolled_up"] == 0
+    assert aged_store.conn.execute("SELECT COUNT(*) FROM daily_rollups").fetchone()[0] == 0
+    assert len(aged_store.users["ann"]["location_history"]) == 2
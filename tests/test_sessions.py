@@ -0,0 +1,110 @@
+import gzip
+import io
+import json
+
+import pytest
+
+
+@pytest.fixture
+def sessions(app, fresh_store, make_user):
+    fresh_store.add_user("gail", make_user("Gail"))
+    return app["SessionManager"](fresh_store)
+
+
+def test_token_round_trip_and_persistence(app, sessions):
+    token = sessions.create("gail")
+    assert sessions.validate(token) == "gail"
+    assert app["SessionManager"](sessions.store).validate(token) == "gail"
+
+
+@pytest.mark.parametrize("mangle", [
+    lambda t: t.split(".")[0] + "." + "0" * 64,
+    lambda t: "x" + t,
+    lambda t: t.split(".")[0],
+    lambda t: "",
+    lambda t: None,
+])
+def test_forged_tokens_are_rejected(sessions, mangle):
+    token = sessions.create("gail")
+    assert sessions.validate(mangle(token)) is None
+
+
+def test_expired_session_is_dropped(sessions):
+    token = sessions.create("gail")
+    for session in sessions.sessions.values():
+        session["expires_at"] = 0
+    assert sessions.validate(token) is None
+    assert len(sessions) == 0
+    assert sessions.store.load_sessions(-1) == []
+
+
+def test_revoke_user_ends_every_session(sessions):
+    tokens = [sessions.create("gail") for _ in range(3)]
+    sessions.revoke_user("gail")
+    assert [sessions.validate(t) for t in tokens] == [None] * 3
+
+
+@pytest.mark.parametrize("change", ["suspend", "delete"])
+def test_session_ends_when_user_is_suspended_or_deleted(sessions, change):
+    token = sessions.create("gail")
+    if change == "suspend":
+        sessions.store.update_user("gail", status="suspended")
+    else:
+        sessions.store.delete_user("gail")
+    assert sessions.validate(token) is None
+    assert len(sessions) == 0
+    assert sessions.store.load_sessions(-1) == []
+
+
+@pytest.mark.parametrize("change", ["suspend", "delete"])
+def test_session_ends_when_user_is_suspended_or_deleted(sessions, change):
+    token = sessions.create("gail")
+    if change == "suspend":
+        sessions.store.update_user("gail", status="suspended")
+    else:
+        sessions.store.delete_user("gail")
+    assert sessions.validate(token) is None
+    assert len(sessions) == 0
+    assert sessions.store.load_sessions(-1) == []
+
+
+def test_suspended_user_cannot_sign_in(app, store, make_user):
+    store.add_user("sid", make_user("Sid", status="suspended"))
+    ok, user = app["authenticate_user"]("sid", "admin123")
+    assert not ok and user["status"] == "suspended"
+    assert app["authenticate_user"]("sid", "wrong") == (False, None)
+    store.update_user("sid", status="active")
+    assert app["authenticate_user"]("sid", "admin123")[0]
+
+
+def test_full_restore_ends_every_session(app, sessions, monkeypatch):
+    namespace = app["import_backup"].__globals__
+    monkeypatch.setitem(namespace, "store", sessions.store)
+    monkeypatch.setitem(namespace, "sessions", sessions)
+    token = sessions.create("gail")
+    data = io.BytesIO()
+    with gzip.open(data, "wt") as out:
+        out.write(json.dumps({"kind": "header", "format": namespace["BACKUP_FORMAT"], "mode": "full"}) + "\n")
+        out.write(json.dumps({"kind": "end", "records": 0}) + "\n")
+    data.seek(0)
+    app["import_backup"](data, mode="replace")
+    assert sessions.validate(token) is None
+    assert len(sessions) == 0
+    assert sessions.store.load_sessions(-1) == []
+
+
+def test_cookie_is_secure_only_on_https_pages(app, monkeypatch):
+    scripts = []
+    monkeypatch.setattr(app["components"], "html", lambda html, height: scripts.append(html))
+    st = app["st"]
+    st.session_state.session_cookie = ("token", 60)
+    app["write_session_cookie"]()
+    cookie, = scripts
+    assert "Secure" not in cookie.split("+")[0]
+    assert "page.location.protocol === 'https:' ? '; Secure' : ''" in cookie
+
+
+def test_replacing_the_users_drops_their_stored_sessions(sessions):
+    sessions.create("gail")
+    sessions.store.replace_all(users={})
+    assert sessions.store.load_sessions(-1) == []
@@ -0,0 +1,45 @@
+import gzip
+import sqlite3
+
+
+def decompress(app, path):
+    with open(path, "rb") as f:
+        data = f.read()
+    if path.endswith(app["SNAPSHOT_EXTENSIONS"]["zstd"]):
+        import zstandard
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return gzip.decompress(data)
+
+
+def test_snapshot_is_a_consistent_database_and_rotates(app, fresh_store, tmp_path, make_user):
+    fresh_store.add_user("hana", make_user("Hana"))
+    directory = tmp_path / "snaps"
+    directory.mkdir()
+    extension = app["SNAPSHOT_EXTENSIONS"]["gzip"]
+    for day in ("20200101", "20200102", "20200103"):
+        (directory / f"{app['SNAPSHOT_PREFIX']}{day}-000000.{extension}").write_bytes(b"old")
+    
+    scheduler = app["SnapshotScheduler"](fresh_store, str(directory))
+    scheduler.configure(True, 60, 2)
+    stats = scheduler.take_snapshot()
+    
+    kept = scheduler.snapshots()
+    assert len(kept) == 2
+    assert kept[0].endswith(stats["file"])
+    assert kept[1].endswith(f"20200103-000000.{extension}")
+    assert not list(directory.glob("*.tmp")) and not list(directory.glob("*.part"))
+    
+    restored = tmp_path / "restored.db"
+    restored.write_bytes(decompress(app, kept[0]))
+    conn = sqlite3.connect(restored)
+    assert conn.execute("SELECT name FROM users WHERE username = 'hana'").fetchone() == ("Hana",)
+    conn.close()
+    assert fresh_store.get_meta("auto_backup_last")["file"] == stats["file"]
+
+
+def test_first_snapshot_waits_a_full_interval(app, fresh_store, tmp_path):
+    scheduler = app["SnapshotScheduler"](fresh_store, str(tmp_path / "snaps"))
+    scheduler.configure(True, 30, 3)
+    assert scheduler.next_due() == scheduler.started + 30 * 60
+    scheduler.configure(False, 30, 3)
+    assert scheduler.next_due() is None
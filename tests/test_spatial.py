@@ -0,0 +1,52 @@
+import random
+
+import pytest
+
+
+@pytest.fixture
+def points():
+    rng = random.Random(6)
+    return {f"u{i}": (14.5 + rng.uniform(-0.1, 0.1), 121.0 + rng.uniform(-0.1, 0.1)) for i in range(800)}
+
+
+@pytest.fixture
+def grid(app, points):
+    grid = app["SpatialGrid"]()
+    for username, (lat, lng) in points.items():
+        grid.update(username, lat, lng)
+    return grid
+
+
+def test_queries_match_brute_force(app, grid, points):
+    haversine = app["haversine_m"]
+    rng = random.Random(7)
+    for _ in range(40):
+        lat, lng = 14.5 + rng.uniform(-0.12, 0.12), 121.0 + rng.uniform(-0.12, 0.12)
+        radius = rng.choice([50, 500, 3000, 50000])
+        distances = sorted((haversine(lat, lng, *p), u) for u, p in points.items())
+        assert grid.within_radius(lat, lng, radius) == [d for d in distances if d[0] <= radius]
+        assert [u for _, u in grid.nearest(lat, lng, k=7)] == [u for _, u in distances[:7]]
+        south, west = lat - 0.02, lng - 0.03
+        assert sorted(grid.within_bounds(south, west, lat, lng)) == sorted(
+            u for u, (p_lat, p_lng) in points.items() if south <= p_lat <= lat and west <= p_lng <= lng)
+
+
+def test_moves_and_removals_keep_cells_consistent(grid, points):
+    grid.update("u0", 40.0, -70.0)
+    grid.remove("u1")
+    grid.remove("missing")
+    assert [u for _, u in grid.within_radius(40.0, -70.0, 10)] == ["u0"]
+    assert "u1" not in grid.points and len(grid) == len(points) - 1
+    assert sum(len(members) for members in grid.cells.values()) == len(grid)
+    assert all(members for members in grid.cells.values())
+
+
+def test_store_keeps_the_grid_on_current_locations(fresh_store, make_user):
+    fresh_store.add_user("lee", make_user("Lee"))
+    fresh_store.add_location("lee", {"lat": 14.5, "lng": 121.0, "timestamp": "2026-01-01 10:00:00"})
+    fresh_store.add_location("lee", {"lat": 40.0, "lng": -70.0, "timestamp": "2026-01-01 09:00:00"})
+    assert fresh_store.spatial.points["lee"][:2] == (14.5, 121.0)
+    fresh_store.add_location("admin", {"lat": 14.5, "lng": 121.0, "timestamp": "2026-01-01 10:00:00"})
+    assert "admin" not in fresh_store.spatial.points
+    fresh_store.delete_user("lee")
+    assert len(fresh_store.spatial) == 0
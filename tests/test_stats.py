@@ -0,0 +1,40 @@
+import datetime
+
+
+def test_incremental_counters_match_a_rebuild(app, fresh_store, make_user):
+    store = fresh_store
+    now = datetime.datetime.now()
+    stamp = now.strftime("%Y-%m-%d %H:%M:%S")
+    for i in range(6):
+        store.add_user(f"u{i}", make_user(f"U{i}", role="responder" if i % 3 == 0 else "user"))
+    store.update_user("u1", status="suspended")
+    store.update_user("u2", status="suspended")
+    store.update_user("u2", status="active")
+    for i in range(4):
+        store.add_location(f"u{i}", {"lat": 14.0, "lng": 121.0, "timestamp": stamp, "source": "gps"})
+    store.add_location("u4", {"lat": 14.0, "lng": 121.0, "timestamp": "2020-01-01 00:00:00", "source": "gps"})
+    for i, kind in enumerate(["fire", "medical", "fire"]):
+        store.add_panic_event({"username": f"u{i}", "user_name": f"U{i}", "emergency_type": kind, "location": None,
+                               "timestamp": stamp, "ts": now.timestamp()})
+    store.delete_user("u3")
+    
+    snapshot = store.stats.snapshot()
+    assert snapshot["total_users"] == 5 and snapshot["active_users"] == 4
+    assert snapshot["users_by_role"] == {"responder": 1, "user": 4}
+    assert snapshot["recent_location_users"] == 3
+    assert snapshot["emergency_types"] == {"fire": 2, "medical": 1}
+    assert snapshot["today_emergencies"] == 3 and snapshot["users_in_emergency"] == 3
+    
+    rebuilt = app["SystemStats"]()
+    rebuilt.rebuild(store.users, store.panic_events, store.event_index.today())
+    assert rebuilt.snapshot() == snapshot
+
+
+def test_recency_buckets_age_out(app):
+    stats = app["SystemStats"]()
+    user = {"role": "user"}
+    stats.location_fix("a", user, 1_000_000)
+    stats.location_fix("b", user, 1_000_000 - 200)
+    stats.location_fix("b", user, 1_000_000 - 400)  # a new fix replaces the previous bucket
+    assert stats.recent_location_users(now=1_000_000) == 1
+    assert stats.recent_location_users(now=1_000_000 + app["RECENT_LOCATION_WINDOW"] + 20) == 0
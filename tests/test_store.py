@@ -0,0 +1,143 @@
+import sqlite3
+import sys
+import threading
+
+import pytest
+
+
+def fix(lat, lng, timestamp, source="gps"):
+    return {"lat": lat, "lng": lng, "timestamp": timestamp, "source": source}
+
+
+def test_store_persists_users_and_events(app, tmp_path, make_user):
+    path = str(tmp_path / "persist.db")
+    store = app["SafeTapStore"](path)
+    store.add_user("dana", make_user("Dana"))
+    event_id = store.add_panic_event({"username": "dana", "user_name": "Dana", "emergency_type": "fire",
+                                      "location": {"lat": 1.0, "lng": 2.0}, "timestamp": "2026-01-02 03:04:05"})
+    store.conn.close()
+    
+    reopened = app["SafeTapStore"](path)
+    assert reopened.users["dana"]["name"] == "Dana"
+    assert [e["id"] for e in reopened.panic_events] == [event_id]
+    reopened.conn.close()
+
+
+def test_users_snapshot_is_a_copy(fresh_store, make_user):
+    fresh_store.add_user("erin", make_user("Erin"))
+    snapshot = fresh_store.users_snapshot()
+    fresh_store.add_user("finn", make_user("Finn"))
+    assert "finn" not in dict(snapshot)
+    assert dict(snapshot)["erin"] is fresh_store.users["erin"]
+
+
+def test_snapshot_iteration_survives_concurrent_user_churn(fresh_store, make_user):
+    store = fresh_store
+    for i in range(3000):
+        store.add_user(f"steady{i}", make_user(f"steady{i}"))
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)  # switch threads often so a mid-iteration write is likely
+    stop = threading.Event()
+    
+    def churn():
+        i = 0
+        while not stop.is_set():
+            name = f"churn{i % 50}"
+            if name in store.users:
+                store.delete_user(name)
+            else:
+                store.add_user(name, make_user(name))
+            i += 1
+    
+    writer = threading.Thread(target=churn)
+    writer.start()
+    try:
+        for _ in range(50):
+            assert sum(1 for username, _ in store.users_snapshot() if username.startswith("steady")) == 3000
+    finally:
+        stop.set()
+        writer.join()
+        sys.setswitchinterval(interval)
+
+
+def test_out_of_order_fix_keeps_newer_current_location(app, tmp_path, make_user):
+    path = str(tmp_path / "order.db")
+    store = app["SafeTapStore"](path)
+    store.add_user("hana", make_user("Hana"))
+    assert store.add_location("hana", fix(1.0, 1.0, "2026-01-01 10:00:00"))
+    assert not store.add_location("hana", fix(2.0, 2.0, "2026-01-01 09:00:00"))
+    assert store.add_location("hana", fix(3.0, 3.0, "2026-01-01 11:00:00"))
+    
+    user = store.users["hana"]
+    assert user["current_location"]["lat"] == 3.0
+    assert [e["lat"] for e in user["location_history"]] == [3.0, 1.0]
+    row = store.conn.execute("SELECT loc_lat, loc_timestamp FROM users WHERE username = 'hana'").fetchone()
+    assert tuple(row) == (3.0, "2026-01-01 11:00:00")
+    assert store.conn.execute("SELECT COUNT(*) FROM location_history").fetchone()[0] == 3
+    store.conn.close()
+    
+    reopened = app["SafeTapStore"](path)
+    assert reopened.users["hana"]["current_location"] == user["current_location"]
+    assert list(reopened.users["hana"]["location_history"]) == list(user["location_history"])
+    reopened.conn.close()
+
+
+def test_recent_locations_newest_first_without_admins(fresh_store, make_user):
+    for i in range(12):
+        fresh_store.add_user(f"u{i}", make_user(f"U{i}"))
+        fresh_store.add_location(f"u{i}", fix(float(i), 0.0, f"2026-01-01 10:{i:02d}:00"))
+    fresh_store.add_location("admin", fix(9.0, 9.0, "2026-01-01 11:00:00"))
+    fresh_store.add_user("idle", make_user("Idle"))
+    
+    rows = fresh_store.recent_locations(10)
+    assert [row["name"] for row in rows] == [f"U{i}" for i in range(11, 1, -1)]
+    assert rows[0]["loc_timestamp"] == "2026-01-01 10:11:00"
+
+
+class FailingConnection:
+    """Wraps a sqlite3 connection and fails statements starting with ``prefix``"""
+    
+    def __init__(self, conn, prefix):
+        self._conn = conn
+        self._prefix = prefix
+    
+    def execute(self, sql, *args):
+        if sql.startswith(self._prefix):
+            raise sqlite3.OperationalError("disk I/O error")
+        return self._conn.execute(sql, *args)
+    
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def test_delete_user_rolled_back_keeps_memory_and_database_in_step(fresh_store, make_user):
+    fresh_store.add_user("gail", make_user("Gail"))
+    fresh_store.add_location("gail", fix(14.5, 121.0, "2026-01-01 00:00:00"))
+    conn = fresh_store.conn
+    fresh_store.conn = FailingConnection(conn, "DELETE FROM users")
+    try:
+        with pytest.raises(sqlite3.OperationalError):
+            fresh_store.delete_user("gail")
+    finally:
+        fresh_store.conn = conn
+    assert "gail" in fresh_store.users
+    assert conn.execute("SELECT COUNT(*) FROM users WHERE username = 'gail'").fetchone()[0] == 1
+    assert conn.execute("SELECT COUNT(*) FROM location_history WHERE username = 'gail'").fetchone()[0] == 1
+    
+    assert fresh_store.delete_user("gail")
+    assert "gail" not in fresh_store.users
+    assert conn.execute("SELECT COUNT(*) FROM users WHERE username = 'gail'").fetchone()[0] == 0
+
+
+def test_failed_location_write_leaves_memory_untouched(fresh_store, make_user):
+    fresh_store.add_user("ivan", make_user("Ivan"))
+    conn = fresh_store.conn
+    fresh_store.conn = FailingConnection(conn, "UPDATE users")
+    try:
+        with pytest.raises(sqlite3.OperationalError):
+            fresh_store.add_location("ivan", fix(1.0, 2.0, "2026-01-01 00:00:00"))
+    finally:
+        fresh_store.conn = conn
+    assert fresh_store.users["ivan"]["current_location"] is None
+    assert len(fresh_store.users["ivan"]["location_history"]) == 0
+    assert conn.execute("SELECT COUNT(*) FROM location_history").fetchone()[0] == 0
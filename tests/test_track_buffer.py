@@ -0,0 +1,50 @@
+import pytest
+
+
+@pytest.fixture
+def TrackBuffer(app):
+    return app["TrackBuffer"]
+
+
+def fill(buffer, count, start=0):
+    for i in range(start, start + count):
+        buffer.append(float(i), -float(i), 1_700_000_000 + i, "gps")
+    return buffer
+
+
+def test_newest_first_indexing_and_iteration(TrackBuffer):
+    buffer = fill(TrackBuffer(100), 5)
+    assert len(buffer) == 5
+    assert [entry["lat"] for entry in buffer] == [4.0, 3.0, 2.0, 1.0, 0.0]
+    assert [entry["lat"] for entry in reversed(buffer)] == [0.0, 1.0, 2.0, 3.0, 4.0]
+    assert buffer[0]["lng"] == -4.0 and buffer[-1]["lat"] == 0.0
+    assert [entry["lat"] for entry in buffer[1:3]] == [3.0, 2.0]
+    assert buffer[0]["source"] == "gps"
+    with pytest.raises(IndexError):
+        buffer[5]
+
+
+def test_grows_then_wraps_at_capacity(TrackBuffer):
+    buffer = fill(TrackBuffer(40), 100)
+    assert len(buffer) == 40 and len(buffer.lat) == 40
+    assert buffer[0]["lat"] == 99.0 and buffer[-1]["lat"] == 60.0
+    assert buffer.latest_epoch() == 1_700_000_099
+    lat, lng, epoch, source = buffer.columns()
+    assert list(lat) == [float(i) for i in range(60, 100)]
+    assert list(epoch) == sorted(epoch)
+
+
+def test_from_entries_round_trips_dicts(TrackBuffer):
+    entries = list(fill(TrackBuffer(10), 3))
+    rebuilt = TrackBuffer.from_entries(entries, capacity=10)
+    assert list(rebuilt) == entries
+    assert TrackBuffer.from_entries(rebuilt) is rebuilt
+
+
+def test_drop_before_keeps_newer_fixes_and_unwraps(TrackBuffer):
+    buffer = fill(TrackBuffer(16), 30)  # wrapped: holds fixes 14..29
+    assert buffer.drop_before(1_700_000_020) == 6
+    assert [entry["lat"] for entry in reversed(buffer)] == [float(i) for i in range(20, 30)]
+    fill(buffer, 2, start=30)
+    assert buffer[0]["lat"] == 31.0 and len(buffer) == 12
+    assert buffer.drop_before(1_800_000_000) == 12 and len(buffer) == 0
@@ -0,0 +1,38 @@
+import pytest
+import streamlit as st
+
+
+@pytest.fixture
+def rows(app, monkeypatch):
+    rows = {"ann": (1.0, 2.0, "Ann"), "ben": (3.0, 4.0, "Ben")}
+    monkeypatch.setitem(app["sync_tracking_map"].__globals__, "get_tracking_map_rows", lambda: dict(rows))
+    st.session_state.pop("tracking_map_client", None)
+    st.session_state.script_runs = 10
+    return rows
+
+
+def test_fragment_reruns_send_only_changed_markers(app, rows):
+    sync = app["sync_tracking_map"]
+    delta, changed = sync("base")
+    assert delta["reset"] and changed == 2
+    
+    # A fragment rerun happens within the same script run and keeps the map's markers
+    unchanged, changed = sync("base")
+    assert unchanged is delta and changed == 0
+    
+    rows["ann"] = (1.5, 2.0, "Ann")
+    del rows["ben"]
+    delta, changed = sync("base")
+    assert not delta["reset"] and changed == 2
+    assert delta["rows"] == [rows["ann"]] and delta["removed"] == ["ben"]
+    
+    st.session_state.script_runs += 1
+    assert sync("base")[1] == 0
+
+
+@pytest.mark.parametrize("runs, key", [(2, "base"), (0, "other")])
+def test_map_starts_empty_after_a_gap_or_a_new_base(app, rows, runs, key):
+    app["sync_tracking_map"]("base")
+    st.session_state.script_runs += runs
+    delta, changed = app["sync_tracking_map"](key)
+    assert delta["reset"] and changed == 2
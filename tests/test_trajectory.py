@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+
+def reference_dp(x, y, tolerance):
+    """Plain recursive Douglas-Peucker against the chord segment"""
+    keep = {0, len(x) - 1}
+    
+    def split(first, last):
+        best, best_d = None, tolerance * tolerance
+        dx, dy = x[last] - x[first], y[last] - y[first]
+        seg2 = dx * dx + dy * dy
+        for i in range(first + 1, last):
+            px, py = x[i] - x[first], y[i] - y[first]
+            t = min(max((px * dx + py * dy) / seg2, 0.0), 1.0) if seg2 else 0.0
+            d = (px - t * dx) ** 2 + (py - t * dy) ** 2
+            if d > best_d:
+                best, best_d = i, d
+        if best is not None:
+            keep.add(best)
+            split(first, best)
+            split(best, last)
+    split(0, len(x) - 1)
+    return sorted(keep)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_matches_recursive_reference(app, seed):
+    rng = np.random.default_rng(seed)
+    x, y = np.cumsum(rng.normal(size=(2, 400)), axis=1)
+    for tolerance in (0.5, 2.0, 10.0):
+        assert app["douglas_peucker"](x, y, tolerance).tolist() == reference_dp(x, y, tolerance)
+
+
+def test_degenerate_tracks(app):
+    dp = app["douglas_peucker"]
+    line = np.arange(10.0)
+    assert dp(line, line * 2, 0.1).tolist() == [0, 9]
+    assert dp(np.zeros(5), np.zeros(5), 0.1).tolist() == [0, 4]
+    assert dp(np.array([1.0, 2.0]), np.array([1.0, 2.0]), 0.1).tolist() == [0, 1]
+    # A track that doubles back keeps its turning point
+    assert dp(np.array([0.0, 10.0, 2.0]), np.zeros(3), 0.5).tolist() == [0, 1, 2]
+
+
+@pytest.fixture
+def long_track(app, fresh_store, make_user, monkeypatch):
+    """A user with three times more stored fixes than the TrackBuffer keeps"""
+    monkeypatch.setitem(app["track_levels"].__globals__, "store", fresh_store)
+    app["get_track_levels_cache"]().items.clear()
+    fresh_store.add_user("rae", make_user("Rae"))
+    capacity = fresh_store.users["rae"]["location_history"].capacity
+    rng = np.random.default_rng(9)
+    lat, lng = 14.5 + np.cumsum(rng.normal(scale=1e-4, size=(2, 3 * capacity)), axis=1)
+    fixes = [("rae", {"lat": lat[i], "lng": lng[i], "timestamp": app["epoch_to_timestamp"](1_700_000_000 + i)},
+              1_700_000_000 + i) for i in range(3 * capacity)]
+    fresh_store.add_locations(fixes)
+    return fresh_store, lat, lng
+
+
+def test_levels_cover_the_stored_history_not_just_the_buffer(app, long_track):
+    store, lat, lng = long_track
+    levels = app["track_levels"]("rae")
+    assert len(levels) == len(lat) > len(store.users["rae"]["location_history"])
+    points = levels.points(app["TRACK_MAX_ZOOM"])
+    assert points[0].tolist() == [lat[0], lng[0]] and points[-1].tolist() == [lat[-1], lng[-1]]
+
+
+def test_levels_are_nested_and_cached_until_fixes_change(app, long_track):
+    store, lat, _ = long_track
+    levels = app["track_levels"]("rae")
+    assert app["track_levels"]("rae") is levels
+    sizes = [len(level) for level in levels.levels]
+    assert sizes == sorted(sizes) and sizes[-1] < len(lat)
+    for coarse, fine in zip(levels.levels, levels.levels[1:]):
+        assert set(coarse.tolist()) <= set(fine.tolist())
+    assert levels.points(levels.fit_zoom(1200, 500)).shape[1] == 2
+    
+    # A late fix is stored but never enters the buffer; the levels still pick it up
+    store.add_location("rae", {"lat": 14.6, "lng": 121.0, "timestamp": app["epoch_to_timestamp"](1_600_000_000)})
+    rebuilt = app["track_levels"]("rae")
+    assert rebuilt is not levels and len(rebuilt) == len(lat) + 1
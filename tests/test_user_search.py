@@ -0,0 +1,45 @@
+import pytest
+
+
+@pytest.fixture
+def people(fresh_store, make_user):
+    for username, name, email, phone in [
+        ("maria", "María Santos", "maria@example.com", "+63 917 555 0101"),
+        ("mariano", "Mariano Cruz", "mcruz@example.com", "0918-555-0202"),
+        ("amari", "Amari Reyes", "amari@example.com", "(02) 8555 0303"),
+        ("jose", "José Rizal", "rizal@example.org", "0919 777 0404"),
+    ]:
+        fresh_store.add_user(username, make_user(name, email=email, phone=phone))
+    fresh_store.add_user("responder", make_user("Maria Responder", role="responder", email="r@example.com", phone="1"))
+    return fresh_store
+
+
+@pytest.mark.parametrize("fts", [True, False])
+def test_ranking_puts_exact_and_prefix_matches_first(people, fts):
+    people.user_fts = people.user_fts and fts
+    assert people.search_users("maria", role="user") == (["maria", "mariano"], 2)
+    assert people.search_users("mari", role="user") == (["maria", "mariano", "amari"], 3)
+
+
+def test_word_prefixes_accents_and_phone_digits(people):
+    assert people.search_users("jos riz")[0] == ["jose"]
+    assert people.search_users("santos")[0] == ["maria"]
+    assert people.search_users("91855502")[0] == ["mariano"]
+    assert people.search_users("555 0303")[0] == ["amari"]
+    assert people.search_users("example.org")[0] == ["jose"]
+
+
+def test_paging_roles_and_exclusions(people):
+    assert people.search_users(role="responder") == (["responder"], 1)
+    everyone, total = people.search_users(exclude=("admin",))
+    assert total == 5 and everyone == sorted(everyone)
+    first, _ = people.search_users(exclude=("admin",), limit=2)
+    rest, _ = people.search_users(exclude=("admin",), offset=2, limit=10)
+    assert first + rest == everyone
+
+
+def test_index_follows_updates_and_deletes(people):
+    people.update_user("jose", name="Pepe Rizal")
+    assert people.search_users("pepe")[0] == ["jose"]
+    people.delete_user("jose")
+    assert people.search_users("rizal") == ([], 0)